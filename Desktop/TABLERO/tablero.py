@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 from io import BytesIO
 import hashlib
 import pandas as pd
@@ -8,6 +9,10 @@ import streamlit as st
 import altair as alt
 from datetime import datetime
 
+# consumo_engine vive en la raíz del repositorio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from consumo_engine.esquemas import ErrorEsquema, renombrar
+
 # -------------------------------
 # CONFIGURACIÓN
 # -------------------------------
@@ -158,24 +163,6 @@ except Exception:
 # ======================================================
 # HELPERS
 # ======================================================
-def norm_col_name(x: str) -> str:
-    return (
-        str(x).strip().upper()
-        .replace(" ", "").replace("_", "")
-        .replace(".", "").replace("/", "")
-        .replace("-", "")
-    )
-
-def pick_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
-    if df is None or df.empty:
-        return None
-    colmap = {norm_col_name(c): c for c in df.columns}
-    for cand in candidates:
-        key = norm_col_name(cand)
-        if key in colmap:
-            return colmap[key]
-    return None
-
 def safe_df_for_display(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return df
@@ -194,85 +181,28 @@ def es_vacio_series(s: pd.Series) -> pd.Series:
 # ======================================================
 # CARGA BASE
 # ======================================================
+# Columnas resueltas con el registro compartido (consumo_engine.esquemas):
+# se buscan y renombran una vez por versión del archivo, no en cada rerun.
+OPCIONALES = ["U.Negocio", "Comp.Compra", "CompVenta", "OrdServicio"]
+
 @st.cache_data(show_spinner=False)
-def cargar_excel(path: str) -> pd.DataFrame:
-    return pd.read_excel(path)
+def cargar_liq(path: str, tamanio: int, mtime_ns: int) -> pd.DataFrame:
+    df = renombrar(pd.read_excel(path), "liq", os.path.basename(path))
+    for col in OPCIONALES:
+        if col not in df.columns:
+            df[col] = ""
+    return df
 
 try:
-    df_raw = cargar_excel(FILE_LIQ)
+    info_liq = os.stat(FILE_LIQ)
+    df = cargar_liq(FILE_LIQ, info_liq.st_size, info_liq.st_mtime_ns)
+except ErrorEsquema as e:
+    st.error(f"Esquema de {FILE_LIQ} no reconocido:\n\n```\n{e}\n```")
+    st.stop()
 except Exception as e:
     st.error(f"No se pudo cargar {FILE_LIQ}: {e}")
     st.stop()
 
-# ======================================================
-# MAPEO A NOMBRES CANÓNICOS (para soportar variaciones)
-# ======================================================
-COL_SALIDA   = pick_col(df_raw, ["Salida"])
-COL_CLIENTE  = pick_col(df_raw, ["Cliente"])
-COL_MAT      = pick_col(df_raw, ["Carga/Material", "CargaMaterial", "Carga_Material"])
-COL_FLETERO  = pick_col(df_raw, ["Fletero", "Transporte/Fletero", "Transporte / Fletero"])
-COL_REMITO   = pick_col(df_raw, ["Remito", "Remitos"])
-COL_CUMPLIDO = pick_col(df_raw, ["Cumplido"])
-COL_RENDIDO  = pick_col(df_raw, ["Rendido"])
-COL_TN       = pick_col(df_raw, ["TnFactu", "TNFACTU", "TNFACTURADA", "Cant Facturar", "Neto Salida"])
-COL_VAL      = pick_col(df_raw, ["Total Val. Clientes", "Tarifa Cliente", "TotalValClientes"])
-
-COL_UN          = pick_col(df_raw, ["U.Negocio", "UNegocio", "U_Negocio"])
-COL_COMP_COMPRA = pick_col(df_raw, ["Comp.Compra", "CompCompra", "Comp_Compra", "Comp Compra"])
-COL_COMP_VENTA  = pick_col(df_raw, ["CompVenta", "Comp.Venta", "Comp_Venta", "Comp Venta"])
-COL_ORDSERV     = pick_col(df_raw, ["OrdServicio", "OrdenServicio", "Ord_Servicio", "OS"])
-
-required = {
-    "Salida": COL_SALIDA,
-    "Cliente": COL_CLIENTE,
-    "Carga/Material": COL_MAT,
-    "Fletero": COL_FLETERO,
-    "Remito": COL_REMITO,
-    "Cumplido": COL_CUMPLIDO,
-    "Rendido": COL_RENDIDO,
-    "TnFactu": COL_TN,
-    "Total Val. Clientes": COL_VAL,
-}
-missing = [k for k, v in required.items() if v is None]
-if missing:
-    st.error("Faltan columnas requeridas en liq_comb.xlsx: " + ", ".join(missing))
-    st.stop()
-
-df = df_raw.copy()
-
-df = df.rename(columns={
-    COL_SALIDA: "Salida",
-    COL_CLIENTE: "Cliente",
-    COL_MAT: "Carga/Material",
-    COL_FLETERO: "Fletero",
-    COL_REMITO: "Remito",
-    COL_CUMPLIDO: "Cumplido",
-    COL_RENDIDO: "Rendido",
-    COL_TN: "TnFactu",
-    COL_VAL: "Total Val. Clientes",
-})
-
-# Opcionales
-if COL_UN:
-    df = df.rename(columns={COL_UN: "U.Negocio"})
-else:
-    df["U.Negocio"] = ""
-
-if COL_COMP_COMPRA:
-    df = df.rename(columns={COL_COMP_COMPRA: "Comp.Compra"})
-else:
-    df["Comp.Compra"] = ""
-
-if COL_COMP_VENTA:
-    df = df.rename(columns={COL_COMP_VENTA: "CompVenta"})
-else:
-    df["CompVenta"] = ""
-
-if COL_ORDSERV:
-    df = df.rename(columns={COL_ORDSERV: "OrdServicio"})
-else:
-    df["OrdServicio"] = ""
-
 # ======================================================
 # NORMALIZACIÓN
 # ======================================================
@@ -283,6 +213,10 @@ TEXT_COLS = ["Carga/Material", "Cliente", "U.Negocio", "Fletero", "Remito", "Cum
 for col in TEXT_COLS:
     df[col] = df[col].fillna("").astype(str).str.upper().str.strip().replace({"NAN": "", "NONE": ""})
 
+# etiquetas repetidas → category (filtros isin y groupbys sobre códigos)
+for col in ["Carga/Material", "Cliente", "U.Negocio", "Fletero"]:
+    df[col] = df[col].astype("category")
+
 # numéricos
 df["TnFactu"] = df["TnFactu"].astype(str).str.replace(",", ".", regex=False)
 df["TnFactu"] = pd.to_numeric(df["TnFactu"], errors="coerce").fillna(0)
@@ -440,7 +374,7 @@ with tab1:
 
     if not df_g.empty:
         chart_df = (
-            df_g.groupby(["Fecha_norm", "Carga/Material"])
+            df_g.groupby(["Fecha_norm", "Carga/Material"], observed=True)
             .size()
             .reset_index(name="Viajes")
         )
@@ -473,7 +407,7 @@ with tab2:
         c3.metric("Valorización", f"$ {d['Total Val. Clientes'].sum():,.0f}")
 
         tabla = (
-            d.groupby("Cliente", dropna=False)
+            d.groupby("Cliente", dropna=False, observed=True)
              .agg(
                 viajes=("Cliente", "size"),
                 toneladas=("TnFactu", "sum"),
@@ -492,7 +426,7 @@ with tab3:
     st.header("🚚 Ranking Fleteros (Toneladas)")
 
     rk = (
-        df_filtrado.groupby("Fletero", dropna=False)["TnFactu"]
+        df_filtrado.groupby("Fletero", dropna=False, observed=True)["TnFactu"]
         .sum()
         .reset_index()
         .sort_values("TnFactu", ascending=False)
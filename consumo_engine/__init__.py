@@ -0,0 +1,4 @@
+# ==========================
+# MOTOR DE CONSUMO – GRUPO BCA
+# Lógica sin Streamlit: lectura, normalización y caché de planillas.
+# ==========================
@@ -0,0 +1,399 @@
+# ==========================
+# BASE ANALÍTICA LOCAL (SQLite)
+# ==========================
+#
+# Backend opcional: transacciones de tarjeta, distancias por período y
+# nómina viven en un único archivo SQLite con índices sobre PATENTE y
+# FECHA. La agrupación (sección 4) y la unificación
+# (sección 5) del tablero corren como consultas indexadas y a pandas sólo
+# llega el recorte del período pedido: la tabla unificada y las
+# transacciones del período (con patentes ya corregidas) para el detalle
+# por carga.
+#
+# La base se sincroniza desde el historial Parquet (historial.py y
+# periodos.py) de forma incremental: lotes y períodos ya copiados no se
+# vuelven a insertar.
+
+import os
+import sqlite3
+
+import pandas as pd
+
+from consumo_engine.historial import DIR_HISTORIAL, version_historial
+from consumo_engine.patentes import (
+    RUTA_CORRECCIONES, corregir_patentes, guardar_correcciones, leer_correcciones,
+    mascara_patentes,
+)
+from consumo_engine.periodos import leer_distancias, listar_periodos
+
+RUTA_BD = os.path.join(DIR_HISTORIAL, "consumo.sqlite")
+
+# Sube si cambian las columnas de transacciones: la tabla se vuelve a
+# copiar desde el historial
+VERSION_ESQUEMA = 2
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS lotes (
+    nombre TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS transacciones (
+    clave TEXT PRIMARY KEY,
+    fecha TEXT,
+    tarjeta TEXT,
+    patente TEXT,
+    valida INTEGER,
+    litros REAL,
+    odometro REAL,
+    remito TEXT,
+    factura TEXT,
+    producto TEXT,
+    establecimiento TEXT,
+    localidad TEXT,
+    conductor TEXT,
+    documento TEXT,
+    importe REAL
+);
+CREATE INDEX IF NOT EXISTS ix_trx_patente_fecha ON transacciones (valida, patente, fecha);
+CREATE INDEX IF NOT EXISTS ix_trx_fecha ON transacciones (fecha);
+
+CREATE TABLE IF NOT EXISTS distancias (
+    periodo TEXT,
+    patente TEXT,
+    valida INTEGER,
+    km_recorridos REAL,
+    alias TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_dist_periodo_patente ON distancias (periodo, valida, patente);
+
+CREATE TABLE IF NOT EXISTS nomina (
+    patente TEXT,
+    valida INTEGER,
+    modelo TEXT,
+    litros_100km REAL
+);
+CREATE INDEX IF NOT EXISTS ix_nomina_patente ON nomina (patente);
+
+CREATE TABLE IF NOT EXISTS correcciones (
+    original TEXT PRIMARY KEY,
+    patente TEXT,
+    motivo TEXT
+);
+"""
+
+
+def conectar(ruta=RUTA_BD):
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    con = sqlite3.connect(ruta, check_same_thread=False)
+    con.executescript(ESQUEMA)
+    if _meta(con, "esquema") != str(VERSION_ESQUEMA):
+        with con:
+            con.execute("DROP TABLE transacciones")
+            con.execute("DELETE FROM lotes")
+        con.executescript(ESQUEMA)
+        with con:
+            _set_meta(con, "esquema", str(VERSION_ESQUEMA))
+    return con
+
+
+def _meta(con, clave):
+    fila = con.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+    return fila[0] if fila else None
+
+
+def _set_meta(con, clave, valor):
+    con.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, valor))
+
+
+def _valida(s):
+    return mascara_patentes(s).astype(int)
+
+
+def _fecha_iso(s):
+    return pd.to_datetime(s).dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _columna(df, col):
+    return df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+# ==========================
+# SINCRONIZACIÓN
+# ==========================
+
+def sincronizar_transacciones(con, dir_historial=DIR_HISTORIAL):
+    """Copia los lotes del historial que todavía no estén en la base."""
+    copiados = {r[0] for r in con.execute("SELECT nombre FROM lotes")}
+    pendientes = [n for n in version_historial(dir_historial) if n not in copiados]
+    if not pendientes:
+        return 0
+
+    carpeta = os.path.join(dir_historial, "transacciones")
+    df = pd.concat(
+        [pd.read_parquet(os.path.join(carpeta, n)) for n in pendientes],
+        ignore_index=True,
+    )
+    filas = pd.DataFrame({
+        "clave": df["CLAVE"],
+        "fecha": _fecha_iso(df["FECHA"]),
+        "tarjeta": df["TARJETA"],
+        "patente": df["PATENTE"],
+        "valida": _valida(df["PATENTE"]),
+        "litros": df["LITROS"],
+        "odometro": df["ODOMETRO"],
+        "remito": df["REMITO"],
+        "factura": df["FACTURA"],
+        "producto": df["PRODUCTO"],
+        "establecimiento": df["ESTABLECIMIENTO"],
+        "localidad": df["LOCALIDAD"],
+        "conductor": df["CONDUCTOR"],
+        "documento": df["NRO IDENTIFICACION CONDUCTOR"],
+        "importe": df["IMP TOT PVP ESTABLECIMIENTO"],
+    }).astype(object).where(lambda x: x.notna(), None)
+
+    with con:
+        con.executemany(
+            f"INSERT OR IGNORE INTO transacciones ({', '.join(filas.columns)}) "
+            f"VALUES ({', '.join('?' * len(filas.columns))})",
+            filas.itertuples(index=False, name=None),
+        )
+        con.executemany("INSERT INTO lotes (nombre) VALUES (?)", [(n,) for n in pendientes])
+    return len(filas)
+
+
+def sincronizar_distancias(con, dir_historial=DIR_HISTORIAL):
+    """Reemplaza los períodos cuyo hash de exportación cambió."""
+    actualizados = 0
+    for r in listar_periodos(dir_historial).itertuples():
+        if _meta(con, f"distancias:{r.CLAVE}") == r.HASH:
+            continue
+        df = leer_distancias(r.CLAVE, dir_historial)
+        with con:
+            con.execute("DELETE FROM distancias WHERE periodo = ?", (r.CLAVE,))
+            con.executemany(
+                "INSERT INTO distancias (periodo, patente, valida, km_recorridos, alias) "
+                "VALUES (?, ?, ?, ?, ?)",
+                zip(
+                    [r.CLAVE] * len(df),
+                    df["PATENTE"],
+                    _valida(df["PATENTE"]),
+                    df["KM_RECORRIDOS"].astype(object).where(df["KM_RECORRIDOS"].notna(), None),
+                    _columna(df, "Alias").astype(object).where(_columna(df, "Alias").notna(), None),
+                ),
+            )
+            _set_meta(con, f"distancias:{r.CLAVE}", r.HASH)
+        actualizados += 1
+    return actualizados
+
+
+def sincronizar_nomina(con, df_nom, hash_contenido):
+    if _meta(con, "nomina") == hash_contenido:
+        return False
+    modelo = _columna(df_nom, "MODELO")
+    with con:
+        con.execute("DELETE FROM nomina")
+        con.executemany(
+            "INSERT INTO nomina (patente, valida, modelo, litros_100km) VALUES (?, ?, ?, ?)",
+            zip(
+                df_nom["PATENTE"],
+                _valida(df_nom["PATENTE"]),
+                modelo.astype(object).where(modelo.notna(), None),
+                df_nom["LITROS_100KM"].astype(object).where(df_nom["LITROS_100KM"].notna(), None),
+            ),
+        )
+        _set_meta(con, "nomina", hash_contenido)
+    return True
+
+
+def sincronizar_correcciones(con, ruta=RUTA_CORRECCIONES):
+    """
+    Rehace la tabla `correcciones` (original → patente, motivo) para las
+    patentes inválidas guardadas, con el mismo criterio que
+    patentes.canonicalizar: la nómina sólo por formato, consumo y distancias
+    además contra las patentes de la nómina. Las nuevas se suman al
+    diccionario persistente de `ruta`.
+    """
+    guardadas = leer_correcciones(ruta)
+    nomina = pd.read_sql_query("SELECT patente, valida FROM nomina", con)
+    corr_nom = corregir_patentes(nomina.loc[nomina["valida"] == 0, "patente"], (), guardadas)
+    conocidas = list(nomina.loc[nomina["valida"] == 1, "patente"])
+    conocidas += [v[0] for v in corr_nom.values()]
+
+    crudas = pd.read_sql_query(
+        "SELECT patente FROM transacciones WHERE valida = 0 "
+        "UNION SELECT patente FROM distancias WHERE valida = 0",
+        con,
+    )["patente"]
+    correcciones = {**corregir_patentes(crudas, conocidas, guardadas), **corr_nom}
+    nuevas = {k: v for k, v in correcciones.items() if k not in guardadas}
+    if nuevas:
+        guardar_correcciones({**guardadas, **nuevas}, ruta)
+    with con:
+        con.execute("DELETE FROM correcciones")
+        con.executemany(
+            "INSERT INTO correcciones (original, patente, motivo) VALUES (?, ?, ?)",
+            [(k, *v) for k, v in correcciones.items()],
+        )
+    return len(correcciones)
+
+
+# ==========================
+# CONSULTAS
+# ==========================
+
+# Las patentes inválidas con corrección (tabla correcciones) se suman con
+# su patente corregida; la rama válida sigue usando el índice por valida.
+SQL_UNIFICADO = """
+WITH litros AS (
+    SELECT patente, SUM(litros) AS litros_totales, SUM(importe) AS importe_total
+    FROM (
+        SELECT patente, litros, importe
+        FROM transacciones
+        WHERE valida = 1 AND fecha >= :desde AND (:hasta IS NULL OR fecha < :hasta)
+        UNION ALL
+        SELECT c.patente, t.litros, t.importe
+        FROM correcciones c
+        JOIN transacciones t ON t.valida = 0 AND t.patente = c.original
+        WHERE t.fecha >= :desde AND (:hasta IS NULL OR t.fecha < :hasta)
+    )
+    GROUP BY patente
+),
+km AS (
+    -- alias "suelto" junto a MAX(): SQLite lo toma de la fila con más km
+    SELECT patente, SUM(km_recorridos) AS km_recorridos, alias, MAX(km_recorridos)
+    FROM (
+        SELECT patente, km_recorridos, alias
+        FROM distancias
+        WHERE periodo = :periodo AND valida = 1
+        UNION ALL
+        SELECT c.patente, d.km_recorridos, d.alias
+        FROM correcciones c
+        JOIN distancias d ON d.periodo = :periodo AND d.valida = 0 AND d.patente = c.original
+    )
+    GROUP BY patente
+),
+nom AS (
+    SELECT COALESCE(c.patente, n.patente) AS patente, n.modelo, n.litros_100km
+    FROM nomina n
+    LEFT JOIN correcciones c ON c.original = n.patente
+    WHERE n.valida = 1 OR c.patente IS NOT NULL
+),
+claves AS (
+    SELECT patente FROM km UNION SELECT patente FROM litros
+)
+SELECT
+    c.patente                         AS PATENTE,
+    COALESCE(k.km_recorridos, 0)      AS KM_RECORRIDOS,
+    COALESCE(l.litros_totales, 0)     AS LITROS_TOTALES,
+    COALESCE(l.importe_total, 0)      AS IMPORTE_TOTAL,
+    n.litros_100km                    AS LITROS_100KM,
+    n.modelo                          AS MODELO,
+    k.alias                           AS ALIAS
+FROM claves c
+LEFT JOIN km k ON k.patente = c.patente
+LEFT JOIN litros l ON l.patente = c.patente
+LEFT JOIN nom n ON n.patente = c.patente
+ORDER BY c.patente
+"""
+
+SQL_CORREGIDAS = """
+SELECT 'consumo' AS TABLA, c.original AS ORIGINAL, c.patente AS CORREGIDA,
+       c.motivo AS MOTIVO, COUNT(*) AS FILAS
+FROM correcciones c
+JOIN transacciones t ON t.valida = 0 AND t.patente = c.original
+WHERE t.fecha >= :desde AND (:hasta IS NULL OR t.fecha < :hasta)
+GROUP BY c.original
+UNION ALL
+SELECT 'km', c.original, c.patente, c.motivo, COUNT(*)
+FROM correcciones c
+JOIN distancias d ON d.periodo = :periodo AND d.valida = 0 AND d.patente = c.original
+GROUP BY c.original
+UNION ALL
+SELECT 'nomina', c.original, c.patente, c.motivo, COUNT(*)
+FROM correcciones c
+JOIN nomina n ON n.valida = 0 AND n.patente = c.original
+GROUP BY c.original
+"""
+
+
+# Transacciones del período con las columnas de calculo.COLS_CONSUMO, en el
+# orden en que se guardaron (el mismo del historial Parquet)
+SQL_TRANSACCIONES = """
+SELECT
+    COALESCE(c.patente, t.patente)    AS PATENTE,
+    t.litros                          AS LITROS,
+    t.fecha                           AS FECHA,
+    t.odometro                        AS ODOMETRO,
+    t.importe                         AS "IMP TOT PVP ESTABLECIMIENTO",
+    t.conductor                       AS CONDUCTOR,
+    t.documento                       AS "NRO IDENTIFICACION CONDUCTOR",
+    t.tarjeta                         AS TARJETA,
+    t.producto                        AS PRODUCTO,
+    t.establecimiento                 AS ESTABLECIMIENTO,
+    t.localidad                       AS LOCALIDAD
+FROM transacciones t
+LEFT JOIN correcciones c ON t.valida = 0 AND c.original = t.patente
+WHERE t.fecha >= :desde AND (:hasta IS NULL OR t.fecha < :hasta)
+  AND (t.valida = 1 OR c.patente IS NOT NULL)
+ORDER BY t.rowid
+"""
+
+
+def _limites(desde, hasta):
+    desde = pd.Timestamp(desde).strftime("%Y-%m-%d 00:00:00")
+    if hasta is None or pd.isna(hasta):
+        return desde, None
+    return desde, (pd.Timestamp(hasta) + pd.Timedelta(days=1)).strftime("%Y-%m-%d 00:00:00")
+
+
+def consultar_unificado(con, periodo, desde, hasta=None):
+    """Secciones 4 y 5 del tablero para un período, resueltas en SQL."""
+    desde, hasta = _limites(desde, hasta)
+    df = pd.read_sql_query(
+        SQL_UNIFICADO, con, params={"periodo": periodo, "desde": desde, "hasta": hasta}
+    )
+    for c in ["KM_RECORRIDOS", "LITROS_TOTALES", "IMPORTE_TOTAL", "LITROS_100KM"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return df
+
+
+def consultar_transacciones(con, desde, hasta=None):
+    """
+    Cargas válidas (o corregidas) entre `desde` y `hasta`, como las deja
+    calculo.normalizar: el insumo del detalle por carga.
+    """
+    desde, hasta = _limites(desde, hasta)
+    df = pd.read_sql_query(SQL_TRANSACCIONES, con, params={"desde": desde, "hasta": hasta})
+    df["FECHA"] = pd.to_datetime(df["FECHA"])
+    for c in ["LITROS", "ODOMETRO", "IMP TOT PVP ESTABLECIMIENTO"]:
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return df
+
+
+def consultar_invalidas(con, periodo, desde, hasta=None):
+    """Filas descartadas por patente inválida (sin corrección) y el reporte de corregidas."""
+    desde, hasta = _limites(desde, hasta)
+    sin_corregir = "patente NOT IN (SELECT original FROM correcciones)"
+    return {
+        "consumo": pd.read_sql_query(
+            "SELECT patente AS PATENTE, litros AS LITROS, fecha AS FECHA FROM transacciones "
+            f"WHERE valida = 0 AND {sin_corregir} AND fecha >= ? AND (? IS NULL OR fecha < ?)",
+            con, params=(desde, hasta, hasta),
+        ),
+        "km": pd.read_sql_query(
+            "SELECT patente AS PATENTE, km_recorridos AS KM_RECORRIDOS FROM distancias "
+            f"WHERE valida = 0 AND {sin_corregir} AND periodo = ?",
+            con, params=(periodo,),
+        ),
+        "nomina": pd.read_sql_query(
+            "SELECT patente AS PATENTE, modelo AS MODELO, litros_100km AS LITROS_100KM "
+            f"FROM nomina WHERE valida = 0 AND {sin_corregir}",
+            con,
+        ),
+        "corregidas": pd.read_sql_query(
+            SQL_CORREGIDAS, con, params={"periodo": periodo, "desde": desde, "hasta": hasta}
+        ),
+    }
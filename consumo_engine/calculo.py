@@ -0,0 +1,622 @@
+# ==========================
+# MOTOR DE CÁLCULO (SIN STREAMLIT)
+# ==========================
+#
+# Secciones 2 a 7 del tablero como funciones puras que devuelven DataFrames,
+# una por etapa:
+#
+#   cargar → cargar_periodo → normalizar → agrupar → unir
+#          → calcular_metricas → clasificar → tabla_salida
+#
+# procesar_periodo las encadena y cerrar_periodo suma el detalle por carga
+# (tramos de odómetro, odometro.py; atribución por chofer, choferes.py) y
+# las líneas de base de la propia unidad (lineas_base.py). Las etapas no
+# escriben: procesar_periodo (o el vigilante) guarda al final las
+# correcciones de patentes y los totales del período (guardar_periodo).
+# Los períodos se procesan del más viejo al más nuevo: cada uno usa los
+# anteriores ya guardados como referencia. Las usa el vigilante (snapshots); el tablero y
+# el PDF sólo consumen el resultado. Se pueden correr en lote o perfilar sin
+# navegador:
+#
+#   python -m consumo_engine.calculo [carpeta]
+
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from consumo_engine.choferes import COL_DOCUMENTO, atribuir_choferes, ranking_choferes
+from consumo_engine.frecuencia import anomalias_frecuencia
+from consumo_engine.historial import (
+    COLUMNAS_EXPORTACION, DIR_HISTORIAL, historial_de, ingerir_archivo, leer_agregados,
+    leer_transacciones,
+)
+from consumo_engine.ingesta import hash_archivo, leer_tabla, preparar_sidecars
+from consumo_engine.lineas_base import (
+    VENTANAS, agregado_periodo, linea_base_periodo, registrar_agregado,
+)
+from consumo_engine.odometro import (
+    COLUMNAS_TRAMOS, conciliar_km, resumen_odometro, tramos_odometro,
+)
+from consumo_engine.patentes import (
+    RUTA_CORRECCIONES, canonicalizar, leer_correcciones, mascara_patentes,
+    registrar_correcciones,
+)
+from consumo_engine.periodos import (
+    PATRON_ARCHIVO, filtrar_periodo, leer_distancias, periodo_desde_nombre,
+    registrar_distancias,
+)
+from consumo_engine.tanques import capacidad_por_patente, eventos_sobrecarga, plantilla_tanques
+from consumo_engine.tipos import ESTADOS, FLOAT32, TIPO_ESTADO, compactar
+
+FILE_CONSUMO = "consumo_real.xlsx"
+FILE_NOMINA = "Nomina_consumo_camion.xlsx"
+FILE_TANQUES = "capacidad_tanques.xlsx"  # capacidad por MODELO, junto a la nómina
+
+TOLERANCIA_PCT = 0.10
+# Consumo real por debajo de (1 - UMBRAL_DUDOSO) × teórico: DUDOSO
+UMBRAL_DUDOSO = 0.15
+
+# Modo estadístico: |Z_ROBUSTO| desde el que una unidad es atípica dentro de
+# su modelo (Iglewicz-Hoaglin) y unidades mínimas por modelo para puntuar
+UMBRAL_Z = 3.5
+MIN_UNIDADES_MODELO = 3
+
+# Importe de cada carga que valoriza los litros (el que guarda también la
+# base SQLite)
+COLUMNA_IMPORTE = "IMP TOT PVP ESTABLECIMIENTO"
+
+COLS_CONSUMO = [
+    "PATENTE", "LITROS", "FECHA", "ODOMETRO", COLUMNA_IMPORTE, "CONDUCTOR", COL_DOCUMENTO,
+    "TARJETA", "PRODUCTO", "ESTABLECIMIENTO", "LOCALIDAD",
+]
+COLS_KM = ["PATENTE", "KM_RECORRIDOS", "Alias"]
+# Insumos de clasificar_estados: no se pasan a float32 en df_final
+COLS_CLASIFICACION = [
+    "KM_RECORRIDOS", "LITROS_TOTALES", "LITROS_100KM",
+    "CONSUMO_REAL_L_100KM", "CONSUMO_TEORICO_L_100KM",
+]
+COLS_SALIDA = [
+    "PATENTE",
+    "MODELO",
+    "KM_RECORRIDOS",
+    "CONFIANZA_KM",
+    "LITROS_TOTALES",
+    "IMPORTE_TOTAL",
+    "CONSUMO_REAL_L_100KM",
+    "CONSUMO_TEORICO_L_100KM",
+    "LITROS_TEOREICOS_ESPERADOS",
+    "DESVIO_LITROS",
+    "DESVIO_PCT",
+    "DESVIO_PESOS",
+    "DESVIO_4S_PCT",
+    "DESVIO_12S_PCT",
+    "Z_ROBUSTO",
+    "PERCENTIL_MODELO",
+    "ESTADO",
+    "COLOR",
+]
+COLOR_ESTADO = {
+    "NORMAL": "🟢",
+    "A AUDITAR": "🔴",
+    "DUDOSO": "🔵",
+    "SIN MOVIMIENTO": "⚪",
+    "FALTA CARGA": "🟣",
+    "ERROR DE KM": "⚠️",
+    "SIN DATOS": "🟡",
+}
+
+
+def ruta_correcciones(dir_historial=DIR_HISTORIAL):
+    return os.path.join(dir_historial, os.path.basename(RUTA_CORRECCIONES))
+
+
+# ==========================
+# 2) CARGA
+# ==========================
+
+def cargar(carpeta=".", dir_historial=None, transacciones=True):
+    """
+    Ingiere las exportaciones de `carpeta` en su historial (historial_de,
+    salvo otro `dir_historial`). Devuelve los insumos comunes a
+    todos los períodos: {"consumo", "nomina", "tanques", "periodos",
+    "hashes", "tiempos", "segundos", "avisos"}; "periodos" es el registro de
+    registrar_distancias, "tanques" la tabla de capacidades (o None) y
+    "avisos" los textos de las degradaciones para mostrar en el tablero.
+
+    Con transacciones=False (backend SQLite, que lee cada período de la
+    base) el historial sólo se ingiere y "consumo" queda en None, salvo que
+    haya que caer a la exportación.
+    """
+    dir_historial = dir_historial or historial_de(carpeta)
+    ruta_consumo = os.path.join(carpeta, FILE_CONSUMO)
+    ruta_nomina = os.path.join(carpeta, FILE_NOMINA)
+    rutas = [ruta_consumo, ruta_nomina] + sorted(glob.glob(os.path.join(carpeta, PATRON_ARCHIVO)))
+
+    hashes = {r: hash_archivo(r) for r in rutas if os.path.exists(r)}
+    # Consumo: la misma lectura proyectada que hace la ingesta al historial
+    tareas = [(r, "consumo", h, COLUMNAS_EXPORTACION) for r, h in hashes.items() if r == ruta_consumo]
+    tareas += [
+        (r, "km", h, None) for r, h in hashes.items() if os.path.basename(r).startswith("distances_")
+    ]
+    tareas += [(r, "nomina", h, None) for r, h in hashes.items() if r == ruta_nomina]
+    tiempos, segundos = preparar_sidecars(tareas)
+
+    df_nom = leer_tabla(ruta_nomina, "nomina", hashes[ruta_nomina])
+
+    # Sin planilla de capacidades no hay control de tanques; la plantilla se
+    # crea sólo a pedido (--plantilla-tanques), no dentro del cálculo
+    ruta_tanques = os.path.join(carpeta, FILE_TANQUES)
+    df_tanques = None
+    if os.path.exists(ruta_tanques):
+        hashes[ruta_tanques] = hash_archivo(ruta_tanques)
+        df_tanques = leer_tabla(ruta_tanques, "tanques", hashes[ruta_tanques])
+
+    avisos = []
+    try:
+        ingerir_archivo(ruta_consumo, dir_historial, hash_contenido=hashes[ruta_consumo])
+        df_cons = (
+            compactar(leer_transacciones(dir_historial, columnas=COLS_CONSUMO))
+            if transacciones else None
+        )
+    except (OSError, pa.ArrowInvalid) as e:
+        # Historial ilegible o sin permisos: se usa la exportación tal cual,
+        # sin las cargas de exportaciones anteriores, y queda avisado
+        avisos.append(
+            f"Historial de transacciones no disponible ({type(e).__name__}: {e}). "
+            f"Se calculó sólo con {FILE_CONSUMO}, sin las cargas de exportaciones anteriores."
+        )
+        df_cons = leer_tabla(
+            ruta_consumo, "consumo", hashes[ruta_consumo],
+            columnas=COLUMNAS_EXPORTACION, streaming=True,
+        )[COLS_CONSUMO]
+
+    # Rango de FECHA del consumo: completa el año de los distances_*.xlsx
+    # que no lo traen en el nombre
+    if df_cons is not None:
+        fechas = (df_cons["FECHA"].min(), df_cons["FECHA"].max())
+    else:
+        agregados = leer_agregados(dir_historial)
+        fechas = (agregados["FECHA_MIN"].min(), agregados["FECHA_MAX"].max())
+    for ruta in rutas[2:]:
+        if periodo_desde_nombre(ruta, fechas) is None:
+            avisos.append(
+                f"{os.path.basename(ruta)}: no se pudo deducir el período del nombre "
+                "(dd_mm_dd_mm, con año si no hay cargas de consumo); no se registró."
+            )
+
+    return {
+        "consumo": df_cons,
+        "nomina": df_nom,
+        "tanques": df_tanques,
+        "periodos": registrar_distancias(carpeta, dir_historial, fechas),
+        "hashes": hashes,
+        "tiempos": tiempos,
+        "segundos": segundos,
+        "avisos": avisos,
+    }
+
+
+def cargar_periodo(insumos, periodo, dir_historial=DIR_HISTORIAL):
+    """(df_cons, df_km, df_nom) de un período (fila del registro de períodos)."""
+    df_cons = filtrar_periodo(insumos["consumo"], periodo.INICIO, periodo.HASTA_CONSUMO)
+    # Alias es opcional en la exportación GPS: si no vino, queda vacío
+    df_km = leer_distancias(periodo.CLAVE, dir_historial).reindex(columns=COLS_KM)
+    return df_cons, df_km, insumos["nomina"]
+
+
+# ==========================
+# 3) LIMPIEZA Y VALIDACIÓN
+# ==========================
+
+def normalizar(df_cons, df_km, df_nom, correcciones=None):
+    """
+    Canonicaliza las patentes y separa las inválidas. `correcciones` es el
+    diccionario ya guardado (patentes.leer_correcciones); no se escribe
+    nada. Devuelve (df_cons, df_km, df_nom, invalidas) con sólo filas
+    válidas; `invalidas` trae las descartadas por tabla y el reporte de
+    corregidas ("corregidas"), que es lo que hay que registrar.
+    """
+    # La nómina sólo se limpia de formato y sirve de referencia para O/0 e I/1
+    pat_nom, rep_nom = canonicalizar(df_nom["PATENTE"], guardadas=correcciones, tabla="nomina")
+    df_nom = df_nom.assign(PATENTE=pat_nom)
+    conocidas = df_nom["PATENTE"][mascara_patentes(df_nom["PATENTE"])].unique()
+    pat_cons, rep_cons = canonicalizar(df_cons["PATENTE"], conocidas, correcciones, "consumo")
+    df_cons = df_cons.assign(PATENTE=pat_cons)
+    pat_km, rep_km = canonicalizar(df_km["PATENTE"], conocidas, correcciones, "km")
+    df_km = df_km.assign(PATENTE=pat_km)
+    corregidas = pd.concat([rep_cons, rep_km, rep_nom], ignore_index=True)
+
+    # Una máscara por tabla, reutilizada para separar válidas e inválidas
+    ok_cons = mascara_patentes(df_cons["PATENTE"])
+    ok_km = mascara_patentes(df_km["PATENTE"])
+    ok_nom = mascara_patentes(df_nom["PATENTE"])
+
+    invalidas = {
+        "consumo": df_cons[~ok_cons],
+        "km": df_km[~ok_km],
+        "nomina": df_nom[~ok_nom],
+        "corregidas": corregidas,
+    }
+    return df_cons[ok_cons], df_km[ok_km], df_nom[ok_nom], invalidas
+
+
+# ==========================
+# 4) AGRUPACIÓN
+# ==========================
+
+def agrupar(df_cons, df_km):
+    """
+    (df_litros_total, df_km_total): LITROS_TOTALES e IMPORTE_TOTAL (en la
+    misma pasada) y KM_RECORRIDOS y ALIAS (chofer asignado en el GPS) por
+    PATENTE.
+    """
+    if COLUMNA_IMPORTE not in df_cons.columns:
+        df_cons = df_cons.assign(**{COLUMNA_IMPORTE: np.nan})
+    df_litros_total = (
+        df_cons.groupby("PATENTE", as_index=False, observed=True)[["LITROS", COLUMNA_IMPORTE]]
+        .sum()
+        .rename(columns={"LITROS": "LITROS_TOTALES", COLUMNA_IMPORTE: "IMPORTE_TOTAL"})
+    )
+    if "Alias" not in df_km.columns:
+        df_km = df_km.assign(Alias=pd.NA)
+    df_km_total = df_km.groupby("PATENTE", as_index=False, observed=True)["KM_RECORRIDOS"].sum()
+    # Patente con varias filas GPS: el Alias del equipo que más recorrió
+    alias = (
+        df_km.sort_values("KM_RECORRIDOS", ascending=False, kind="stable")
+        .drop_duplicates("PATENTE")[["PATENTE", "Alias"]]
+        .rename(columns={"Alias": "ALIAS"})
+    )
+    df_km_total = df_km_total.merge(alias, on="PATENTE", how="left")
+    return df_litros_total, df_km_total
+
+
+# ==========================
+# 5) UNIFICACIÓN
+# ==========================
+
+def unir(df_litros_total, df_km_total, df_nom):
+    """df_final: una fila por PATENTE con km, litros y consumo de la nómina."""
+    cols_nom = ["PATENTE", "LITROS_100KM"]
+    if "MODELO" in df_nom.columns:
+        cols_nom.append("MODELO")
+
+    df_final = pd.merge(df_km_total, df_litros_total, on="PATENTE", how="outer")
+    df_final = pd.merge(df_final, df_nom[cols_nom], on="PATENTE", how="left")
+
+    df_final["KM_RECORRIDOS"] = df_final["KM_RECORRIDOS"].fillna(0)
+    df_final["LITROS_TOTALES"] = df_final["LITROS_TOTALES"].fillna(0)
+    df_final["IMPORTE_TOTAL"] = df_final["IMPORTE_TOTAL"].fillna(0)
+    return df_final
+
+
+def unificar(df_cons, df_km, df_nom, correcciones=None):
+    """Secciones 3 a 5: (df_final, invalidas)."""
+    df_cons, df_km, df_nom, invalidas = normalizar(df_cons, df_km, df_nom, correcciones)
+    return unir(*agrupar(df_cons, df_km), df_nom), invalidas
+
+
+# ==========================
+# 6) CÁLCULOS
+# ==========================
+
+def calcular_metricas(df_final, tolerancia=TOLERANCIA_PCT):
+    """Copia de df_final con consumo real/teórico, desvíos y la banda MIN_OK/MAX_OK."""
+    df = df_final.copy()
+    df["CONSUMO_REAL_L_100KM"] = np.where(
+        df["KM_RECORRIDOS"] > 0,
+        (df["LITROS_TOTALES"] / df["KM_RECORRIDOS"]) * 100,
+        np.nan,
+    )
+
+    df["CONSUMO_TEORICO_L_100KM"] = df["LITROS_100KM"]
+    df["LITROS_TEOREICOS_ESPERADOS"] = (
+        df["KM_RECORRIDOS"] * df["CONSUMO_TEORICO_L_100KM"] / 100
+    )
+
+    df["DESVIO_LITROS"] = df["LITROS_TOTALES"] - df["LITROS_TEOREICOS_ESPERADOS"]
+    df["DESVIO_PCT"] = np.where(
+        df["LITROS_TEOREICOS_ESPERADOS"] > 0,
+        df["DESVIO_LITROS"] / df["LITROS_TEOREICOS_ESPERADOS"],
+        np.nan,
+    )
+
+    # Desvío valorizado al precio promedio que pagó la propia unidad
+    df["PRECIO_PROMEDIO"] = np.where(
+        (df["LITROS_TOTALES"] > 0) & (df["IMPORTE_TOTAL"] > 0),
+        df["IMPORTE_TOTAL"] / df["LITROS_TOTALES"],
+        np.nan,
+    )
+    df["DESVIO_PESOS"] = df["DESVIO_LITROS"] * df["PRECIO_PROMEDIO"]
+
+    # Desvío contra el consumo reciente de la propia unidad (si hay historia)
+    for v in VENTANAS:
+        base = df.get(f"CONSUMO_{v}_L_100KM", pd.Series(np.nan, index=df.index))
+        df[f"DESVIO_{v}_PCT"] = np.where(
+            base > 0, df["CONSUMO_REAL_L_100KM"] / base - 1, np.nan
+        )
+
+    df["MIN_OK"] = df["CONSUMO_TEORICO_L_100KM"] * (1 - tolerancia)
+    df["MAX_OK"] = df["CONSUMO_TEORICO_L_100KM"] * (1 + tolerancia)
+    return puntuar_por_modelo(df)
+
+
+def puntuar_por_modelo(df):
+    """
+    Agrega a `df` MEDIANA_MODELO_L_100KM, Z_ROBUSTO (0.6745 · desvío / MAD)
+    y PERCENTIL_MODELO del consumo real de cada unidad dentro de su MODELO.
+    Sin consumo (> 0), con MAD nula o en modelos con menos de
+    MIN_UNIDADES_MODELO unidades queda NaN.
+    """
+    consumo = df["CONSUMO_REAL_L_100KM"].where(df["CONSUMO_REAL_L_100KM"] > 0)
+    por_modelo = consumo.groupby(df["MODELO"], observed=True)
+    mediana = por_modelo.transform("median")
+    mad = (consumo - mediana).abs().groupby(df["MODELO"], observed=True).transform("median")
+    suficientes = por_modelo.transform("count") >= MIN_UNIDADES_MODELO
+
+    df["MEDIANA_MODELO_L_100KM"] = mediana
+    df["Z_ROBUSTO"] = (0.6745 * (consumo - mediana) / mad).where(suficientes & (mad > 0))
+    df["PERCENTIL_MODELO"] = por_modelo.rank(pct=True).where(suficientes)
+    return df
+
+
+# ==========================
+# 7) ESTADOS
+# ==========================
+
+def clasificar_estado(row):
+    """Estado de una unidad; referencia fila a fila de clasificar_estados."""
+    km = row["KM_RECORRIDOS"]
+    litros = row["LITROS_TOTALES"]
+    cons_real = row["CONSUMO_REAL_L_100KM"]
+    cons_teor = row["CONSUMO_TEORICO_L_100KM"]
+    min_ok = row["MIN_OK"]
+    max_ok = row["MAX_OK"]
+
+    if km == 0 and litros == 0:
+        return "SIN MOVIMIENTO"
+    if km > 0 and litros == 0:
+        return "FALTA CARGA"
+    if km == 0 and litros > 0:
+        return "ERROR DE KM"
+    if pd.isna(cons_real) or pd.isna(cons_teor):
+        return "SIN DATOS"
+
+    limite_mejor_15 = cons_teor * (1 - UMBRAL_DUDOSO)
+    if cons_real < limite_mejor_15:
+        return "DUDOSO"
+
+    if min_ok <= cons_real <= max_ok:
+        return "NORMAL"
+
+    if limite_mejor_15 <= cons_real < min_ok:
+        return "NORMAL"
+
+    if cons_real > max_ok:
+        return "A AUDITAR"
+
+    return "SIN DATOS"
+
+
+def codigos_estado(km, litros, cons_real, cons_teor, min_ok, max_ok, limite_dudoso):
+    """
+    Reglas de clasificar_estado sobre arrays NumPy, en el mismo orden (np.select
+    se queda con la primera que se cumple). Los argumentos se difunden entre
+    sí (broadcasting), así que sirve para una columna o para una grilla de
+    umbrales. Devuelve los códigos de ESTADOS (int8).
+    """
+    reglas = [
+        ((km == 0) & (litros == 0), "SIN MOVIMIENTO"),
+        ((km > 0) & (litros == 0), "FALTA CARGA"),
+        ((km == 0) & (litros > 0), "ERROR DE KM"),
+        (np.isnan(cons_real) | np.isnan(cons_teor), "SIN DATOS"),
+        (cons_real < limite_dudoso, "DUDOSO"),
+        ((min_ok <= cons_real) & (cons_real <= max_ok), "NORMAL"),
+        ((limite_dudoso <= cons_real) & (cons_real < min_ok), "NORMAL"),
+        (cons_real > max_ok, "A AUDITAR"),
+    ]
+    return np.select(
+        [m for m, _ in reglas],
+        [ESTADOS.index(e) for _, e in reglas],
+        default=ESTADOS.index("SIN DATOS"),
+    ).astype("int8")
+
+
+def clasificar_estados(df):
+    """
+    Versión vectorizada de clasificar_estado, como máscaras de columna.
+    Devuelve ESTADO como category con las categorías de ESTADOS.
+    """
+    cons_teor = df["CONSUMO_TEORICO_L_100KM"].to_numpy(dtype="float64")
+    codigos = codigos_estado(
+        df["KM_RECORRIDOS"].to_numpy(dtype="float64"),
+        df["LITROS_TOTALES"].to_numpy(dtype="float64"),
+        df["CONSUMO_REAL_L_100KM"].to_numpy(dtype="float64"),
+        cons_teor,
+        df["MIN_OK"].to_numpy(dtype="float64"),
+        df["MAX_OK"].to_numpy(dtype="float64"),
+        cons_teor * (1 - UMBRAL_DUDOSO),
+    )
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, dtype=TIPO_ESTADO),
+        index=df.index,
+    )
+
+
+def barrido_tolerancias(df, tolerancias, umbrales_dudoso):
+    """
+    Cantidad de unidades por ESTADO para cada combinación de tolerancia y
+    umbral DUDOSO, en una sola pasada difundida unidades × tolerancias ×
+    umbrales (sin recalcular el pipeline). `df` necesita COLS_CLASIFICACION
+    en float64, como quedan en df_final: en salida los consumos son float32
+    y las unidades justo en un borde cambian de estado. Devuelve ESTADO,
+    TOLERANCIA_PCT, UMBRAL_DUDOSO y UNIDADES.
+    """
+    def columna(c):
+        return df[c].to_numpy(dtype="float64")[:, None, None]
+
+    tol = np.asarray(tolerancias, dtype="float64")[None, :, None]
+    dudoso = np.asarray(umbrales_dudoso, dtype="float64")[None, None, :]
+    cons_teor = columna("CONSUMO_TEORICO_L_100KM")
+    codigos = codigos_estado(
+        columna("KM_RECORRIDOS"),
+        columna("LITROS_TOTALES"),
+        columna("CONSUMO_REAL_L_100KM"),
+        cons_teor,
+        cons_teor * (1 - tol),
+        cons_teor * (1 + tol),
+        cons_teor * (1 - dudoso),
+    )
+    codigos = np.broadcast_to(codigos, (len(df), tol.size, dudoso.size))
+    conteos = np.stack([(codigos == i).sum(axis=0) for i in range(len(ESTADOS))])
+
+    indice = pd.MultiIndex.from_product(
+        [ESTADOS, tol.ravel(), dudoso.ravel()],
+        names=["ESTADO", "TOLERANCIA_PCT", "UMBRAL_DUDOSO"],
+    )
+    return pd.Series(conteos.ravel(), index=indice, name="UNIDADES").reset_index()
+
+
+def clasificar(df_final):
+    """
+    df_final con ESTADO y COLOR, compactado (category / int8 / float32).
+    Las columnas de las que sale ESTADO (COLS_CLASIFICACION) quedan en
+    float64: barrido_tolerancias reclasifica desde ahí con los mismos
+    valores.
+    """
+    df = df_final.assign(ESTADO=clasificar_estados(df_final))
+    df["COLOR"] = df["ESTADO"].map(COLOR_ESTADO)
+    return compactar(df, float32=[c for c in FLOAT32 if c not in COLS_CLASIFICACION], auto=False)
+
+
+def tabla_salida(df_final):
+    """Columnas del tablero y del PDF, ordenadas por MODELO y PATENTE."""
+    return compactar(df_final[COLS_SALIDA], auto=False).sort_values(["MODELO", "PATENTE"])
+
+
+def calcular_estados(df_final, tolerancia=TOLERANCIA_PCT):
+    """Secciones 6 y 7 sobre df_final unificado: (df_final, salida)."""
+    df_final = clasificar(calcular_metricas(df_final, tolerancia))
+    return df_final, tabla_salida(df_final)
+
+
+def cerrar_periodo(df_final, df_cons, invalidas, periodo, dir_historial=DIR_HISTORIAL,
+                   tolerancia=TOLERANCIA_PCT, tanques=None):
+    """
+    Secciones 6 y 7 sobre df_final unificado más el detalle por carga de
+    `df_cons` (patentes ya normalizadas): (df_final, salida, invalidas,
+    detalle). Antes de calcular, la distancia GPS se concilia con la del
+    odómetro (conciliar_km) y se suman las líneas de base de la unidad.
+    No escribe nada: los totales del período los guarda guardar_periodo.
+    `tanques` es la tabla de capacidades por MODELO (insumos["tanques"]).
+    """
+    # Cada tramo lleva el documento de quien cargó al cerrarlo (choferes)
+    tramos = tramos_odometro(
+        df_cons, columnas=[c for c in [COL_DOCUMENTO] if c in df_cons.columns]
+    )
+    df_final = conciliar_km(
+        df_final.merge(resumen_odometro(tramos), on="PATENTE", how="left")
+    )
+    df_final["CAPACIDAD_TANQUE_L"] = capacidad_por_patente(df_final, tanques)
+    df_final = df_final.merge(linea_base_periodo(periodo, dir_historial), on="PATENTE", how="left")
+    df_final, salida = calcular_estados(df_final, tolerancia)
+    pares = atribuir_choferes(df_final, df_cons, tramos)
+    detalle = {
+        "tramos": tramos[COLUMNAS_TRAMOS],
+        "choferes": ranking_choferes(pares),
+        "choferes_patentes": pares,
+        "sobrecargas": eventos_sobrecarga(df_cons, df_final),
+        "frecuencia_cargas": anomalias_frecuencia(df_cons),
+    }
+    return df_final, salida, invalidas, detalle
+
+
+def guardar_periodo(df_final, invalidas, periodo, dir_historial=DIR_HISTORIAL):
+    """
+    Lo que un período calculado deja para los siguientes: las correcciones
+    de patentes nuevas (invalidas["corregidas"]) y sus totales por unidad
+    (línea de base).
+    """
+    registrar_correcciones(invalidas["corregidas"], ruta_correcciones(dir_historial))
+    registrar_agregado(agregado_periodo(df_final, periodo.FIN), periodo.CLAVE, dir_historial)
+
+
+def procesar_periodo(insumos, periodo, dir_historial=DIR_HISTORIAL, tolerancia=TOLERANCIA_PCT):
+    """
+    Secciones 3 a 7 de un período: (df_final, salida, invalidas, detalle).
+    Al final guarda lo que usan los períodos siguientes (guardar_periodo).
+    """
+    df_cons, df_km, df_nom, invalidas = normalizar(
+        *cargar_periodo(insumos, periodo, dir_historial),
+        leer_correcciones(ruta_correcciones(dir_historial)),
+    )
+    df_final = unir(*agrupar(df_cons, df_km), df_nom)
+    resultado = cerrar_periodo(
+        df_final, df_cons, invalidas, periodo, dir_historial, tolerancia, insumos.get("tanques")
+    )
+    guardar_periodo(resultado[0], invalidas, periodo, dir_historial)
+    return resultado
+
+
+def formato_pesos(valor):
+    """Importe en pesos con separador de miles: 42886009.7 → "$ 42.886.010"."""
+    if pd.isna(valor):
+        return "-"
+    return f"$ {valor:,.0f}".replace(",", ".")
+
+
+def resumen_estados(salida):
+    """
+    KPIs del tablero y del PDF sobre `salida` (o un filtro de ella): total,
+    normal, auditar, dudoso, sin_datos, pct_normal, importe_total,
+    pesos_en_riesgo y "tabla" (Estado, Cantidad) con los estados presentes,
+    del más al menos frecuente.
+    """
+    conteo = salida["ESTADO"].value_counts()
+    total = len(salida)
+    normal = int(conteo.get("NORMAL", 0))
+    a_auditar = salida["ESTADO"] == "A AUDITAR"
+    return {
+        "total": total,
+        "normal": normal,
+        "auditar": int(conteo.get("A AUDITAR", 0)),
+        "dudoso": int(conteo.get("DUDOSO", 0)),
+        "sin_datos": int(conteo.get("SIN DATOS", 0)),
+        "pct_normal": (normal / total * 100) if total > 0 else 0,
+        "importe_total": float(salida["IMPORTE_TOTAL"].sum()),
+        # Exceso de las unidades A AUDITAR, valorizado
+        "pesos_en_riesgo": float(salida["DESVIO_PESOS"].where(a_auditar).clip(lower=0).sum()),
+        "tabla": (
+            conteo.loc[lambda s: s > 0]  # ESTADO es categórico: omitir estados sin unidades
+            .rename_axis("Estado")
+            .reset_index(name="Cantidad")
+        ),
+    }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--plantilla-tanques"]:
+        # python -m consumo_engine.calculo --plantilla-tanques [carpeta]
+        carpeta = sys.argv[2] if len(sys.argv) > 2 else "."
+        ruta = os.path.join(carpeta, FILE_TANQUES)
+        if plantilla_tanques(leer_tabla(os.path.join(carpeta, FILE_NOMINA), "nomina"), ruta):
+            print(f"{ruta}: creada, completar CAPACIDAD_L por modelo")
+        else:
+            print(f"{ruta}: ya existe o la nómina no tiene MODELO", file=sys.stderr)
+        sys.exit()
+    carpeta = sys.argv[1] if len(sys.argv) > 1 else "."
+    dir_historial = historial_de(carpeta)
+    inicio = time.perf_counter()
+    insumos = cargar(carpeta, dir_historial)
+    print(f"carga: {time.perf_counter() - inicio:.2f} s")
+    for aviso in insumos["avisos"]:
+        print(f"aviso: {aviso}", file=sys.stderr)
+    for r in insumos["periodos"].iloc[::-1].itertuples():
+        inicio = time.perf_counter()
+        _, salida, _, _ = procesar_periodo(insumos, r, dir_historial)
+        conteo = resumen_estados(salida)["tabla"].to_string(index=False, header=False)
+        print(f"\n{r.CLAVE} ({time.perf_counter() - inicio:.3f} s)\n{conteo}")
@@ -0,0 +1,265 @@
+# ==========================
+# ATRIBUCIÓN POR CHOFER
+# ==========================
+#
+# La tarjeta identifica quién cargó cada vez (CONDUCTOR y NRO IDENTIFICACION
+# CONDUCTOR); el GPS trae un único Alias por patente, el chofer asignado.
+# Un chofer puede cargar en varios camiones dentro del período, así que:
+#   - los litros son los que cargó cada chofer en cada patente;
+#   - la distancia sale del odómetro, no del GPS de la patente: cada tramo
+#     OK (odometro.tramos_odometro) es del chofer de la carga que lo cierra,
+#     con sus km y los litros consumidos en él, y con ellos el consumo
+#     teórico esperado. Repartir los km del camión según los litros daría
+#     a cada chofer el consumo del camión, sin nada que comparar;
+#   - los choferes con menos de KM_MIN_CHOFER km medidos no entran en el
+#     ranking: en pocos km un solo odómetro mal tipeado decide el consumo;
+#   - el Alias se une a un documento con un índice de nombres normalizados
+#     armado sobre los choferes distintos (no fila por fila) y marca al
+#     titular de cada patente.
+# Sólo cuentan para el consumo las patentes medibles: estado NORMAL, A
+# AUDITAR o DUDOSO y una distancia confiable (CONFIANZA_KM distinta de BAJA y
+# SIN KM, como en las líneas de base); en las demás el desvío es del dato,
+# no del chofer.
+
+import re
+import unicodedata
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+COL_DOCUMENTO = "NRO IDENTIFICACION CONDUCTOR"
+
+ESTADOS_MEDIBLES = ["NORMAL", "A AUDITAR", "DUDOSO"]
+CONFIANZAS_DESCARTADAS = ["BAJA", "SIN KM"]
+KM_MIN_CHOFER = 1000
+
+# Esqueleto fonético (castellano) para errores de tipeo del Alias:
+# Dellavita / DELLAVITTA, Saucedo / SAUSEDO, Deines / DEINS
+FONETICA = [
+    (re.compile(r"QU"), "K"),
+    (re.compile(r"C(?=[EI])"), "S"),
+    (re.compile(r"[ZX]"), "S"),
+    (re.compile(r"C"), "K"),
+    (re.compile(r"V"), "B"),
+    (re.compile(r"H"), ""),
+    (re.compile(r"(.)\1+"), r"\1"),
+    (re.compile(r"(?<=.)[AEIOU]"), ""),
+]
+
+COLUMNAS_PARES = [
+    COL_DOCUMENTO,
+    "CONDUCTOR",
+    "PATENTE",
+    "TITULAR",
+    "CARGAS",
+    "LITROS",
+    "KM_ATRIBUIDOS",
+    "LITROS_MEDIDOS",
+    "LITROS_TEORICOS",
+]
+
+COLUMNAS_RANKING = [
+    "RANKING",
+    COL_DOCUMENTO,
+    "CONDUCTOR",
+    "PATENTES",
+    "CARGAS",
+    "LITROS_TOTALES",
+    "KM_ATRIBUIDOS",
+    "CONSUMO_REAL_L_100KM",
+    "CONSUMO_TEORICO_L_100KM",
+    "DESVIO_PCT",
+    "PCT_LITROS_TITULAR",
+]
+
+
+# ==========================
+# ÍNDICE DE NOMBRES
+# ==========================
+
+def _tokens(nombre):
+    """Palabras en mayúsculas sin acentos: "Dell'Orto, Exequiel" → [DELL, ORTO, EXEQUIEL]."""
+    texto = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode()
+    return re.findall(r"[A-Z]+", texto.upper())
+
+
+def _fonetica(palabra):
+    for patron, reemplazo in FONETICA:
+        palabra = patron.sub(reemplazo, palabra)
+    return palabra
+
+
+def claves_nombre(nombre):
+    """
+    (NIVEL, CLAVE) de un nombre, de la más a la menos estricta:
+      0: todas las palabras, sin importar el orden ("APELLIDO, NOMBRE" y
+         "Nombre Apellido" coinciden);
+      1: cada par de palabras (o de palabras vecinas unidas: LA ROCA →
+         LAROCA), para Alias con sólo uno de los nombres;
+      2: los mismos pares sobre el esqueleto fonético.
+    Nombres de una sola palabra no generan claves.
+    """
+    palabras = _tokens(nombre)
+    if len(palabras) < 2:
+        return []
+    extendidas = [p for p in palabras if len(p) > 1]
+    extendidas += [a + b for a, b in zip(palabras, palabras[1:])]
+    pares = {tuple(sorted(par)) for par in combinations(extendidas, 2)}
+    foneticos = {tuple(sorted(map(_fonetica, par))) for par in pares}
+    return (
+        [(0, " ".join(sorted(palabras)))]
+        + [(1, " ".join(par)) for par in pares]
+        + [(2, " ".join(par)) for par in foneticos]
+    )
+
+
+def indice_nombres(choferes):
+    """
+    NIVEL, CLAVE → documento sobre los choferes distintos (`choferes` con
+    CONDUCTOR y COL_DOCUMENTO). Las claves que comparten dos documentos se
+    descartan: un Alias ambiguo queda sin unir.
+    """
+    filas = [
+        (documento, nivel, clave)
+        for nombre, documento in choferes[["CONDUCTOR", COL_DOCUMENTO]]
+        .drop_duplicates().itertuples(index=False)
+        for nivel, clave in claves_nombre(nombre)
+    ]
+    indice = pd.DataFrame(filas, columns=[COL_DOCUMENTO, "NIVEL", "CLAVE"]).drop_duplicates()
+    unica = indice.groupby(["NIVEL", "CLAVE"])[COL_DOCUMENTO].transform("nunique") == 1
+    return indice[unica]
+
+
+def resolver_alias(alias, indice):
+    """
+    {Alias: documento} para los Alias distintos de `alias`: el del nivel más
+    estricto con coincidencias, si todas apuntan al mismo documento.
+    """
+    filas = [
+        (a, nivel, clave)
+        for a in pd.unique(pd.Series(alias).dropna().astype(str))
+        for nivel, clave in claves_nombre(a)
+    ]
+    consultas = pd.DataFrame(filas, columns=["ALIAS", "NIVEL", "CLAVE"])
+    hits = consultas.merge(indice, on=["NIVEL", "CLAVE"])
+    hits = hits[hits["NIVEL"] == hits.groupby("ALIAS")["NIVEL"].transform("min")]
+    hits = hits[hits.groupby("ALIAS")[COL_DOCUMENTO].transform("nunique") == 1]
+    return dict(hits.drop_duplicates("ALIAS")[["ALIAS", COL_DOCUMENTO]].to_numpy())
+
+
+# ==========================
+# ATRIBUCIÓN Y RANKING
+# ==========================
+
+def _documentos(s):
+    """Documento como texto ("34471044", no "34471044.0")."""
+    if pd.api.types.is_float_dtype(s):
+        s = s.astype("Int64")
+    return s.astype("string").str.strip()
+
+
+def atribuir_choferes(df_final, df_cons, tramos):
+    """
+    Una fila por chofer y patente (COLUMNAS_PARES) con sus cargas y litros;
+    KM_ATRIBUIDOS y LITROS_MEDIDOS son los de los tramos OK de odómetro que
+    cerró (`tramos` de tramos_odometro con COL_DOCUMENTO), y LITROS_TEORICOS
+    lo que la nómina espera para esos km. TITULAR indica que el Alias GPS de
+    la patente es ese chofer.
+    """
+    if COL_DOCUMENTO not in df_cons.columns or "CONDUCTOR" not in df_cons.columns:
+        return pd.DataFrame(columns=COLUMNAS_PARES)
+    cargas = pd.DataFrame({
+        COL_DOCUMENTO: _documentos(df_cons[COL_DOCUMENTO]),
+        "CONDUCTOR": df_cons["CONDUCTOR"].astype("string"),
+        "PATENTE": df_cons["PATENTE"].astype(str),
+        "LITROS": df_cons["LITROS"].astype("float64"),
+    }).dropna(subset=[COL_DOCUMENTO])
+    pares = cargas.groupby([COL_DOCUMENTO, "PATENTE"], as_index=False).agg(
+        CONDUCTOR=("CONDUCTOR", "first"),
+        CARGAS=("LITROS", "size"),
+        LITROS=("LITROS", "sum"),
+    )
+
+    ok = tramos["ESTADO_TRAMO"] == "OK"
+    medidos = (
+        pd.DataFrame({
+            COL_DOCUMENTO: _documentos(tramos[COL_DOCUMENTO][ok]),
+            "PATENTE": tramos["PATENTE"][ok].astype(str),
+            "KM_ATRIBUIDOS": tramos["KM_TRAMO"][ok].astype("float64"),
+            "LITROS_MEDIDOS": tramos["LITROS_TRAMO"][ok].astype("float64"),
+        })
+        .dropna(subset=[COL_DOCUMENTO])
+        .groupby([COL_DOCUMENTO, "PATENTE"], as_index=False)
+        .sum()
+    )
+    pares = pares.merge(medidos, on=[COL_DOCUMENTO, "PATENTE"], how="left")
+
+    unidades = pd.DataFrame({
+        "PATENTE": df_final["PATENTE"].astype(str),
+        "TEORICO": df_final["CONSUMO_TEORICO_L_100KM"].astype("float64"),
+        "MEDIBLE": (
+            df_final["ESTADO"].isin(ESTADOS_MEDIBLES)
+            & ~df_final["CONFIANZA_KM"].isin(CONFIANZAS_DESCARTADAS)
+        ).to_numpy(),
+        "ALIAS": df_final["ALIAS"] if "ALIAS" in df_final.columns else pd.NA,
+    })
+    pares = pares.merge(unidades, on="PATENTE", how="left")
+
+    titulares = resolver_alias(unidades["ALIAS"], indice_nombres(cargas))
+    pares["TITULAR"] = (
+        pares["ALIAS"].astype("string").map(titulares).astype("string")
+        == pares[COL_DOCUMENTO]
+    ).fillna(False).astype(bool)
+
+    medible = pares["MEDIBLE"].fillna(False).astype(bool) & (pares["KM_ATRIBUIDOS"] > 0)
+    pares["KM_ATRIBUIDOS"] = pares["KM_ATRIBUIDOS"].where(medible)
+    pares["LITROS_MEDIDOS"] = pares["LITROS_MEDIDOS"].where(medible)
+    pares["LITROS_TEORICOS"] = pares["KM_ATRIBUIDOS"] * pares["TEORICO"] / 100
+    return pares[COLUMNAS_PARES]
+
+
+def ranking_choferes(pares, km_min=KM_MIN_CHOFER):
+    """
+    Una fila por chofer con al menos `km_min` km medidos (COLUMNAS_RANKING):
+    consumo real contra teórico sobre los tramos que cerró, del mayor al
+    menor desvío. PCT_LITROS_TITULAR es la parte de sus litros cargada en
+    camiones de los que es titular.
+    """
+    choferes = (
+        pares.assign(LITROS_TITULAR=pares["LITROS"].where(pares["TITULAR"], 0.0))
+        .groupby(COL_DOCUMENTO, as_index=False)
+        .agg(
+            CONDUCTOR=("CONDUCTOR", "first"),
+            PATENTES=("PATENTE", "nunique"),
+            CARGAS=("CARGAS", "sum"),
+            LITROS_TOTALES=("LITROS", "sum"),
+            LITROS_MEDIDOS=("LITROS_MEDIDOS", "sum"),
+            LITROS_TITULAR=("LITROS_TITULAR", "sum"),
+            KM_ATRIBUIDOS=("KM_ATRIBUIDOS", "sum"),
+            LITROS_TEORICOS=("LITROS_TEORICOS", "sum"),
+        )
+    )
+    choferes = choferes[choferes["KM_ATRIBUIDOS"] >= max(km_min, 1)].reset_index(drop=True)
+    km = choferes["KM_ATRIBUIDOS"]
+    choferes["CONSUMO_REAL_L_100KM"] = choferes["LITROS_MEDIDOS"] / km * 100
+    choferes["CONSUMO_TEORICO_L_100KM"] = np.where(
+        choferes["LITROS_TEORICOS"] > 0, choferes["LITROS_TEORICOS"] / km * 100, np.nan
+    )
+    choferes["DESVIO_PCT"] = np.where(
+        choferes["LITROS_TEORICOS"] > 0,
+        choferes["LITROS_MEDIDOS"] / choferes["LITROS_TEORICOS"] - 1,
+        np.nan,
+    )
+    choferes["PCT_LITROS_TITULAR"] = np.where(
+        choferes["LITROS_TOTALES"] > 0,
+        choferes["LITROS_TITULAR"] / choferes["LITROS_TOTALES"],
+        np.nan,
+    )
+    choferes["RANKING"] = (
+        choferes["DESVIO_PCT"].rank(ascending=False, method="min").astype("Int64")
+    )
+    return (
+        choferes.sort_values(["RANKING", "CONDUCTOR"], na_position="last", ignore_index=True)
+        [COLUMNAS_RANKING]
+    )
@@ -0,0 +1,179 @@
+# ==========================
+# REGISTRO DE COLUMNAS (ESQUEMAS)
+# ==========================
+#
+# Único lugar donde se define cómo se llaman las columnas de cada planilla y
+# con qué nombres pueden venir del proveedor. Lo usan la ingesta del tablero
+# de consumo (ingesta.py) y el tablero logístico (liq_comb.xlsx).
+#
+# Cada columna canónica tiene una lista de candidatos, probados en orden:
+#   - "texto": nombre exacto, comparado con norm_col_name (sin espacios,
+#     signos ni acentos, en mayúsculas)
+#   - ("A", "B"): cualquier encabezado que contenga todas las partes
+#
+# El mapeo se resuelve una vez por encabezado (y por archivo/hash en
+# mapeo_archivo) y queda en caché. Si falta una columna requerida se corta
+# en la ingesta con ErrorEsquema, que detalla qué se buscó y qué vino.
+
+import os
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+
+from openpyxl import load_workbook
+
+REQUERIDA, OPCIONAL = True, False
+
+ESQUEMAS = {
+    "consumo": {
+        "PATENTE": (REQUERIDA, ["IDENTIFICACIONTARJETA", "PATENTE"]),
+        "LITROS": (REQUERIDA, ["LITROS UNIDADES", "LITROS"]),
+        "FECHA": (REQUERIDA, ["FECHA"]),
+        "TARJETA": (OPCIONAL, ["TARJETA"]),
+        "ODOMETRO": (OPCIONAL, ["ODOMETRO"]),
+        "REMITO": (OPCIONAL, ["REMITO"]),
+        "FACTURA": (OPCIONAL, ["FACTURA"]),
+        "PRODUCTO": (OPCIONAL, ["PRODUCTO"]),
+        "ESTABLECIMIENTO": (OPCIONAL, ["ESTABLECIMIENTO"]),
+        "LOCALIDAD": (OPCIONAL, ["LOCALIDAD"]),
+        "PROVINCIA": (OPCIONAL, ["PROVINCIA"]),
+        "CONDUCTOR": (OPCIONAL, ["CONDUCTOR"]),
+        "NRO IDENTIFICACION CONDUCTOR": (OPCIONAL, ["NRO IDENTIFICACION CONDUCTOR"]),
+        "PRECIO PVP ESTABLECIMIENTO": (OPCIONAL, ["PRECIO PVP ESTABLECIMIENTO"]),
+        "IMP TOT PVP ESTABLECIMIENTO": (OPCIONAL, ["IMP TOT PVP ESTABLECIMIENTO"]),
+        "PRECIO YER": (OPCIONAL, ["PRECIO YER"]),
+        "IMP TOT YER": (OPCIONAL, ["IMP TOT YER"]),
+    },
+    "km": {
+        "PATENTE": (REQUERIDA, ["Placa/Patente", "Patente", "Placa"]),
+        "KM_RECORRIDOS": (REQUERIDA, ["Distancia [km]", "Distancia", ("DISTANCIA",)]),
+        "Alias": (OPCIONAL, ["Alias"]),
+    },
+    "nomina": {
+        "PATENTE": (REQUERIDA, ["PATENTE", ("PAT",)]),
+        "LITROS_100KM": (REQUERIDA, ["LITROS_100KM", ("LIT", "100"), ("LIT",)]),
+        "MODELO": (OPCIONAL, ["MODELO"]),
+    },
+    "tanques": {
+        "MODELO": (REQUERIDA, ["MODELO"]),
+        "CAPACIDAD_L": (REQUERIDA, ["CAPACIDAD_L", ("CAPACIDAD",), ("TANQUE",)]),
+    },
+    "liq": {
+        "Salida": (REQUERIDA, ["Salida"]),
+        "Cliente": (REQUERIDA, ["Cliente"]),
+        "Carga/Material": (REQUERIDA, ["Carga/Material", "CargaMaterial", "Carga_Material"]),
+        "Fletero": (REQUERIDA, ["Fletero", "Transporte/Fletero", "Transporte / Fletero"]),
+        "Remito": (REQUERIDA, ["Remito", "Remitos"]),
+        "Cumplido": (REQUERIDA, ["Cumplido"]),
+        "Rendido": (REQUERIDA, ["Rendido"]),
+        "TnFactu": (REQUERIDA, ["TnFactu", "TNFACTU", "TNFACTURADA", "Cant Facturar", "Neto Salida"]),
+        "Total Val. Clientes": (REQUERIDA, ["Total Val. Clientes", "Tarifa Cliente", "TotalValClientes"]),
+        "U.Negocio": (OPCIONAL, ["U.Negocio", "UNegocio", "U_Negocio"]),
+        "Comp.Compra": (OPCIONAL, ["Comp.Compra", "CompCompra", "Comp_Compra", "Comp Compra"]),
+        "CompVenta": (OPCIONAL, ["CompVenta", "Comp.Venta", "Comp_Venta", "Comp Venta"]),
+        "OrdServicio": (OPCIONAL, ["OrdServicio", "OrdenServicio", "Ord_Servicio", "OS"]),
+    },
+}
+
+
+class ErrorEsquema(ValueError):
+    """
+    Faltan columnas requeridas en una planilla; el mensaje trae el detalle.
+    `archivo`, `faltantes` (nombres canónicos) y `encontradas` (encabezado)
+    quedan además como atributos, para mostrarlos fuera del mensaje.
+    """
+
+    def __init__(self, mensaje, archivo="", faltantes=(), encontradas=()):
+        # Todo en args: así sobrevive al pickle del pool de procesos
+        super().__init__(mensaje, archivo, tuple(faltantes), tuple(encontradas))
+        self.archivo = archivo
+        self.faltantes = list(faltantes)
+        self.encontradas = list(encontradas)
+
+    def __str__(self):
+        return self.args[0]
+
+
+def norm_col_name(x):
+    texto = unicodedata.normalize("NFKD", str(x))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return (
+        texto.strip().upper()
+        .replace(" ", "").replace("_", "")
+        .replace(".", "").replace("/", "")
+        .replace("-", "")
+    )
+
+
+def _coincide(candidato, normalizado):
+    if isinstance(candidato, tuple):
+        return all(norm_col_name(parte) in normalizado for parte in candidato)
+    return norm_col_name(candidato) == normalizado
+
+
+def _describir(candidatos):
+    return ", ".join(
+        "contiene " + "+".join(c) if isinstance(c, tuple) else repr(c) for c in candidatos
+    )
+
+
+# ==========================
+# RESOLUCIÓN
+# ==========================
+
+@lru_cache(maxsize=128)
+def resolver_columnas(tipo, encabezado, archivo=""):
+    """
+    {canónico: original} para un encabezado (tupla de nombres). Cada columna
+    original se asigna a lo sumo a una canónica. Lanza ErrorEsquema si falta
+    alguna requerida.
+    """
+    normalizados = [norm_col_name(c) for c in encabezado]
+    mapeo, usadas, faltantes, detalle = {}, set(), [], []
+    for canonico, (requerida, candidatos) in ESQUEMAS[tipo].items():
+        for candidato in candidatos:
+            i = next(
+                (i for i, n in enumerate(normalizados)
+                 if i not in usadas and n and _coincide(candidato, n)),
+                None,
+            )
+            if i is not None:
+                mapeo[canonico] = encabezado[i]
+                usadas.add(i)
+                break
+        else:
+            if requerida:
+                faltantes.append(canonico)
+                detalle.append(f"  - {canonico} (se buscó: {_describir(candidatos)})")
+
+    if faltantes:
+        encontradas = [str(c) for c in encabezado if str(c).strip()]
+        presentes = ", ".join(repr(c) for c in encontradas) or "(ninguna)"
+        raise ErrorEsquema(
+            f"{archivo or tipo}: faltan columnas requeridas\n"
+            + "\n".join(detalle)
+            + f"\nColumnas encontradas: {presentes}",
+            archivo or tipo, faltantes, encontradas,
+        )
+    return MappingProxyType(mapeo)
+
+
+def renombrar(df, tipo, archivo=""):
+    """`df` con las columnas reconocidas renombradas a su nombre canónico."""
+    mapeo = resolver_columnas(tipo, tuple(df.columns), archivo)
+    return df.rename(columns={orig: canon for canon, orig in mapeo.items()})
+
+
+@lru_cache(maxsize=64)
+def mapeo_archivo(ruta, tipo, hash_contenido):
+    """
+    Resuelve el esquema leyendo sólo el encabezado del xlsx (modo read-only),
+    una vez por archivo y versión de contenido.
+    """
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        primera = next(wb.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        wb.close()
+    encabezado = tuple(str(c).strip() if c is not None else "" for c in primera)
+    return resolver_columnas(tipo, encabezado, os.path.basename(ruta))
@@ -0,0 +1,153 @@
+# ==========================
+# FRECUENCIA DE CARGAS POR TARJETA
+# ==========================
+#
+# Una tarjeta que carga demasiado seguido, o en dos localidades a la vez, se
+# está usando para más de un vehículo. Sobre las transacciones de
+# combustible del período, ordenadas una sola vez por TARJETA y FECHA:
+#   - las líneas de la misma tarjeta y establecimiento separadas por menos
+#     de MINUTOS_MISMA_CARGA son una sola carga (tickets partidos, dos
+#     tanques);
+#   - CARGAS FRECUENTES: más de MAX_CARGAS_VENTANA cargas dentro de
+#     VENTANA_CARGAS_H horas. La ventana se resuelve con searchsorted sobre
+#     una clave TARJETA + segundos, así nunca cruza a otra tarjeta;
+#   - LOCALIDAD IMPOSIBLE: dos cargas seguidas en LOCALIDAD distinta con
+#     menos de MINUTOS_ENTRE_LOCALIDADES entre ellas. No hay coordenadas de
+#     las estaciones: el mínimo es un tiempo fijo, no una distancia.
+# Las líneas sin FECHA, o sin TARJETA cuando la exportación trae la columna,
+# no entran: no tienen lugar en la clave. Sin la columna, la tarjeta es la
+# de la patente.
+
+import numpy as np
+import pandas as pd
+
+from consumo_engine.tanques import codigos_tarjeta, es_combustible
+from consumo_engine.tipos import codigos
+
+VENTANA_CARGAS_H = 6
+MAX_CARGAS_VENTANA = 2
+MINUTOS_MISMA_CARGA = 30
+MINUTOS_ENTRE_LOCALIDADES = 60
+
+TIPOS_ANOMALIA = ["CARGAS FRECUENTES", "LOCALIDAD IMPOSIBLE"]
+TIPO_ANOMALIA = pd.CategoricalDtype(TIPOS_ANOMALIA)
+
+COLUMNAS_ANOMALIAS = [
+    "TARJETA",
+    "PATENTE",
+    "FECHA",
+    "LOCALIDAD",
+    "ESTABLECIMIENTO",
+    "LITROS",
+    "FECHA_ANTERIOR",
+    "LOCALIDAD_ANTERIOR",
+    "HORAS",
+    "CARGAS_VENTANA",
+    "TIPO_ANOMALIA",
+]
+
+
+def _texto(df, columna, filas):
+    if columna not in df.columns:
+        return np.full(len(filas), pd.NA, dtype=object)
+    return df[columna].iloc[filas].astype("string").to_numpy()
+
+
+def anomalias_frecuencia(
+    df_cons,
+    ventana_h=VENTANA_CARGAS_H,
+    max_cargas=MAX_CARGAS_VENTANA,
+    minutos_misma_carga=MINUTOS_MISMA_CARGA,
+    minutos_entre_localidades=MINUTOS_ENTRE_LOCALIDADES,
+):
+    """
+    Una fila por carga anómala (COLUMNAS_ANOMALIAS). FECHA_ANTERIOR y
+    LOCALIDAD_ANTERIOR son las de la carga con la que choca: la primera de
+    la ventana (CARGAS FRECUENTES) o la anterior (LOCALIDAD IMPOSIBLE).
+    CARGAS_VENTANA cuenta las cargas de la tarjeta en las `ventana_h` horas
+    que terminan en esa carga.
+    """
+    validas = (
+        es_combustible(df_cons)
+        & (df_cons["LITROS"].to_numpy(dtype="float64") > 0)
+        & df_cons["FECHA"].notna().to_numpy()
+    )
+    if "TARJETA" in df_cons.columns:
+        validas &= df_cons["TARJETA"].notna().to_numpy()
+    filas = np.flatnonzero(validas)
+    if not len(filas):
+        return pd.DataFrame(columns=COLUMNAS_ANOMALIAS)
+
+    # Clave única: cada tarjeta ocupa su propio tramo de segundos, más ancho
+    # que cualquier ventana; ordenarla es ordenar por TARJETA y FECHA
+    tarjeta = codigos_tarjeta(df_cons)[filas]
+    segundos = df_cons["FECHA"].to_numpy()[filas].astype("datetime64[s]").astype(np.int64)
+    ventana_s = int(ventana_h * 3600)
+    segundos -= segundos.min()
+    clave = tarjeta * (segundos.max() + ventana_s + 1) + segundos
+    orden = np.argsort(clave)
+    filas, tarjeta, segundos, clave = filas[orden], tarjeta[orden], segundos[orden], clave[orden]
+
+    # Líneas de la misma carga: misma tarjeta y establecimiento, poco tiempo
+    establecimiento = (
+        codigos(df_cons["ESTABLECIMIENTO"])[filas] if "ESTABLECIMIENTO" in df_cons.columns
+        else np.zeros(len(filas), dtype=np.int64)
+    )
+    nueva = np.ones(len(filas), dtype=bool)
+    nueva[1:] = (
+        (tarjeta[1:] != tarjeta[:-1])
+        | (establecimiento[1:] != establecimiento[:-1])
+        | (np.diff(segundos) > minutos_misma_carga * 60)
+    )
+    inicio = np.flatnonzero(nueva)
+    litros = np.add.reduceat(df_cons["LITROS"].to_numpy(dtype="float64")[filas], inicio)
+    filas, tarjeta, clave = filas[inicio], tarjeta[inicio], clave[inicio]
+
+    # Ventana [t - ventana_h, t] de cada carga dentro de su tarjeta
+    posicion = np.arange(len(clave))
+    desde = np.searchsorted(clave, clave - ventana_s, side="left")
+    en_ventana = posicion - desde + 1
+    frecuente = en_ventana > max_cargas
+
+    localidad = (
+        codigos(df_cons["LOCALIDAD"])[filas] if "LOCALIDAD" in df_cons.columns
+        else np.full(len(filas), -1, dtype=np.int64)
+    )
+    imposible = np.zeros(len(filas), dtype=bool)
+    imposible[1:] = (
+        (tarjeta[1:] == tarjeta[:-1])
+        & (localidad[1:] >= 0) & (localidad[:-1] >= 0)
+        & (localidad[1:] != localidad[:-1])
+        & (np.diff(clave) < minutos_entre_localidades * 60)
+    )
+
+    casos = [
+        (np.flatnonzero(frecuente), desde[frecuente], 0),
+        (np.flatnonzero(imposible), np.flatnonzero(imposible) - 1, 1),
+    ]
+    if not any(len(c) for c, _, _ in casos):
+        return pd.DataFrame(columns=COLUMNAS_ANOMALIAS)
+
+    # Sólo las cargas con anomalía se materializan
+    carga = np.concatenate([c for c, _, _ in casos])
+    anterior = np.concatenate([a for _, a, _ in casos])
+    tipo = np.concatenate([np.full(len(c), t, dtype=np.int8) for c, _, t in casos])
+    fechas = df_cons["FECHA"].to_numpy()
+    patentes = _texto(df_cons, "PATENTE", filas[carga])
+    tarjetas = pd.Series(_texto(df_cons, "TARJETA", filas[carga]), dtype="string")
+    salida = pd.DataFrame({
+        "TARJETA": tarjetas.fillna(pd.Series(patentes, dtype="string")).to_numpy(),
+        "PATENTE": patentes,
+        "FECHA": fechas[filas[carga]],
+        "LOCALIDAD": _texto(df_cons, "LOCALIDAD", filas[carga]),
+        "ESTABLECIMIENTO": _texto(df_cons, "ESTABLECIMIENTO", filas[carga]),
+        "LITROS": litros[carga],
+        "FECHA_ANTERIOR": fechas[filas[anterior]],
+        "LOCALIDAD_ANTERIOR": _texto(df_cons, "LOCALIDAD", filas[anterior]),
+        "CARGAS_VENTANA": en_ventana[carga],
+        "TIPO_ANOMALIA": pd.Categorical.from_codes(tipo, dtype=TIPO_ANOMALIA),
+    })
+    salida["HORAS"] = (salida["FECHA"] - salida["FECHA_ANTERIOR"]).dt.total_seconds() / 3600
+    return salida.sort_values(
+        ["FECHA", "TIPO_ANOMALIA"], ascending=[False, True], kind="mergesort", ignore_index=True
+    )[COLUMNAS_ANOMALIAS]
@@ -0,0 +1,456 @@
+# ==========================
+# HISTORIAL DE TRANSACCIONES (APPEND-ONLY)
+# ==========================
+#
+# Cada exportación de la tarjeta de combustible se superpone con la anterior.
+# En vez de re-leer y re-agregar todo, las transacciones se guardan en un
+# almacén Parquet append-only (un archivo por lote en DIR_HISTORIAL) y se
+# deduplican contra la clave natural TARJETA + FECHA + REMITO + FACTURA.
+# Sólo las filas nuevas se escriben y se suman a los agregados por PATENTE
+# y al cubo PATENTE × DÍA × ESTABLECIMIENTO.
+#
+# Para deduplicar no se relee el historial: un índice compacto guarda la
+# huella (uint64) de cada clave, particionado por mes de FECHA, y cada
+# ingesta lee sólo los meses de su exportación. El lote, el índice, el cubo
+# y los agregados se escriben primero a temporales y se publican con
+# os.replace en ese orden; derivados.json anota al final qué lotes cubren.
+# Si una ingesta se corta a mitad, la siguiente lo detecta (lotes distintos
+# de los anotados) y rearma los derivados desde los lotes.
+#
+# Uso semanal:  python -m consumo_engine.historial consumo_real.xlsx
+
+import json
+import os
+import sys
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from consumo_engine.ingesta import hash_archivo, leer_tabla
+
+DIR_HISTORIAL = "historial"
+
+
+def historial_de(carpeta):
+    """Historial de la carpeta de datos `carpeta` (<carpeta>/historial)."""
+    return os.path.join(carpeta, DIR_HISTORIAL)
+
+
+# Esquema fijo del almacén: todas las partes deben coincidir para poder
+# leerse juntas como un único dataset.
+ESQUEMA_TRANSACCIONES = {
+    "CLAVE": "string",
+    "FECHA": "datetime64[ns]",
+    "TARJETA": "string",
+    "PATENTE": "string",
+    "LITROS": "float64",
+    "ODOMETRO": "float64",
+    "REMITO": "string",
+    "FACTURA": "string",
+    "PRODUCTO": "string",
+    "ESTABLECIMIENTO": "string",
+    "LOCALIDAD": "string",
+    "PROVINCIA": "string",
+    "CONDUCTOR": "string",
+    "NRO IDENTIFICACION CONDUCTOR": "string",
+    "PRECIO PVP ESTABLECIMIENTO": "float64",
+    "IMP TOT PVP ESTABLECIMIENTO": "float64",
+    "PRECIO YER": "float64",
+    "IMP TOT YER": "float64",
+}
+# Columnas de la exportación que se leen para el historial (proyección del
+# sidecar: el resto de la planilla del proveedor no se materializa)
+COLUMNAS_EXPORTACION = [c for c in ESQUEMA_TRANSACCIONES if c != "CLAVE"]
+
+
+def _texto(s):
+    """Texto limpio sin NaN, para armar claves (enteros sin '.0')."""
+    if pd.api.types.is_float_dtype(s) and (s.dropna() % 1 == 0).all():
+        s = s.astype("Int64")
+    return s.astype("string").fillna("").str.strip()
+
+
+def clave_transaccion(df):
+    """
+    Clave natural TARJETA|FECHA|REMITO|FACTURA más el número de ocurrencia.
+
+    El proveedor repite a veces la misma fila (o un par anulación/recarga con
+    la misma clave) dentro de una exportación; la ocurrencia las mantiene
+    distintas, y como se repiten igual en la exportación siguiente, el
+    solapamiento se sigue detectando.
+    """
+    base = (
+        _texto(df["TARJETA"]) + "|"
+        + pd.to_datetime(df["FECHA"]).dt.strftime("%Y-%m-%d %H:%M:%S").fillna("")
+        + "|" + _texto(df["REMITO"])
+        + "|" + _texto(df["FACTURA"])
+    )
+    ocurrencia = base.groupby(base, sort=False).cumcount()
+    return base + "#" + ocurrencia.astype(str)
+
+
+def _ajustar_esquema(df):
+    out = pd.DataFrame(index=df.index)
+    for col, dtype in ESQUEMA_TRANSACCIONES.items():
+        if col not in df.columns:
+            out[col] = pd.Series(None, index=df.index, dtype=dtype)
+        elif dtype == "string":
+            out[col] = _texto(df[col]).replace("", pd.NA)
+        else:
+            out[col] = df[col].astype(dtype)
+    return out.reset_index(drop=True)
+
+
+def _ruta_transacciones(dir_historial):
+    return os.path.join(dir_historial, "transacciones")
+
+
+def _ruta_agregados(dir_historial):
+    return os.path.join(dir_historial, "agregados_patente.parquet")
+
+
+def _ruta_indice(dir_historial):
+    return os.path.join(dir_historial, "claves")
+
+
+def _ruta_estado(dir_historial):
+    return os.path.join(dir_historial, "derivados.json")
+
+
+def _escribir_temporal(df, destino):
+    """
+    Escribe `df` junto a `destino` con nombre oculto (los lectores del
+    dataset ignoran los que empiezan con "."). Devuelve (tmp, destino).
+    """
+    carpeta, nombre = os.path.split(destino)
+    tmp = os.path.join(carpeta, f".{nombre}.tmp")
+    df.to_parquet(tmp, index=False)
+    return tmp, destino
+
+
+def _escribir_atomico(df, destino):
+    os.replace(*_escribir_temporal(df, destino))
+
+
+def _publicar(escrituras):
+    """
+    [(df, destino)]: escribe todos los temporales y recién después los
+    publica con os.replace, en el orden de la lista.
+    """
+    pendientes = [_escribir_temporal(df, destino) for df, destino in escrituras]
+    for tmp, destino in pendientes:
+        os.replace(tmp, destino)
+
+
+def _podar_particiones(carpeta, escrituras):
+    """Borra de `carpeta` las particiones que una reconstrucción no reescribió."""
+    vigentes = {destino for _, destino in escrituras}
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        if nombre.endswith(".parquet") and not nombre.startswith(".") and ruta not in vigentes:
+            os.remove(ruta)
+
+
+# ==========================
+# LECTURA
+# ==========================
+
+def leer_transacciones(dir_historial=DIR_HISTORIAL, columnas=None):
+    carpeta = _ruta_transacciones(dir_historial)
+    if not os.path.isdir(carpeta) or not any(
+        n.endswith(".parquet") for n in os.listdir(carpeta)
+    ):
+        cols = columnas or list(ESQUEMA_TRANSACCIONES)
+        return _ajustar_esquema(pd.DataFrame(columns=cols))[cols]
+    return pd.read_parquet(carpeta, columns=columnas)
+
+
+def version_historial(dir_historial=DIR_HISTORIAL):
+    """Lotes guardados; como el almacén es append-only, sirve de clave de caché."""
+    carpeta = _ruta_transacciones(dir_historial)
+    if not os.path.isdir(carpeta):
+        return ()
+    return tuple(sorted(n for n in os.listdir(carpeta) if n.endswith(".parquet")))
+
+
+def leer_agregados(dir_historial=DIR_HISTORIAL):
+    """Totales acumulados por PATENTE: LITROS_TOTALES, CARGAS, FECHA_MIN/MAX."""
+    ruta = _ruta_agregados(dir_historial)
+    if not os.path.exists(ruta):
+        return pd.DataFrame(
+            columns=["PATENTE", "LITROS_TOTALES", "CARGAS", "FECHA_MIN", "FECHA_MAX"]
+        )
+    return pd.read_parquet(ruta)
+
+
+# ==========================
+# CUBO PATENTE × DÍA × ESTABLECIMIENTO
+# ==========================
+#
+# Litros, pesos y cantidad de cargas por celda, para que cualquier apertura
+# (litros diarios de una unidad, cargas por estación, gasto por día) salga
+# del cubo y no del historial completo. Particionado por mes:
+#
+#   historial/cubo/mes=<AAAA-MM>.parquet
+#
+# Cada ingesta pliega sólo las celdas de las filas nuevas sobre los meses
+# que tocan, y una consulta lee sólo los meses de su rango. Las PATENTE son
+# las de la exportación, sin corregir: así una corrección editada a mano no
+# invalida el cubo; se aplica al consultar.
+
+ESQUEMA_CUBO = {
+    "PATENTE": "string",
+    "DIA": "datetime64[ns]",
+    "ESTABLECIMIENTO": "string",
+    "LITROS": "float64",
+    "IMPORTE": "float64",
+    "CARGAS": "int64",
+}
+DIMENSIONES_CUBO = ["PATENTE", "DIA", "ESTABLECIMIENTO"]
+MEDIDAS_CUBO = ["LITROS", "IMPORTE", "CARGAS"]
+
+
+def _ruta_cubo(dir_historial):
+    return os.path.join(dir_historial, "cubo")
+
+
+def _celdas(df):
+    """Celdas del cubo de un conjunto de celdas o de transacciones."""
+    if "CARGAS" not in df.columns:
+        df = pd.DataFrame({
+            "PATENTE": df["PATENTE"],
+            "DIA": pd.to_datetime(df["FECHA"]).dt.normalize(),
+            "ESTABLECIMIENTO": df["ESTABLECIMIENTO"],
+            "LITROS": df["LITROS"],
+            "IMPORTE": df["IMP TOT PVP ESTABLECIMIENTO"],
+            "CARGAS": 1,
+        })
+    return (
+        df.groupby(DIMENSIONES_CUBO, as_index=False, dropna=False, sort=True)
+        [MEDIDAS_CUBO].sum()
+    )
+
+
+def _cubo_plegado(celdas, dir_historial, reemplazar):
+    """
+    [(celdas, destino)] de las particiones de los meses de `celdas`,
+    plegadas sobre las guardadas (o en su reemplazo, con reemplazar=True).
+    """
+    carpeta = _ruta_cubo(dir_historial)
+    os.makedirs(carpeta, exist_ok=True)
+    celdas = celdas[celdas["DIA"].notna()]
+    escrituras = []
+    for mes, delta in celdas.groupby(celdas["DIA"].dt.to_period("M")):
+        destino = os.path.join(carpeta, f"mes={mes}.parquet")
+        if not reemplazar and os.path.exists(destino):
+            delta = _celdas(pd.concat([pd.read_parquet(destino), delta], ignore_index=True))
+        escrituras.append((delta, destino))
+    return escrituras
+
+
+def reconstruir_cubo(dir_historial=DIR_HISTORIAL):
+    """Arma el cubo completo desde el historial (cubo ausente o dañado)."""
+    columnas = ["PATENTE", "FECHA", "ESTABLECIMIENTO", "LITROS", "IMP TOT PVP ESTABLECIMIENTO"]
+    celdas = _celdas(leer_transacciones(dir_historial, columnas))
+    escrituras = _cubo_plegado(celdas, dir_historial, reemplazar=True)
+    _publicar(escrituras)
+    _podar_particiones(_ruta_cubo(dir_historial), escrituras)
+
+
+def leer_cubo(desde=None, hasta=None, dir_historial=DIR_HISTORIAL):
+    """
+    Celdas del cubo con DIA entre `desde` y `hasta` (fechas inclusive; None
+    o NaT: sin límite). Sólo se leen las particiones de esos meses.
+    """
+    desde = pd.Timestamp(desde) if pd.notna(desde) else None
+    hasta = pd.Timestamp(hasta) if pd.notna(hasta) else None
+    carpeta = _ruta_cubo(dir_historial)
+    nombres = sorted(os.listdir(carpeta)) if os.path.isdir(carpeta) else []
+    primero = f"mes={desde:%Y-%m}" if desde else ""
+    ultimo = f"mes={hasta:%Y-%m}" if hasta else "mes=9999"
+    rutas = [
+        os.path.join(carpeta, n) for n in nombres
+        if n.endswith(".parquet") and primero <= n[:len("mes=AAAA-MM")] <= ultimo
+    ]
+    if not rutas:
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in ESQUEMA_CUBO.items()})
+    celdas = pd.concat([pd.read_parquet(r) for r in rutas], ignore_index=True)
+    dentro = np.ones(len(celdas), dtype=bool)
+    if desde:
+        dentro &= (celdas["DIA"] >= desde).to_numpy()
+    if hasta:
+        dentro &= (celdas["DIA"] <= hasta).to_numpy()
+    return celdas[dentro].reset_index(drop=True)
+
+
+def consultar_cubo(por, desde=None, hasta=None, filtros=None, correcciones=None,
+                   dir_historial=DIR_HISTORIAL):
+    """
+    LITROS, IMPORTE y CARGAS sumados por las dimensiones de `por` (subconjunto
+    de DIMENSIONES_CUBO) entre `desde` y `hasta`. `filtros` es {dimensión:
+    valor o lista de valores}; `correcciones` ({original: (patente, motivo)},
+    ver patentes.leer_correcciones) se aplica a PATENTE antes de filtrar.
+    """
+    celdas = leer_cubo(desde, hasta, dir_historial)
+    if correcciones:
+        mapa = pd.Series({k: v[0] for k, v in correcciones.items()}, dtype="string")
+        celdas["PATENTE"] = celdas["PATENTE"].map(mapa).fillna(celdas["PATENTE"])
+    for dimension, valores in (filtros or {}).items():
+        if isinstance(valores, (str, date)):
+            valores = [valores]
+        celdas = celdas[celdas[dimension].isin(list(valores))]
+    return (
+        celdas.groupby(list(por), as_index=False, dropna=False, sort=True)
+        [MEDIDAS_CUBO].sum()
+    )
+
+
+# ==========================
+# ÍNDICE DE CLAVES
+# ==========================
+#
+#   historial/claves/mes=<AAAA-MM | sin-fecha>.parquet   (columna HUELLA)
+
+def _huellas(claves):
+    return pd.util.hash_pandas_object(claves.astype("string"), index=False).to_numpy()
+
+
+def _meses(fechas):
+    return pd.to_datetime(fechas).dt.strftime("%Y-%m").fillna("sin-fecha")
+
+
+def _leer_indice(meses, dir_historial):
+    """Huellas guardadas de los meses pedidos."""
+    carpeta = _ruta_indice(dir_historial)
+    rutas = [os.path.join(carpeta, f"mes={m}.parquet") for m in sorted(set(meses))]
+    partes = [pd.read_parquet(r)["HUELLA"].to_numpy() for r in rutas if os.path.exists(r)]
+    return np.concatenate(partes) if partes else np.array([], dtype=np.uint64)
+
+
+def _indice_plegado(transacciones, dir_historial, reemplazar):
+    """[(huellas, destino)] de los meses de `transacciones`, como _cubo_plegado."""
+    carpeta = _ruta_indice(dir_historial)
+    os.makedirs(carpeta, exist_ok=True)
+    huellas = pd.DataFrame({"HUELLA": _huellas(transacciones["CLAVE"])})
+    escrituras = []
+    for mes, delta in huellas.groupby(_meses(transacciones["FECHA"]).to_numpy()):
+        destino = os.path.join(carpeta, f"mes={mes}.parquet")
+        if not reemplazar and os.path.exists(destino):
+            delta = pd.concat([pd.read_parquet(destino), delta], ignore_index=True)
+        escrituras.append((delta.reset_index(drop=True), destino))
+    return escrituras
+
+
+# ==========================
+# INGESTA INCREMENTAL
+# ==========================
+
+def _agregar_por_patente(df):
+    return df.groupby("PATENTE", as_index=False).agg(
+        LITROS_TOTALES=("LITROS", "sum"),
+        CARGAS=("LITROS", "size"),
+        FECHA_MIN=("FECHA", "min"),
+        FECHA_MAX=("FECHA", "max"),
+    )
+
+
+def _agregados_plegados(nuevas, dir_historial):
+    """Pliega sólo el delta sobre los agregados acumulados."""
+    agregados = pd.concat(
+        [leer_agregados(dir_historial), _agregar_por_patente(nuevas)],
+        ignore_index=True,
+    )
+    return agregados.groupby("PATENTE", as_index=False).agg(
+        LITROS_TOTALES=("LITROS_TOTALES", "sum"),
+        CARGAS=("CARGAS", "sum"),
+        FECHA_MIN=("FECHA_MIN", "min"),
+        FECHA_MAX=("FECHA_MAX", "max"),
+    )
+
+
+def _lotes_cubiertos(dir_historial):
+    """Lotes que cubren el índice, el cubo y los agregados (derivados.json)."""
+    try:
+        with open(_ruta_estado(dir_historial), encoding="utf-8") as f:
+            return tuple(json.load(f)["lotes"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def _anotar_lotes(dir_historial):
+    destino = _ruta_estado(dir_historial)
+    tmp = os.path.join(dir_historial, ".derivados.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"lotes": list(version_historial(dir_historial))}, f, indent=1)
+    os.replace(tmp, destino)
+
+
+def reconstruir_derivados(dir_historial=DIR_HISTORIAL):
+    """
+    Rearma índice de claves, cubo y agregados desde los lotes guardados (la
+    primera vez, después de una ingesta cortada a mitad o si se borró un
+    lote). Lee el historial completo: es la única operación O(historial).
+    Los meses que ya no tienen transacciones se borran del índice y del cubo.
+    """
+    columnas = ["CLAVE", "FECHA", "PATENTE", "ESTABLECIMIENTO", "LITROS", "IMP TOT PVP ESTABLECIMIENTO"]
+    transacciones = leer_transacciones(dir_historial, columnas)
+    indice = _indice_plegado(transacciones, dir_historial, reemplazar=True)
+    cubo = _cubo_plegado(_celdas(transacciones), dir_historial, reemplazar=True)
+    agregados = (_agregar_por_patente(transacciones), _ruta_agregados(dir_historial))
+    _publicar(indice + cubo + [agregados])
+    _podar_particiones(_ruta_indice(dir_historial), indice)
+    _podar_particiones(_ruta_cubo(dir_historial), cubo)
+    _anotar_lotes(dir_historial)
+
+
+def ingerir_consumo(df_export, dir_historial=DIR_HISTORIAL):
+    """
+    Agrega al historial las transacciones de `df_export` (consumo normalizado,
+    ver ingesta.normalizar_consumo) que todavía no estén guardadas.
+
+    Devuelve un dict con la cantidad de filas leídas, nuevas y duplicadas.
+    """
+    carpeta = _ruta_transacciones(dir_historial)
+    os.makedirs(carpeta, exist_ok=True)
+    if _lotes_cubiertos(dir_historial) != version_historial(dir_historial):
+        reconstruir_derivados(dir_historial)
+
+    lote = df_export.assign(CLAVE=clave_transaccion(df_export))
+    guardadas = _leer_indice(_meses(lote["FECHA"]).unique(), dir_historial)
+    nuevas = lote[~np.isin(_huellas(lote["CLAVE"]), guardadas)]
+
+    resumen = {
+        "leidas": len(lote),
+        "nuevas": len(nuevas),
+        "duplicadas": len(lote) - len(nuevas),
+    }
+    if nuevas.empty:
+        return resumen
+
+    # Primero el lote (la fuente de verdad), después sus derivados; el
+    # anotado de lotes cubiertos cierra la ingesta
+    nuevas = _ajustar_esquema(nuevas)
+    sello = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    escrituras = [(nuevas, os.path.join(carpeta, f"lote_{sello}.parquet"))]
+    escrituras += _indice_plegado(nuevas, dir_historial, reemplazar=False)
+    escrituras += _cubo_plegado(_celdas(nuevas), dir_historial, reemplazar=False)
+    escrituras.append((_agregados_plegados(nuevas, dir_historial), _ruta_agregados(dir_historial)))
+    _publicar(escrituras)
+    _anotar_lotes(dir_historial)
+
+    return resumen
+
+
+def ingerir_archivo(ruta, dir_historial=DIR_HISTORIAL, hash_contenido=None):
+    """Lee una exportación consumo_real (vía sidecar proyectado) y la ingiere."""
+    if hash_contenido is None:
+        hash_contenido = hash_archivo(ruta)
+    df = leer_tabla(ruta, "consumo", hash_contenido, columnas=COLUMNAS_EXPORTACION, streaming=True)
+    return ingerir_consumo(df, dir_historial)
+
+
+if __name__ == "__main__":
+    for ruta in sys.argv[1:]:
+        r = ingerir_archivo(ruta, historial_de(os.path.dirname(ruta)))
+        print(f"{ruta}: {r['nuevas']} nuevas, {r['duplicadas']} ya cargadas (de {r['leidas']})")
@@ -0,0 +1,293 @@
+# ==========================
+# INGESTA DE PLANILLAS
+# ==========================
+#
+# Cada xlsx se parsea con openpyxl una única vez por contenido: las columnas
+# se resuelven con el registro de esquemas.py y el resultado normalizado (con
+# la política de tipos de tipos.py) se guarda como sidecar Parquet tipado en
+# DIR_CACHE. Las lecturas siguientes lo leen con proyección de columnas, sin
+# tocar openpyxl.
+#
+# Para exportaciones grandes del proveedor de tarjetas existe además un modo
+# streaming (openpyxl read-only) que materializa sólo las columnas pedidas;
+# es el que usa la ingesta al historial, con las columnas que éste guarda.
+
+import hashlib
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from consumo_engine.esquemas import ErrorEsquema, mapeo_archivo, renombrar
+from consumo_engine.tipos import compactar
+
+DIR_CACHE = ".cache_consumo"
+
+
+def to_num_col(s):
+    if pd.api.types.is_numeric_dtype(s):
+        return s.astype("float64")
+    return pd.to_numeric(
+        s.astype(str).str.replace(",", ".", regex=False),
+        errors="coerce",
+    )
+
+
+def hash_archivo(ruta):
+    """SHA-1 del contenido del archivo, leído por bloques."""
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+# ==========================
+# NORMALIZACIÓN POR TIPO DE ARCHIVO
+# ==========================
+
+# Reciben las columnas ya renombradas por el registro (esquemas.py)
+
+def normalizar_consumo(df):
+    # Tolera subconjuntos de columnas (lectura streaming con proyección)
+    if "LITROS" in df.columns:
+        df["LITROS"] = to_num_col(df["LITROS"])
+    if "PATENTE" in df.columns:
+        df["PATENTE"] = df["PATENTE"].astype(str).str.upper().str.strip()
+    if "FECHA" in df.columns:
+        df["FECHA"] = pd.to_datetime(df["FECHA"], dayfirst=True, errors="coerce")
+    if "ODOMETRO" in df.columns:
+        df["ODOMETRO"] = to_num_col(df["ODOMETRO"])
+    return df
+
+
+def normalizar_km(df):
+    df["KM_RECORRIDOS"] = to_num_col(df["KM_RECORRIDOS"])
+    df["PATENTE"] = df["PATENTE"].astype(str).str.upper().str.strip()
+    return df
+
+
+def normalizar_nomina(df):
+    df.columns = [str(c).upper() for c in df.columns]
+    df["LITROS_100KM"] = to_num_col(df["LITROS_100KM"])
+    df["PATENTE"] = df["PATENTE"].astype(str).str.upper().str.strip()
+    return df
+
+
+def normalizar_tanques(df):
+    df["CAPACIDAD_L"] = to_num_col(df["CAPACIDAD_L"])
+    df["MODELO"] = df["MODELO"].astype(str).str.strip()
+    return df
+
+
+NORMALIZADORES = {
+    "consumo": normalizar_consumo,
+    "km": normalizar_km,
+    "nomina": normalizar_nomina,
+    "tanques": normalizar_tanques,
+}
+
+
+# ==========================
+# LECTURA STREAMING CON PROYECCIÓN
+# ==========================
+
+def leer_xlsx_columnas(ruta, columnas, hoja=None):
+    """
+    Recorre la hoja en modo read-only y arma un DataFrame sólo con `columnas`
+    (nombres originales del encabezado). La memoria y el tiempo de armado
+    escalan con las columnas pedidas, no con las que exporta el proveedor.
+    """
+    wb = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        ws = wb[hoja] if hoja else wb.worksheets[0]
+        filas = ws.iter_rows(values_only=True)
+        encabezado = [str(c).strip() if c is not None else "" for c in next(filas, ())]
+
+        faltantes = [c for c in columnas if c not in encabezado]
+        if faltantes:
+            raise KeyError(
+                f"{os.path.basename(ruta)}: faltan columnas " + ", ".join(faltantes)
+            )
+
+        indices = [encabezado.index(c) for c in columnas]
+        valores = [[] for _ in columnas]
+        for fila in filas:
+            if fila is None or all(v is None for v in fila):
+                continue
+            for destino, i in zip(valores, indices):
+                destino.append(fila[i] if i < len(fila) else None)
+    finally:
+        wb.close()
+
+    return pd.DataFrame(dict(zip(columnas, valores)), columns=columnas)
+
+
+def columnas_origen(mapeo, columnas):
+    """Traduce nombres canónicos a los del encabezado original."""
+    faltantes = [c for c in columnas if c not in mapeo]
+    if faltantes:
+        raise ErrorEsquema(
+            "columnas no reconocidas en el encabezado: " + ", ".join(faltantes),
+            faltantes=faltantes,
+        )
+    return [mapeo[c] for c in columnas]
+
+
+# ==========================
+# SIDECAR PARQUET
+# ==========================
+
+def ruta_sidecar(ruta, hash_contenido, columnas=None):
+    """
+    Sidecar completo: <base>.<hash>.parquet. Los sidecars parciales del modo
+    streaming llevan además una etiqueta con el conjunto de columnas.
+    """
+    carpeta = os.path.join(os.path.dirname(os.path.abspath(ruta)), DIR_CACHE)
+    base = os.path.splitext(os.path.basename(ruta))[0]
+    nombre = f"{base}.{hash_contenido[:16]}"
+    if columnas:
+        etiqueta = hashlib.sha1("|".join(sorted(columnas)).encode()).hexdigest()[:8]
+        nombre += f".p{etiqueta}"
+    return os.path.join(carpeta, nombre + ".parquet")
+
+
+def _tipar_para_parquet(df):
+    """Columnas object con tipos mezclados (ej. remitos numéricos y texto) → texto."""
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype == "object":
+            no_nulos = df[c].dropna()
+            if not no_nulos.map(type).eq(str).all():
+                df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    df.columns = [str(c) for c in df.columns]
+    return df
+
+
+def _escribir_sidecar(df, destino, base, hash_contenido):
+    carpeta = os.path.dirname(destino)
+    os.makedirs(carpeta, exist_ok=True)
+
+    tmp = destino + ".tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, destino)
+
+    # Sidecars de versiones anteriores del mismo archivo ya no sirven
+    patron = re.compile(re.escape(base) + r"\.([0-9a-f]{16})(\.p[0-9a-f]{8})?\.parquet")
+    for nombre in os.listdir(carpeta):
+        m = patron.fullmatch(nombre)
+        if m and m.group(1) != hash_contenido[:16]:
+            os.remove(os.path.join(carpeta, nombre))
+
+
+def leer_tabla(ruta, tipo, hash_contenido=None, columnas=None, streaming=False):
+    """
+    Devuelve la planilla normalizada, desde el sidecar Parquet si existe.
+
+    Con streaming=True (requiere `columnas`; sólo consumo) el xlsx se
+    recorre en modo read-only materializando sólo esas columnas, y el
+    sidecar guardado es parcial.
+    """
+    if hash_contenido is None:
+        hash_contenido = hash_archivo(ruta)
+    base = os.path.splitext(os.path.basename(ruta))[0]
+
+    sidecar = ruta_sidecar(ruta, hash_contenido)
+    if os.path.exists(sidecar):
+        try:
+            return compactar(pd.read_parquet(sidecar, columns=columnas))
+        except Exception:
+            pass  # sidecar corrupto o de otra versión: se regenera
+
+    # Esquema validado con sólo el encabezado, antes de parsear la planilla
+    mapeo = mapeo_archivo(os.path.abspath(ruta), tipo, hash_contenido)
+
+    if streaming and columnas and tipo == "consumo":
+        sidecar = ruta_sidecar(ruta, hash_contenido, columnas)
+        if os.path.exists(sidecar):
+            try:
+                return compactar(pd.read_parquet(sidecar, columns=columnas))
+            except Exception:
+                pass
+        # Las opcionales que no vinieron quedan vacías, como en el esquema
+        presentes = [c for c in columnas if c in mapeo]
+        crudo = leer_xlsx_columnas(ruta, columnas_origen(mapeo, presentes))
+        crudo.columns = presentes
+        crudo = crudo.reindex(columns=columnas)
+    else:
+        crudo = renombrar(pd.read_excel(ruta), tipo, os.path.basename(ruta))
+
+    df = compactar(_tipar_para_parquet(NORMALIZADORES[tipo](crudo)))
+    try:
+        _escribir_sidecar(df, sidecar, base, hash_contenido)
+    except Exception:
+        pass  # sin permisos de escritura: seguimos sólo con el xlsx
+
+    return df[columnas] if columnas else df
+
+
+# ==========================
+# PRECARGA EN PARALELO
+# ==========================
+
+def sidecar_listo(ruta, hash_contenido, columnas=None):
+    """True si la lectura de `columnas` ya no necesita parsear el xlsx."""
+    if os.path.exists(ruta_sidecar(ruta, hash_contenido)):
+        return True
+    return bool(columnas) and os.path.exists(ruta_sidecar(ruta, hash_contenido, columnas))
+
+
+def _leer_cronometrado(tarea):
+    ruta, tipo, hash_contenido, columnas = tarea
+    inicio = time.perf_counter()
+    leer_tabla(ruta, tipo, hash_contenido, columnas, streaming=columnas is not None)
+    return time.perf_counter() - inicio
+
+
+def preparar_sidecars(tareas, max_procesos=None):
+    """
+    Garantiza el sidecar de cada (ruta, tipo, hash, columnas). Con
+    `columnas` la tarea es la lectura streaming de leer_tabla y deja un
+    sidecar parcial; con None, la lectura completa. Los xlsx que haya que
+    parsear se procesan en paralelo en un pool de procesos (openpyxl es
+    CPU-bound y no libera el GIL), así que el tiempo total se acerca al del
+    archivo más lento en vez de a la suma.
+
+    Devuelve (DataFrame ARCHIVO, TIPO, ORIGEN ("xlsx"/"sidecar"), SEGUNDOS;
+    segundos de reloj totales). Los segundos de un sidecar son los de la
+    misma lectura que hace después el cálculo.
+    """
+    inicio_total = time.perf_counter()
+    tareas = list(tareas)
+    pendientes = [t for t in tareas if not sidecar_listo(t[0], t[2], t[3])]
+
+    segundos = {}
+    procesos = min(len(pendientes), max_procesos or os.cpu_count() or 1)
+    if procesos > 1:
+        # "spawn": el servidor de Streamlit tiene hilos y fork no es seguro
+        contexto = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+                for tarea, seg in zip(pendientes, pool.map(_leer_cronometrado, pendientes)):
+                    segundos[tarea[0]] = seg
+        except (BrokenProcessPool, OSError):
+            pass  # sin procesos disponibles: lo que falte se lee en serie
+
+    for tarea in pendientes:
+        if tarea[0] not in segundos:
+            segundos[tarea[0]] = _leer_cronometrado(tarea)
+
+    filas = []
+    for tarea in tareas:
+        ruta, tipo = tarea[:2]
+        if ruta in segundos:
+            filas.append((os.path.basename(ruta), tipo, "xlsx", segundos[ruta]))
+        else:
+            filas.append((os.path.basename(ruta), tipo, "sidecar", _leer_cronometrado(tarea)))
+    tabla = pd.DataFrame(filas, columns=["ARCHIVO", "TIPO", "ORIGEN", "SEGUNDOS"])
+    return tabla, time.perf_counter() - inicio_total
@@ -0,0 +1,120 @@
+# ==========================
+# LÍNEAS DE BASE POR UNIDAD
+# ==========================
+#
+# Referencia dinámica además del LITROS_100KM fijo de la nómina: el consumo
+# de la propia unidad en las últimas 4 y 12 semanas. Cada período calculado
+# deja sus totales por PATENTE en el historial:
+#
+#   historial/lineas_base/periodo=<clave>.parquet   (PATENTE, FIN, LITROS, KM)
+#
+# y la línea de base de un período nuevo se arma sólo con las particiones
+# cuyo FIN cae en la ventana anterior a su INICIO (el nombre alcanza para
+# elegirlas): el costo crece con el período nuevo, no con la historia.
+# Consumo de la ventana = litros sumados / km sumados, no promedio de ratios.
+
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from consumo_engine.historial import DIR_HISTORIAL
+
+# Nombre de la ventana → días hacia atrás desde el inicio del período
+VENTANAS = {"4S": 28, "12S": 84}
+
+COLUMNAS_AGREGADO = ["PATENTE", "FIN", "LITROS", "KM"]
+
+
+def _ruta_lineas_base(dir_historial):
+    return os.path.join(dir_historial, "lineas_base")
+
+
+def columnas_linea_base():
+    """Columnas que linea_base_periodo agrega por unidad."""
+    return ["PATENTE"] + [
+        c for v in VENTANAS for c in (f"CONSUMO_{v}_L_100KM", f"PERIODOS_{v}")
+    ]
+
+
+def agregado_periodo(df_final, fin):
+    """
+    Totales del período por PATENTE para la historia: sólo unidades con
+    litros y una distancia confiable (CONFIANZA_KM distinta de BAJA/SIN KM).
+    """
+    ok = (
+        (df_final["KM_RECORRIDOS"] > 0)
+        & (df_final["LITROS_TOTALES"] > 0)
+        & ~df_final["CONFIANZA_KM"].isin(["BAJA", "SIN KM"])
+    )
+    return pd.DataFrame({
+        "PATENTE": df_final.loc[ok, "PATENTE"].astype(str).to_numpy(),
+        "FIN": pd.Timestamp(fin),
+        "LITROS": df_final.loc[ok, "LITROS_TOTALES"].astype("float64").to_numpy(),
+        "KM": df_final.loc[ok, "KM_RECORRIDOS"].astype("float64").to_numpy(),
+    }, columns=COLUMNAS_AGREGADO)
+
+
+def registrar_agregado(agregado, clave, dir_historial=DIR_HISTORIAL):
+    """Guarda (o reemplaza, si cambió) la partición del período `clave`."""
+    carpeta = _ruta_lineas_base(dir_historial)
+    destino = os.path.join(carpeta, f"periodo={clave}.parquet")
+    agregado = agregado.sort_values("PATENTE", ignore_index=True)
+    if os.path.exists(destino):
+        try:
+            if pd.read_parquet(destino).equals(agregado):
+                return
+        except Exception:
+            pass  # partición corrupta: se reescribe
+    os.makedirs(carpeta, exist_ok=True)
+    tmp = destino + ".tmp"
+    agregado.to_parquet(tmp, index=False)
+    os.replace(tmp, destino)
+
+
+def _claves_en_ventana(dir_historial, desde, hasta, excluir):
+    carpeta = _ruta_lineas_base(dir_historial)
+    if not os.path.isdir(carpeta):
+        return []
+    rutas = []
+    for nombre in os.listdir(carpeta):
+        if not (nombre.startswith("periodo=") and nombre.endswith(".parquet")):
+            continue
+        clave = nombre[len("periodo="):-len(".parquet")]
+        fin = datetime.strptime(clave.split("_")[1], "%Y-%m-%d").date()
+        if clave != excluir and desde < fin <= hasta:
+            rutas.append(os.path.join(carpeta, nombre))
+    return rutas
+
+
+def linea_base_periodo(periodo, dir_historial=DIR_HISTORIAL):
+    """
+    CONSUMO_<v>_L_100KM y PERIODOS_<v> por PATENTE para cada ventana de
+    VENTANAS, con los períodos guardados que terminan antes del INICIO de
+    `periodo` (fila del registro de períodos; el propio período no cuenta).
+    """
+    inicio = periodo.INICIO
+    desde = inicio - timedelta(days=max(VENTANAS.values()))
+    rutas = _claves_en_ventana(dir_historial, desde, inicio, periodo.CLAVE)
+    if not rutas:
+        vacia = {c: pd.Series(dtype="float64") for c in columnas_linea_base()}
+        return pd.DataFrame({**vacia, "PATENTE": pd.Series(dtype="object")})[columnas_linea_base()]
+
+    hist = pd.concat([pd.read_parquet(r) for r in rutas], ignore_index=True)
+    dias_antes = (pd.Timestamp(inicio) - hist["FIN"]).dt.days.to_numpy()
+
+    # Una columna por ventana con los litros/km que caen en ella (0 si no)
+    por_ventana = {}
+    for v, dias in VENTANAS.items():
+        dentro = dias_antes < dias
+        por_ventana[f"L_{v}"] = np.where(dentro, hist["LITROS"], 0.0)
+        por_ventana[f"K_{v}"] = np.where(dentro, hist["KM"], 0.0)
+        por_ventana[f"PERIODOS_{v}"] = dentro.astype("int32")
+    sumas = hist[["PATENTE"]].assign(**por_ventana).groupby("PATENTE", as_index=False).sum()
+
+    for v in VENTANAS:
+        sumas[f"CONSUMO_{v}_L_100KM"] = np.where(
+            sumas[f"K_{v}"] > 0, sumas[f"L_{v}"] / sumas[f"K_{v}"] * 100, np.nan
+        )
+    return sumas[columnas_linea_base()]
@@ -0,0 +1,254 @@
+# ==========================
+# CONSUMO POR ODÓMETRO (TANQUE LLENO A TANQUE LLENO)
+# ==========================
+#
+# Segunda fuente de distancia, independiente del GPS: cada carga trae el
+# ODOMETRO tipeado en el surtidor. Ordenando las cargas de combustible por
+# PATENTE y FECHA (AZUL 32 y lubricantes no cuentan: no van al tanque), el
+# tramo de una carga va desde la lectura anterior hasta la suya, y los
+# litros de la carga son los consumidos en ese tramo.
+#
+# Las lecturas se tipean a mano, así que antes de medir se descartan:
+#   - REPETIDA: mismo odómetro que la lectura anterior (carga partida); sus
+#     litros pasan al tramo siguiente.
+#   - ATIPICA: lectura que rompe con la anterior y con la siguiente (dígito
+#     de más o de menos); el tramo se mide entre sus vecinas. Hacen falta
+#     las dos: una lectura sin anterior es PRIMERA LECTURA y una sin
+#     siguiente se mide como cualquier otra.
+# Lo que queda y aún retrocede respecto de la última lectura válida es
+# REGRESION, y el tramo siguiente se mide desde esa última válida, no desde
+# la que retrocedió; lo que avanza más de KM_MAX_TRAMO entre dos cargas,
+# SALTO. Un tramo de menos de KM_MIN_TRAMO, o con más de
+# CONSUMO_MAX_TRAMO_L_100KM, es INVEROSIMIL: ningún camión gasta eso, es
+# una lectura mal tipeada o una carga que no llenó el tanque. Ninguno de
+# los tres entra en el consumo de la unidad. Una caída de
+# más de KM_MAX_TRAMO no es un retroceso sino una lectura anterior mal
+# tipeada sin vecina para detectarla (o un tablero cambiado): la serie
+# vuelve a empezar ahí, como PRIMERA LECTURA.
+#
+# Todo se resuelve con groupby().shift() sobre columnas, sin recorrer filas.
+
+import numpy as np
+import pandas as pd
+
+from consumo_engine.tanques import es_combustible
+from consumo_engine.tipos import codigos
+
+# Más de lo que un camión recorre con un tanque: error de tipeo, no tramo
+KM_MAX_TRAMO = 3000
+# Menos que esto, o más consumo que esto, no es un tramo real
+KM_MIN_TRAMO = 50
+CONSUMO_MAX_TRAMO_L_100KM = 200
+
+ESTADOS_TRAMO = [
+    "OK",
+    "PRIMERA LECTURA",
+    "REGRESION",
+    "SALTO",
+    "INVEROSIMIL",
+    "ATIPICA",
+    "REPETIDA",
+    "SIN ODOMETRO",
+]
+TIPO_ESTADO_TRAMO = pd.CategoricalDtype(ESTADOS_TRAMO)
+
+COLUMNAS_TRAMOS = [
+    "PATENTE",
+    "FECHA",
+    "LITROS",
+    "ODOMETRO",
+    "KM_TRAMO",
+    "LITROS_TRAMO",
+    "CONSUMO_TRAMO_L_100KM",
+    "ESTADO_TRAMO",
+]
+
+
+def _diferencia(valores, grupos, mascara, periodos=1):
+    """
+    valores - valores desplazados `periodos` lugares dentro de cada grupo,
+    considerando sólo las filas de `mascara` (NaN en el resto).
+    """
+    sub = valores[mascara]
+    previo = sub.groupby(grupos[mascara], observed=True, sort=False).shift(periodos)
+    return (sub - previo).reindex(valores.index) * np.sign(periodos)
+
+
+def _maximo_previo(valores, grupos, mascara):
+    """
+    Máximo de `valores` en las filas anteriores de `mascara` dentro de cada
+    grupo (NaN en la primera y fuera de `mascara`).
+    """
+    sub = valores[mascara]
+    g = grupos[mascara]
+    maximo = sub.groupby(g, observed=True, sort=False).cummax()
+    return maximo.groupby(g, observed=True, sort=False).shift(1).reindex(valores.index)
+
+
+def _fuera_de_rango(km, km_max):
+    """Tramo negativo o mayor que km_max (NaN: sin vecina, no cuenta)."""
+    return ((km < 0) | (km > km_max)).to_numpy()
+
+
+def tramos_odometro(df, km_max=KM_MAX_TRAMO, km_min=KM_MIN_TRAMO,
+                    consumo_max=CONSUMO_MAX_TRAMO_L_100KM, columnas=()):
+    """
+    Una fila por carga de combustible (PATENTE, FECHA, LITROS, ODOMETRO),
+    ordenadas por PATENTE y FECHA, con KM_TRAMO, LITROS_TRAMO y
+    CONSUMO_TRAMO_L_100KM en los tramos medibles y ESTADO_TRAMO
+    (ESTADOS_TRAMO) en todas. `columnas` de `df` se agregan al final tal
+    cual (ej. el chofer que cerró el tramo).
+    """
+    d = (
+        df.loc[es_combustible(df), ["PATENTE", "FECHA", "LITROS", "ODOMETRO", *columnas]]
+        .sort_values(["PATENTE", "FECHA"], kind="mergesort")
+        .reset_index(drop=True)
+    )
+    pat = d["PATENTE"]
+    odo = d["ODOMETRO"].astype("float64").where(lambda s: s > 0)
+    litros_acum = d["LITROS"].fillna(0).groupby(pat, observed=True, sort=False).cumsum()
+
+    # 1) lecturas repetidas: la carga se suma al tramo siguiente
+    lectura = odo.notna().to_numpy()
+    repetida = lectura & (_diferencia(odo, pat, lectura) == 0).to_numpy()
+
+    # 2) lecturas atípicas: fuera de rango respecto de la anterior y de la
+    #    siguiente; con una sola vecina no se puede decidir cuál está mal
+    candidata = lectura & ~repetida
+    atipica = (
+        candidata
+        & _fuera_de_rango(_diferencia(odo, pat, candidata), km_max)
+        & _fuera_de_rango(_diferencia(odo, pat, candidata, -1), km_max)
+    )
+
+    # 3) series: cada PATENTE, cortada donde el odómetro cae más de km_max
+    base = candidata & ~atipica
+    corte = base & (_diferencia(odo, pat, base) < -km_max).to_numpy()
+    serie = pd.Series(
+        codigos(pat) * (len(d) + 1) + np.cumsum(corte), index=d.index
+    )
+
+    # 4) regresiones: por debajo de la última lectura válida de la serie.
+    #    Las válidas no bajan nunca, así que es el máximo de las anteriores
+    previo = _maximo_previo(odo, serie, base)
+    regresion = base & (odo < previo).to_numpy()
+
+    # 5) tramos entre lecturas válidas; los litros son los acumulados desde
+    #    la lectura anterior (incluye las cargas sin odómetro, repetidas o
+    #    que retrocedieron)
+    base &= ~regresion
+    km = _diferencia(odo, serie, base)
+    litros = _diferencia(litros_acum, serie, base)
+
+    estado = np.select(
+        [
+            ~lectura,
+            repetida | (base & (km == 0).to_numpy()),
+            atipica,
+            regresion,
+            base & km.isna().to_numpy(),
+            base & (km > km_max).to_numpy(),
+            base & ((km < km_min) | (litros * 100 > consumo_max * km)).to_numpy(),
+        ],
+        [ESTADOS_TRAMO.index(e) for e in
+         ["SIN ODOMETRO", "REPETIDA", "ATIPICA", "REGRESION", "PRIMERA LECTURA", "SALTO",
+          "INVEROSIMIL"]],
+        default=ESTADOS_TRAMO.index("OK"),
+    )
+    d["ESTADO_TRAMO"] = pd.Categorical.from_codes(estado.astype("int8"), dtype=TIPO_ESTADO_TRAMO)
+
+    ok = estado == ESTADOS_TRAMO.index("OK")
+    # En una regresión, KM_TRAMO es cuánto retrocedió (negativo)
+    d["KM_TRAMO"] = km.where(base, (odo - previo).where(regresion))
+    d["LITROS_TRAMO"] = litros.where(base)
+    d["CONSUMO_TRAMO_L_100KM"] = (d["LITROS_TRAMO"] / d["KM_TRAMO"] * 100).where(ok)
+    return d[COLUMNAS_TRAMOS + list(columnas)]
+
+
+def resumen_odometro(tramos):
+    """
+    Por PATENTE: KM_ODOMETRO, LITROS_ODOMETRO y CONSUMO_ODOMETRO_L_100KM
+    sobre los tramos OK, TRAMOS_ODOMETRO (cantidad de tramos OK) y
+    REGRESIONES_ODOMETRO.
+    """
+    ok = tramos["ESTADO_TRAMO"] == "OK"
+    resumen = (
+        tramos.assign(
+            KM_ODOMETRO=tramos["KM_TRAMO"].where(ok),
+            LITROS_ODOMETRO=tramos["LITROS_TRAMO"].where(ok),
+            TRAMOS_ODOMETRO=ok.astype("int32"),
+            REGRESIONES_ODOMETRO=(tramos["ESTADO_TRAMO"] == "REGRESION").astype("int32"),
+        )
+        .groupby("PATENTE", as_index=False, observed=True)
+        [["KM_ODOMETRO", "LITROS_ODOMETRO", "TRAMOS_ODOMETRO", "REGRESIONES_ODOMETRO"]]
+        .sum()
+    )
+    resumen["CONSUMO_ODOMETRO_L_100KM"] = np.where(
+        resumen["KM_ODOMETRO"] > 0,
+        resumen["LITROS_ODOMETRO"] / resumen["KM_ODOMETRO"] * 100,
+        np.nan,
+    )
+    return resumen
+
+
+# ==========================
+# CONCILIACIÓN GPS / ODÓMETRO
+# ==========================
+#
+# KM_RECORRIDOS pasa a ser la distancia confiable del período. El odómetro
+# con al menos MIN_TRAMOS tramos OK confirma el GPS (ALTA), lo contradice
+# (BAJA) o lo reemplaza cuando el GPS no trae distancia (ODOMETRO). En BAJA
+# se usa el odómetro: sus tramos pasaron uno a uno los filtros de arriba y
+# el GPS no tiene ninguno (un equipo que suma un millón de km en una semana
+# sigue siendo "distancia"). Sólo GPS es MEDIA; sin ninguna de las dos, SIN
+# KM, y la unidad queda en ERROR DE KM si cargó. Como los tramos OK
+# no cubren todas las cargas, el odómetro se compara extrapolado a todos
+# los litros del período: KM_ODOMETRO_EST = LITROS_TOTALES × 100 /
+# CONSUMO_ODOMETRO_L_100KM, con lo que CONSUMO_REAL_L_100KM de una unidad
+# medida por odómetro es su consumo tramo a tramo.
+
+# Diferencia relativa máxima entre GPS y odómetro para confirmarse
+TOLERANCIA_KM = 0.15
+# Tramos OK mínimos para que el odómetro cuente como fuente
+MIN_TRAMOS = 2
+
+CONFIANZAS_KM = ["ALTA", "MEDIA", "BAJA", "ODOMETRO", "SIN KM"]
+TIPO_CONFIANZA_KM = pd.CategoricalDtype(CONFIANZAS_KM)
+
+
+def conciliar_km(df_final, tolerancia=TOLERANCIA_KM, min_tramos=MIN_TRAMOS):
+    """
+    Copia de df_final (con las columnas de resumen_odometro) con KM_GPS
+    (distancia original), KM_ODOMETRO_EST, CONFIANZA_KM y KM_RECORRIDOS
+    reemplazado por la distancia elegida.
+    """
+    df = df_final.copy()
+    gps = df["KM_RECORRIDOS"].to_numpy(dtype="float64")
+    litros = df["LITROS_TOTALES"].to_numpy(dtype="float64")
+    consumo_odo = df["CONSUMO_ODOMETRO_L_100KM"].to_numpy(dtype="float64")
+    tramos = df["TRAMOS_ODOMETRO"].fillna(0).to_numpy()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        odo = np.where(
+            (tramos >= min_tramos) & (consumo_odo > 0), litros * 100 / consumo_odo, np.nan
+        )
+        coinciden = np.abs(gps / odo - 1) <= tolerancia
+
+    hay_gps = gps > 0
+    hay_odo = odo > 0
+    codigos = np.select(
+        [
+            hay_gps & hay_odo & coinciden,
+            hay_gps & ~hay_odo,
+            hay_gps & hay_odo,
+            hay_odo,
+        ],
+        [CONFIANZAS_KM.index(c) for c in ["ALTA", "MEDIA", "BAJA", "ODOMETRO"]],
+        default=CONFIANZAS_KM.index("SIN KM"),
+    )
+
+    df["KM_GPS"] = gps
+    df["KM_ODOMETRO_EST"] = odo
+    df["CONFIANZA_KM"] = pd.Categorical.from_codes(codigos.astype("int8"), dtype=TIPO_CONFIANZA_KM)
+    df["KM_RECORRIDOS"] = np.where(hay_odo & ~(hay_gps & coinciden), odo, gps)
+    return df
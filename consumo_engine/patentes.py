@@ -0,0 +1,196 @@
+# ==========================
+# PATENTES
+# ==========================
+#
+# Validación vectorizada y canonicalización. Las exportaciones de tarjeta y
+# GPS traen patentes como "AE 418 OT", "ae-418-ot" o con O/0 e I/1
+# cruzados; en vez de descartar esas filas (y sus litros), se recuperan:
+#   1. separadores y caracteres sueltos fuera, en mayúsculas;
+#   2. si aún no valida, O↔0 e I↔1 según la posición (letra o dígito) de
+#      cada formato, aceptado sólo si el resultado está en la nómina;
+#   3. cada corrección queda en un diccionario persistente (JSON editable a
+#      mano, motivo "manual") que se consulta antes de recalcular.
+#
+# corregir_patentes y canonicalizar no escriben: reciben las correcciones
+# ya guardadas y devuelven las que usaron. Quien orquesta el cálculo suma
+# las nuevas al diccionario con registrar_correcciones.
+#
+# Todo corre sobre los valores distintos, nunca fila por fila.
+
+import json
+import os
+import re
+from itertools import groupby
+
+import pandas as pd
+
+from consumo_engine.historial import DIR_HISTORIAL
+
+# Formato viejo ABC123 o nuevo (Mercosur) AB123CD, en un único patrón
+PATRON_PATENTE = re.compile(r"[A-Z]{3}[0-9]{3}|[A-Z]{2}[0-9]{3}[A-Z]{2}")
+
+RUTA_CORRECCIONES = os.path.join(DIR_HISTORIAL, "correcciones_patentes.json")
+
+# Posiciones de letra (L) y dígito (D) de cada formato, por largo
+FORMATOS = {6: "LLLDDD", 7: "LLDDDLL"}
+A_LETRA = str.maketrans("01", "OI")
+A_DIGITO = str.maketrans("OI", "01")
+
+COLUMNAS_REPORTE = ["TABLA", "ORIGINAL", "CORREGIDA", "MOTIVO", "FILAS"]
+
+
+def es_patente_valida(p):
+    """
+    Valida patentes argentinas formato viejo AAA123 o nuevo AA123BB.
+    Referencia escalar de mascara_patentes (ver tests/test_patentes.py).
+    """
+    if pd.isna(p):
+        return False
+    return PATRON_PATENTE.fullmatch(str(p).strip().upper()) is not None
+
+
+def mascara_patentes(s):
+    """
+    Versión vectorizada de es_patente_valida: Serie booleana con el índice
+    de `s`. En columnas category el patrón corre sólo sobre las categorías.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        validas = mascara_patentes(pd.Series(s.cat.categories)).to_numpy()
+        codigos = s.cat.codes.to_numpy()
+        return pd.Series((codigos >= 0) & validas[codigos], index=s.index)
+    return (
+        s.astype("string").str.strip().str.upper()
+        .str.fullmatch(PATRON_PATENTE)
+        .fillna(False).astype(bool)
+    )
+
+
+# ==========================
+# CANONICALIZACIÓN
+# ==========================
+
+def limpiar_patentes(s):
+    """Mayúsculas y sólo letras/dígitos: "ae-418 ot" → "AE418OT"."""
+    return s.astype("string").str.upper().str.replace(r"[^A-Z0-9]", "", regex=True)
+
+
+def _cruzar_confusiones(limpias):
+    """Aplica O↔0 / I↔1 según la posición de letra o dígito del formato."""
+    resultado = limpias.copy()
+    for largo, formato in FORMATOS.items():
+        del_largo = (limpias.str.len() == largo).fillna(False).to_numpy()
+        if not del_largo.any():
+            continue
+        partes, inicio = [], 0
+        for tipo, tramo in groupby(formato):
+            n = len(list(tramo))
+            trozo = limpias[del_largo].str.slice(inicio, inicio + n)
+            partes.append(trozo.str.translate(A_LETRA if tipo == "L" else A_DIGITO))
+            inicio += n
+        resultado[del_largo] = partes[0].str.cat(partes[1:])
+    return resultado
+
+
+def leer_correcciones(ruta=RUTA_CORRECCIONES):
+    """{original: (patente, motivo)} del diccionario persistente."""
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return {k: tuple(v) for k, v in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def guardar_correcciones(correcciones, ruta=RUTA_CORRECCIONES):
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    tmp = ruta + ".tmp"
+    # Una corrección por línea, para poder revisarlo y editarlo a mano
+    lineas = [
+        f" {json.dumps(k, ensure_ascii=False)}: {json.dumps(list(v), ensure_ascii=False)}"
+        for k, v in sorted(correcciones.items())
+    ]
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("{\n" + ",\n".join(lineas) + "\n}\n")
+    os.replace(tmp, ruta)
+
+
+def corregir_patentes(valores, conocidas=(), guardadas=None):
+    """
+    Corrección de cada valor distinto de `valores` que no valida tal cual.
+    Devuelve {original: (patente, motivo)} sólo con los recuperados; las de
+    `guardadas` (ver leer_correcciones) tienen prioridad sobre recalcular.
+    """
+    distintos = pd.Series(pd.unique(pd.Series(valores).dropna().astype(str)), dtype="string")
+    invalidos = distintos[~mascara_patentes(distintos).to_numpy()]
+    if invalidos.empty:
+        return {}
+
+    correcciones = guardadas or {}
+    pendientes = invalidos[~invalidos.isin(list(correcciones))]
+    nuevas = {}
+    if not pendientes.empty:
+        limpias = limpiar_patentes(pendientes)
+        por_formato = mascara_patentes(limpias).to_numpy()
+        cruzadas = _cruzar_confusiones(limpias)
+        conocidas = pd.Series(list(conocidas), dtype="string").dropna().unique()
+        por_confusion = (
+            ~por_formato
+            & mascara_patentes(cruzadas).to_numpy()
+            & cruzadas.isin(conocidas).to_numpy()
+        )
+        for mascara, propuesta, motivo in (
+            (por_formato, limpias, "formato"),
+            (por_confusion, cruzadas, "O/0 I/1"),
+        ):
+            nuevas.update(
+                (orig, (corr, motivo))
+                for orig, corr in zip(pendientes[mascara], propuesta[mascara])
+            )
+
+    todas = {**correcciones, **nuevas}
+    return {k: todas[k] for k in invalidos if k in todas}
+
+
+def canonicalizar(s, conocidas=(), guardadas=None, tabla=""):
+    """
+    (s corregida, reporte) con las patentes recuperadas reemplazadas. El
+    reporte tiene TABLA, ORIGINAL, CORREGIDA, MOTIVO y FILAS afectadas; es
+    lo que registrar_correcciones guarda.
+    """
+    correcciones = corregir_patentes(s, conocidas, guardadas)
+    if not correcciones:
+        return s, pd.DataFrame(columns=COLUMNAS_REPORTE)
+
+    mapa = pd.Series({k: v[0] for k, v in correcciones.items()}, dtype="string")
+    valores = s.astype("string")
+    corregida = valores.map(mapa).fillna(valores)
+    corregida = corregida.astype(
+        "category" if isinstance(s.dtype, pd.CategoricalDtype) else s.dtype
+    )
+
+    filas = valores[valores.isin(mapa.index)].value_counts()
+    reporte = pd.DataFrame({
+        "TABLA": tabla,
+        "ORIGINAL": filas.index.astype(str),
+        "CORREGIDA": [correcciones[k][0] for k in filas.index],
+        "MOTIVO": [correcciones[k][1] for k in filas.index],
+        "FILAS": filas.to_numpy(),
+    }, columns=COLUMNAS_REPORTE)
+    return corregida, reporte
+
+
+def registrar_correcciones(reporte, ruta=RUTA_CORRECCIONES):
+    """
+    Suma al diccionario persistente las correcciones de `reporte` (el de
+    canonicalizar) que todavía no estén. Devuelve cuántas agregó.
+    """
+    guardadas = leer_correcciones(ruta)
+    nuevas = {
+        original: (corregida, motivo)
+        for original, corregida, motivo in zip(
+            reporte["ORIGINAL"], reporte["CORREGIDA"], reporte["MOTIVO"]
+        )
+        if original not in guardadas
+    }
+    if nuevas:
+        guardar_correcciones({**guardadas, **nuevas}, ruta)
+    return len(nuevas)
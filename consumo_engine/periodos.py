@@ -0,0 +1,174 @@
+# ==========================
+# REGISTRO DE PERÍODOS DE DISTANCIAS
+# ==========================
+#
+# Cada exportación GPS semanal (distances_<dd>_<mm>_<dd>_<mm>.xlsx, o la
+# variante "distances_26-11 al 03-12.xlsx") se guarda normalizada en un
+# almacén particionado por período:
+#
+#   historial/distancias/periodo=<AAAA-MM-DD>_<AAAA-MM-DD>/<hash>.parquet
+#
+# Así conviven todas las semanas y el tablero elige una sin tocar FILE_KM.
+
+import glob
+import os
+import re
+from datetime import date, datetime
+
+import pandas as pd
+
+from consumo_engine.historial import DIR_HISTORIAL, historial_de
+from consumo_engine.ingesta import hash_archivo, leer_tabla
+
+PATRON_ARCHIVO = "distances_*.xlsx"
+
+# dd?mm[?aaaa] (separador "_", "-" o " al ") dd?mm[?aaaa]
+PATRON_PERIODO = re.compile(
+    r"distances_(\d{1,2})[_-](\d{1,2})(?:[_-](\d{4}))?"
+    r"(?:_|-|\s+al\s+)"
+    r"(\d{1,2})[_-](\d{1,2})(?:[_-](\d{4}))?",
+    re.IGNORECASE,
+)
+
+
+def periodo_desde_nombre(ruta, fechas=None):
+    """
+    (inicio, fin) a partir del nombre del archivo, o None si no lo respeta.
+
+    Si el nombre no trae año, el del fin sale de `fechas` (FECHA mínima y
+    máxima del consumo): el año que deja el fin dentro de ese rango, o lo
+    más cerca posible; si dos años caen adentro, el más reciente. Sin
+    `fechas` no hay año confiable y devuelve None. Un inicio con mes
+    posterior al del fin cae en el año anterior (semana que cruza fin de año).
+    """
+    m = PATRON_PERIODO.search(os.path.basename(ruta))
+    if not m:
+        return None
+    d1, m1, a1, d2, m2, a2 = m.groups()
+
+    if a2:
+        anio_fin = int(a2)
+    elif fechas is None or pd.isna(fechas[0]) or pd.isna(fechas[1]):
+        return None
+    else:
+        anio_fin = _anio_en_rango(int(d2), int(m2), *(pd.Timestamp(f).date() for f in fechas))
+        if anio_fin is None:
+            return None
+    anio_ini = int(a1) if a1 else (anio_fin - 1 if int(m1) > int(m2) else anio_fin)
+    try:
+        return date(anio_ini, int(m1), int(d1)), date(anio_fin, int(m2), int(d2))
+    except ValueError:
+        return None
+
+
+def _anio_en_rango(dia, mes, desde, hasta):
+    """Año de dia/mes más cercano al rango [desde, hasta] (el más reciente si empatan)."""
+    candidatos = []
+    for anio in range(desde.year - 1, hasta.year + 2):
+        try:
+            f = date(anio, mes, dia)
+        except ValueError:  # 29/02 fuera de bisiesto
+            continue
+        distancia = max((desde - f).days, (f - hasta).days, 0)
+        candidatos.append((distancia, -anio))
+    return -min(candidatos)[1] if candidatos else None
+
+
+def clave_periodo(inicio, fin):
+    return f"{inicio:%Y-%m-%d}_{fin:%Y-%m-%d}"
+
+
+def etiqueta_periodo(clave):
+    inicio, fin = (datetime.strptime(x, "%Y-%m-%d") for x in clave.split("_"))
+    return f"{inicio:%d/%m/%Y} – {fin:%d/%m/%Y}"
+
+
+def _ruta_periodo(clave, dir_historial):
+    return os.path.join(dir_historial, "distancias", f"periodo={clave}")
+
+
+# ==========================
+# INGESTA Y LECTURA
+# ==========================
+
+def registrar_distancias(carpeta=".", dir_historial=None, fechas=None):
+    """
+    Ingresa al almacén todo distances_*.xlsx de `carpeta` cuyo contenido no
+    esté ya guardado (en historial_de(carpeta), salvo otro `dir_historial`).
+    `fechas` (FECHA mínima y máxima del consumo) completa el año de los
+    nombres que no lo traen; ver periodo_desde_nombre. Un archivo
+    reemplazado pisa sólo la partición de su período. Devuelve el registro
+    de períodos (ver listar_periodos).
+    """
+    dir_historial = dir_historial or historial_de(carpeta)
+    for ruta in sorted(glob.glob(os.path.join(carpeta, PATRON_ARCHIVO))):
+        periodo = periodo_desde_nombre(ruta, fechas)
+        if periodo is None:
+            continue
+
+        h = hash_archivo(ruta)[:16]
+        destino_dir = _ruta_periodo(clave_periodo(*periodo), dir_historial)
+        destino = os.path.join(destino_dir, f"{h}.parquet")
+        if os.path.exists(destino):
+            continue
+
+        df = leer_tabla(ruta, "km").assign(ARCHIVO=os.path.basename(ruta))
+        os.makedirs(destino_dir, exist_ok=True)
+        tmp = destino + ".tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, destino)
+
+        for nombre in os.listdir(destino_dir):
+            if nombre.endswith(".parquet") and nombre != os.path.basename(destino):
+                os.remove(os.path.join(destino_dir, nombre))
+
+    return listar_periodos(dir_historial)
+
+
+def listar_periodos(dir_historial=DIR_HISTORIAL):
+    """
+    Períodos guardados: CLAVE, INICIO, FIN, HASH y HASTA_CONSUMO, el más
+    reciente primero.
+
+    HASTA_CONSUMO es el último día de cargas que se imputa al período: el día
+    previo al inicio del período siguiente, o NaT (abierto) para el último.
+    Las exportaciones GPS suelen cortarse después de la fecha del nombre, y
+    así ninguna carga entre dos exportaciones queda afuera.
+    """
+    base = os.path.join(dir_historial, "distancias")
+    filas = []
+    if os.path.isdir(base):
+        for nombre in os.listdir(base):
+            if not nombre.startswith("periodo="):
+                continue
+            clave = nombre.split("=", 1)[1]
+            partes = [p for p in os.listdir(os.path.join(base, nombre)) if p.endswith(".parquet")]
+            if not partes:
+                continue
+            inicio, fin = (datetime.strptime(x, "%Y-%m-%d").date() for x in clave.split("_"))
+            filas.append({
+                "CLAVE": clave,
+                "INICIO": inicio,
+                "FIN": fin,
+                "HASH": partes[0][:-len(".parquet")],
+            })
+
+    registro = pd.DataFrame(filas, columns=["CLAVE", "INICIO", "FIN", "HASH"])
+    registro = registro.sort_values("INICIO", ignore_index=True)
+    siguiente = pd.to_datetime(registro["INICIO"]).shift(-1)
+    registro["HASTA_CONSUMO"] = (siguiente - pd.Timedelta(days=1)).dt.date
+    return registro.sort_values("INICIO", ascending=False, ignore_index=True)
+
+
+def leer_distancias(clave, dir_historial=DIR_HISTORIAL, columnas=None):
+    carpeta = _ruta_periodo(clave, dir_historial)
+    return pd.read_parquet(carpeta, columns=columnas)
+
+
+def filtrar_periodo(df, desde, hasta=None, col_fecha="FECHA"):
+    """Filas de `df` con fecha desde `desde` hasta `hasta` (día completo; None = abierto)."""
+    fechas = df[col_fecha]
+    mascara = fechas >= pd.Timestamp(desde)
+    if hasta is not None and not pd.isna(hasta):
+        mascara &= fechas < pd.Timestamp(hasta) + pd.Timedelta(days=1)
+    return df[mascara]
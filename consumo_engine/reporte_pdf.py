@@ -0,0 +1,478 @@
+# ==========================
+# REPORTE PDF
+# ==========================
+#
+# PDF "premium" del tablero (ReportLab), armado sólo a partir de `salida`
+# filtrada: no depende de Streamlit y se puede generar en lote.
+
+from io import BytesIO
+
+import pandas as pd
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.shapes import Drawing, Rect
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import landscape, letter, portrait
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import (
+    Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle,
+)
+
+from consumo_engine.calculo import formato_pesos, resumen_estados
+
+COLOR_ESTADO_HEX = {
+    "NORMAL": "#4CAF50",        # verde
+    "A AUDITAR": "#F44336",     # rojo
+    "DUDOSO": "#1E88E5",        # azul
+    "FALTA CARGA": "#8E24AA",   # violeta
+    "ERROR DE KM": "#FB8C00",   # naranja
+    "SIN MOVIMIENTO": "#9E9E9E",# gris
+    "SIN DATOS": "#FFEB3B",     # amarillo
+}
+
+
+def cuadrado_color(color_hex, size=8):
+    """Devuelve un pequeño cuadrito de color para usar en la tabla del PDF."""
+    d = Drawing(size, size)
+    d.add(Rect(0, 0, size, size, fillColor=colors.HexColor(color_hex), strokeWidth=0))
+    return d
+
+
+def generar_pdf_premium(df, logo=None, resumen=None):
+    """
+    PDF del tablero para `df` (salida o un filtro de ella). `resumen` es el
+    de resumen_estados(df); se calcula si no viene. Devuelve un BytesIO.
+    """
+    buffer = BytesIO()
+
+    if resumen is None:
+        resumen = resumen_estados(df)
+    total = resumen["total"]
+    normal, auditar = resumen["normal"], resumen["auditar"]
+    dudoso, sin_datos = resumen["dudoso"], resumen["sin_datos"]
+    pct_normal = resumen["pct_normal"]
+    resumen_est = resumen["tabla"]
+    num_cols = len(df.columns)
+
+    # Orientación automática según ancho (cantidad de columnas)
+    pagesize = landscape(letter) if num_cols > 8 else portrait(letter)
+
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=pagesize,
+        leftMargin=35,
+        rightMargin=35,
+        topMargin=40,
+        bottomMargin=35,
+    )
+
+    estilos = getSampleStyleSheet()
+    story = []
+
+    # ==========================
+    # HOJA 1 – PORTADA + KPI + GRÁFICO
+    # ==========================
+
+    # Logo (si existe)
+    if logo:
+        img = Image(logo, width=4 * cm, height=4 * cm)
+        img.hAlign = "CENTER"
+        story.append(img)
+        story.append(Spacer(1, 10))
+
+    # Título principal
+    story.append(
+        Paragraph(
+            "<b>Control inteligente de consumo – Grupo BCA</b>", estilos["Title"]
+        )
+    )
+    story.append(Spacer(1, 8))
+
+    # Subtítulo / objetivo
+    story.append(
+        Paragraph(
+            "Reporte técnico generado a partir de los datos filtrados en el tablero semanal.",
+            estilos["Normal"],
+        )
+    )
+    story.append(Spacer(1, 6))
+
+    # Breve introducción
+    story.append(
+        Paragraph(
+            "Este informe resume el desempeño de consumo real versus consumo teórico por unidad y modelo, "
+            "permitiendo identificar desvíos operativos, oportunidades de mejora y posibles inconsistencias de datos.",
+            estilos["Normal"],
+        )
+    )
+    story.append(Spacer(1, 18))
+
+    # KPIs principales
+    story.append(Paragraph("<b>Indicadores principales</b>", estilos["Heading2"]))
+    story.append(Spacer(1, 6))
+    story.append(
+        Paragraph(f"• Unidades en estado NORMAL: {normal}", estilos["Normal"])
+    )
+    story.append(
+        Paragraph(f"• Unidades en estado A AUDITAR: {auditar}", estilos["Normal"])
+    )
+    story.append(
+        Paragraph(f"• Unidades en estado DUDOSO: {dudoso}", estilos["Normal"])
+    )
+    story.append(
+        Paragraph(f"• Unidades SIN DATOS: {sin_datos}", estilos["Normal"])
+    )
+    story.append(
+        Paragraph(
+            f"• Porcentaje de unidades NORMAL: {pct_normal:.1f}%",
+            estilos["Normal"],
+        )
+    )
+    story.append(
+        Paragraph(
+            f"• Pesos en riesgo (exceso de las unidades A AUDITAR): "
+            f"{formato_pesos(resumen['pesos_en_riesgo'])}",
+            estilos["Normal"],
+        )
+    )
+    story.append(Spacer(1, 16))
+
+    # Gráfico de estados
+    if resumen_est is not None and not resumen_est.empty:
+        res = resumen_est.copy()
+        data_vals = res["Cantidad"].tolist()
+        categorias = res["Estado"].tolist()
+
+        story.append(Paragraph("<b>Distribución de estados</b>", estilos["Heading2"]))
+        story.append(Spacer(1, 6))
+
+        drawing_width = doc.width
+        drawing_height = 180
+
+        drawing = Drawing(drawing_width, drawing_height)
+
+        bc = VerticalBarChart()
+        bc.x = 40
+        bc.y = 30
+        bc.width = drawing_width - 80
+        bc.height = 120
+
+        bc.data = [data_vals]
+        bc.categoryAxis.categoryNames = categorias
+        bc.categoryAxis.labels.angle = 0
+        bc.categoryAxis.labels.dy = -8
+        bc.categoryAxis.labels.fontSize = 8
+
+        bc.valueAxis.valueMin = 0
+        bc.bars[0].fillColor = colors.HexColor("#009999")
+
+        bc.barLabelFormat = "%d"
+        bc.barLabels.fontSize = 8
+        bc.barLabels.dy = -3
+
+        drawing.add(bc)
+        story.append(drawing)
+        story.append(Spacer(1, 12))
+
+    # Mini resumen de estados
+    if resumen_est is not None and not resumen_est.empty:
+        story.append(Paragraph("<b>Resumen por estado</b>", estilos["Heading3"]))
+        story.append(Spacer(1, 4))
+        for _, r in resumen_est.iterrows():
+            story.append(
+                Paragraph(
+                    f"• {r['Estado']}: {r['Cantidad']} unidades", estilos["Normal"]
+                )
+            )
+
+    # Salto de página para que la hoja 2 empiece con el Top 5
+    story.append(PageBreak())
+
+    # ==========================
+    # HOJA 2 – TOP 5 + RECOMENDACIONES + TABLA
+    # ==========================
+
+    story.append(
+        Paragraph("<b>Informe técnico – detalle de unidades</b>", estilos["Heading2"])
+    )
+    story.append(Spacer(1, 10))
+
+    # Orden base por MODELO y PATENTE
+    df_sorted = df.sort_values(["MODELO", "PATENTE"], na_position="last").copy()
+
+    # Top 5 unidades críticas
+    story.append(
+        Paragraph(
+            "<b>Top 5 unidades con mayor desvío positivo (A AUDITAR)</b>",
+            estilos["Heading3"],
+        )
+    )
+    story.append(Spacer(1, 6))
+
+    df_crit = df_sorted[df_sorted["ESTADO"] == "A AUDITAR"].sort_values(
+        "DESVIO_LITROS", ascending=False
+    )
+    top5 = df_crit.head(5)
+
+    if top5.empty:
+        story.append(
+            Paragraph(
+                "No se detectaron unidades en estado A AUDITAR dentro del conjunto filtrado.",
+                estilos["Normal"],
+            )
+        )
+    else:
+        for i, r in enumerate(top5.itertuples(), start=1):
+            patente = getattr(r, "PATENTE", "")
+            modelo = getattr(r, "MODELO", "")
+            desvio_l = getattr(r, "DESVIO_LITROS", 0.0)
+            cons_real = getattr(r, "CONSUMO_REAL_L_100KM", float("nan"))
+            cons_teo = getattr(r, "CONSUMO_TEORICO_L_100KM", float("nan"))
+
+            texto = (
+                f"{i}. {patente} ({modelo}) – Desvío: {desvio_l:.1f} litros "
+                f"(Real: {cons_real:.1f} L/100km | Teórico: {cons_teo:.1f} L/100km)"
+            )
+            story.append(Paragraph(texto, estilos["Normal"]))
+
+    story.append(Spacer(1, 14))
+
+    # Recomendaciones automáticas
+    story.append(
+        Paragraph("<b>Recomendaciones automáticas</b>", estilos["Heading3"])
+    )
+    story.append(Spacer(1, 6))
+
+    recs = recomendaciones_automaticas(normal, auditar, dudoso, sin_datos, total)
+    for r in recs:
+        story.append(Paragraph("• " + r, estilos["Normal"]))
+
+    story.append(Spacer(1, 18))
+
+    # Tabla detallada
+    story.append(
+        Paragraph("<b>Detalle de unidades (tabla filtrada)</b>", estilos["Heading3"])
+    )
+    story.append(Spacer(1, 6))
+
+    df_pdf = df_sorted.copy()
+
+    def fmt_val(col, val):
+        if pd.isna(val):
+            return "-"
+        if col in [
+            "KM_RECORRIDOS",
+            "LITROS_TOTALES",
+            "CONSUMO_REAL_L_100KM",
+            "CONSUMO_TEORICO_L_100KM",
+            "LITROS_TEOREICOS_ESPERADOS",
+            "DESVIO_LITROS",
+        ]:
+            return f"{val:.2f}"
+        if col == "DESVIO_PCT":
+            return f"{val * 100:.1f}%"
+        return str(val)
+
+    columnas = [
+        "PATENTE",
+        "MODELO",
+        "KM_RECORRIDOS",
+        "LITROS_TOTALES",
+        "CONSUMO_REAL_L_100KM",
+        "CONSUMO_TEORICO_L_100KM",
+        "LITROS_TEOREICOS_ESPERADOS",
+        "DESVIO_LITROS",
+        "DESVIO_PCT",
+        "ESTADO",
+        "COLOR",
+    ]
+    columnas = [c for c in columnas if c in df_pdf.columns]
+
+    tabla_data = [columnas]
+    for _, row in df_pdf.iterrows():
+        fila = []
+        for col in columnas:
+            if col == "COLOR":
+                est = row.get("ESTADO", "SIN DATOS")
+                hex_col = COLOR_ESTADO_HEX.get(est, "#BDBDBD")
+                fila.append(cuadrado_color(hex_col))
+            else:
+                fila.append(fmt_val(col, row[col]))
+        tabla_data.append(fila)
+
+    col_count = len(columnas)
+    col_width = doc.width / col_count if col_count > 0 else doc.width
+
+    tabla = Table(tabla_data, repeatRows=1, colWidths=[col_width] * col_count)
+    tabla.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#006778")),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, 0), 8),
+                ("FONTSIZE", (0, 1), (-1, -1), 7),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
+                ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
+                ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ]
+        )
+    )
+
+    story.append(tabla)
+    story.append(Spacer(1, 18))
+
+    # ==========================
+    # HOJA FINAL – ANÁLISIS EJECUTIVO TÉCNICO
+    # ==========================
+
+    story.append(PageBreak())
+    story.append(
+        Paragraph("<b>Análisis ejecutivo técnico del consumo</b>", estilos["Heading2"])
+    )
+    story.append(Spacer(1, 10))
+
+    if total > 0:
+        pct_auditar = auditar / total * 100 if total > 0 else 0
+        pct_dudoso = dudoso / total * 100 if total > 0 else 0
+        pct_sin_datos = sin_datos / total * 100 if total > 0 else 0
+
+        modelo_mayor_incidente = "sin modelo predominante"
+        modelo_dudoso_principal = "sin modelo predominante"
+
+        if "MODELO" in df.columns:
+            df_aud = df[df["ESTADO"] == "A AUDITAR"]
+            if not df_aud.empty:
+                modelo_mayor_incidente = df_aud["MODELO"].value_counts().idxmax()
+
+            df_dud = df[df["ESTADO"] == "DUDOSO"]
+            if not df_dud.empty:
+                modelo_dudoso_principal = df_dud["MODELO"].value_counts().idxmax()
+
+        def promedio_seguro(sub, col):
+            sub = sub[col].dropna()
+            return float(sub.mean()) if not sub.empty else float("nan")
+
+        df_norm = df[df["ESTADO"] == "NORMAL"]
+        df_aud = df[df["ESTADO"] == "A AUDITAR"]
+
+        prom_real_norm = promedio_seguro(df_norm, "CONSUMO_REAL_L_100KM")
+        prom_teo_norm = promedio_seguro(df_norm, "CONSUMO_TEORICO_L_100KM")
+
+        prom_real_aud = promedio_seguro(df_aud, "CONSUMO_REAL_L_100KM")
+        prom_teo_aud = promedio_seguro(df_aud, "CONSUMO_TEORICO_L_100KM")
+
+        texto1 = (
+            f"El conjunto analizado muestra un {pct_normal:.1f}% de unidades en estado NORMAL, "
+            f"mientras que un {pct_auditar:.1f}% se encuentra en estado A AUDITAR y un "
+            f"{pct_dudoso:.1f}% en estado DUDOSO. "
+            "Esta distribución refleja una flota con un núcleo estable de desempeño, "
+            "pero con un volumen relevante de unidades que exceden el consumo esperado."
+        )
+
+        texto2 = (
+            f"En el grupo NORMAL, el consumo medio se ubica en torno a "
+            f"{prom_real_norm:.1f} L/100km frente a un teórico de {prom_teo_norm:.1f} L/100km, "
+            "lo que indica un comportamiento alineado a los parámetros de referencia. "
+            f"En contraste, las unidades en estado A AUDITAR presentan un consumo medio de "
+            f"{prom_real_aud:.1f} L/100km versus {prom_teo_aud:.1f} L/100km teóricos, "
+            "configurando un desvío sistemático que justifica investigación operativa."
+        )
+
+        texto3 = (
+            f"Los desvíos se concentran principalmente en el modelo {modelo_mayor_incidente} "
+            "dentro del grupo A AUDITAR, lo que sugiere revisar calibración, condiciones de carga, "
+            "topografía recorrida y hábitos de conducción asociados. "
+            f"En paralelo, el estado DUDOSO, con un {pct_dudoso:.1f}% de unidades, se focaliza en el modelo "
+            f"{modelo_dudoso_principal}, indicando posible subregistro de kilómetros o datos incompletos de GPS."
+        )
+
+        if pct_sin_datos > 0:
+            texto4 = (
+                f"El {pct_sin_datos:.1f}% de unidades en estado SIN DATOS reduce la capacidad analítica del modelo. "
+                "A medida que se incorporen más días de operación con registros completos de kilómetros y combustible, "
+                "los indicadores tenderán a estabilizarse y permitirán una evaluación más fina de la eficiencia "
+                "por ruta, modelo y patrón de uso."
+            )
+        else:
+            texto4 = (
+                "Actualmente no se registran unidades en estado SIN DATOS, lo que refuerza la calidad de la base de "
+                "información. A medida que se incorporen más días de operación, será posible afinar todavía más la "
+                "evaluación de eficiencia por ruta, modelo y patrón de uso."
+            )
+
+        story.append(Paragraph(texto1, estilos["Normal"]))
+        story.append(Spacer(1, 6))
+        story.append(Paragraph(texto2, estilos["Normal"]))
+        story.append(Spacer(1, 6))
+        story.append(Paragraph(texto3, estilos["Normal"]))
+        story.append(Spacer(1, 6))
+        story.append(Paragraph(texto4, estilos["Normal"]))
+        story.append(Spacer(1, 12))
+    else:
+        story.append(
+            Paragraph(
+                "No se generó análisis técnico debido a la ausencia de datos en el conjunto filtrado.",
+                estilos["Normal"],
+            )
+        )
+        story.append(Spacer(1, 12))
+
+    story.append(
+        Paragraph(
+            "Sistema de Control Inteligente de Consumo – Grupo BCA",
+            estilos["Normal"],
+        )
+    )
+
+    doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
+def recomendaciones_automaticas(normal, auditar, dudoso, sin_datos, total):
+    """Genera recomendaciones según la situación general."""
+    if total == 0:
+        return [
+            "No hay datos disponibles en el período analizado. Verificar los archivos de entrada."
+        ]
+
+    recs = []
+
+    pct_normal = normal / total * 100 if total > 0 else 0
+    pct_auditar = auditar / total * 100 if total > 0 else 0
+    pct_dudoso = dudoso / total * 100 if total > 0 else 0
+    pct_sin_datos = sin_datos / total * 100 if total > 0 else 0
+
+    if pct_auditar > 20:
+        recs.append(
+            "Alto porcentaje de unidades en estado A AUDITAR. "
+            "Se recomienda priorizar la revisión de estas unidades, verificando consumo, rutas y condiciones de operación."
+        )
+
+    if pct_dudoso > 10:
+        recs.append(
+            "Existe un número relevante de unidades en estado DUDOSO, con consumos inusualmente bajos. "
+            "Se sugiere revisar la carga de kilómetros, integridad de datos de odómetro y registros GPS."
+        )
+
+    if pct_normal >= 70:
+        recs.append(
+            "La mayoría de las unidades se encuentra en estado NORMAL. "
+            "Se recomienda mantener los procedimientos actuales de operación y monitoreo."
+        )
+
+    if pct_sin_datos > 0:
+        recs.append(
+            "Hay unidades en estado SIN DATOS. "
+            "Conviene revisar los registros de consumo y kilometraje para completar la información."
+        )
+
+    if not recs:
+        recs.append(
+            "La situación general es intermedia. "
+            "Se recomienda monitorear semanalmente y revisar puntualmente las unidades con desvíos."
+        )
+
+    return recs
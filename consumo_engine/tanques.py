@@ -0,0 +1,169 @@
+# ==========================
+# SOBRECARGAS DE TANQUE
+# ==========================
+#
+# Una carga que no entra en el tanque del camión es la señal más directa de
+# combustible desviado. La capacidad por MODELO se mantiene a mano en
+# capacidad_tanques.xlsx, junto a la nómina; `python -m consumo_engine.calculo
+# --plantilla-tanques` la crea con los modelos de la nómina y la capacidad
+# vacía, para completar. Sin la planilla no hay control. Sobre las
+# transacciones de combustible del período, en una sola pasada:
+#   - CARGA SUPERA TANQUE: una carga mayor que la capacidad;
+#   - DIA SUPERA TANQUE: los litros acumulados en el día por TARJETA
+#     (cumsum ordenado por TARJETA y FECHA) pasan la capacidad.
+# Los modelos sin capacidad cargada no se controlan.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from consumo_engine.tipos import codigos, por_categoria
+
+# Margen sobre la capacidad nominal (surtidor, dilatación, caños)
+TOLERANCIA_TANQUE = 0.05
+
+# Productos que van al tanque de combustible (no AZUL 32, lubricantes, etc.)
+PATRON_COMBUSTIBLE = r"DIESEL|GASOIL|INFINIA|EURO|ULTRA|PODIUM|V-POWER|NAFTA|GNC"
+
+TIPOS_EVENTO = ["CARGA SUPERA TANQUE", "DIA SUPERA TANQUE"]
+TIPO_EVENTO = pd.CategoricalDtype(TIPOS_EVENTO)
+
+COLUMNAS_EVENTOS = [
+    "PATENTE",
+    "MODELO",
+    "TARJETA",
+    "FECHA",
+    "PRODUCTO",
+    "LITROS",
+    "LITROS_DIA",
+    "CAPACIDAD_L",
+    "EXCESO_L",
+    "TIPO_EVENTO",
+]
+
+
+def clave_modelo(s):
+    """Modelo comparable: "VOLVO  370" y "Volvo 370" → "VOLVO370"."""
+    return s.astype("string").str.upper().str.replace(r"[^A-Z0-9]", "", regex=True)
+
+
+def plantilla_tanques(df_nom, ruta):
+    """Crea `ruta` con los modelos de la nómina y CAPACIDAD_L vacía, si no existe."""
+    if os.path.exists(ruta) or "MODELO" not in df_nom.columns:
+        return False
+    modelos = pd.Series(df_nom["MODELO"].dropna().astype(str).str.strip().unique())
+    plantilla = pd.DataFrame({
+        "MODELO": modelos.sort_values(ignore_index=True),
+        "CAPACIDAD_L": np.nan,
+    })
+    base, extension = os.path.splitext(ruta)
+    tmp = f"{base}.tmp{extension}"  # openpyxl exige la extensión .xlsx
+    plantilla.to_excel(tmp, index=False, engine="openpyxl")
+    os.replace(tmp, ruta)
+    return True
+
+
+def capacidad_por_patente(df_final, tanques):
+    """CAPACIDAD_L de cada PATENTE de df_final según su MODELO (NaN si falta)."""
+    if tanques is None or "MODELO" not in df_final.columns:
+        return pd.Series(np.nan, index=df_final.index)
+    capacidades = (
+        tanques.assign(CLAVE=clave_modelo(tanques["MODELO"]))
+        .dropna(subset=["CAPACIDAD_L"])
+        .drop_duplicates("CLAVE", keep="last")
+        .set_index("CLAVE")["CAPACIDAD_L"]
+    )
+    return clave_modelo(df_final["MODELO"]).map(capacidades).astype("float64")
+
+
+def es_combustible(df_cons):
+    """Máscara de transacciones de combustible (sin PRODUCTO, todas)."""
+    if "PRODUCTO" not in df_cons.columns:
+        return np.ones(len(df_cons), dtype=bool)
+    combustible = por_categoria(
+        df_cons["PRODUCTO"], lambda p: p.str.contains(PATRON_COMBUSTIBLE, case=False)
+    )
+    return pd.Series(combustible).fillna(True).astype(bool).to_numpy()
+
+
+def codigos_tarjeta(df_cons):
+    """
+    Código entero de la TARJETA de cada transacción; sin número de tarjeta,
+    la de la patente (con códigos aparte).
+    """
+    patente = codigos(df_cons["PATENTE"])
+    if "TARJETA" not in df_cons.columns:
+        return patente
+    tarjeta = codigos(df_cons["TARJETA"])
+    return np.where(tarjeta >= 0, tarjeta, tarjeta.max(initial=-1) + 1 + patente)
+
+
+def eventos_sobrecarga(df_cons, df_final, tolerancia=TOLERANCIA_TANQUE):
+    """
+    Cargas de combustible de `df_cons` que superan la capacidad del tanque
+    (CAPACIDAD_TANQUE_L de df_final), solas o sumadas en el día por TARJETA.
+    EXCESO_L es lo que esa carga agrega por encima de la capacidad: sumado
+    sobre los eventos de un día da el exceso del día.
+    """
+    unidades = df_final[["PATENTE", "MODELO", "CAPACIDAD_TANQUE_L"]].dropna(
+        subset=["CAPACIDAD_TANQUE_L"]
+    )
+    if unidades.empty or df_cons.empty:
+        return pd.DataFrame(columns=COLUMNAS_EVENTOS)
+    unidades = unidades.assign(PATENTE=unidades["PATENTE"].astype(str)).set_index("PATENTE")
+
+    # Capacidad y tipo de producto sobre los valores distintos, no por fila
+    capacidad = por_categoria(
+        df_cons["PATENTE"], lambda p: p.map(unidades["CAPACIDAD_TANQUE_L"])
+    ).astype("float64")
+    filas = np.flatnonzero(~np.isnan(capacidad) & es_combustible(df_cons))
+    if not len(filas):
+        return pd.DataFrame(columns=COLUMNAS_EVENTOS)
+
+    tarjeta = codigos_tarjeta(df_cons)[filas]
+    fecha = df_cons["FECHA"].to_numpy()[filas]
+    dia = fecha.astype("datetime64[D]")
+    litros = df_cons["LITROS"].to_numpy(dtype="float64")[filas]
+    capacidad = capacidad[filas]
+
+    orden = np.lexsort((fecha, tarjeta))
+    litros_dia = (
+        pd.Series(litros[orden])
+        .groupby([tarjeta[orden], dia[orden]], sort=False)
+        .cumsum()
+        .to_numpy()
+    )
+    litros, capacidad, filas = litros[orden], capacidad[orden], filas[orden]
+
+    limite = capacidad * (1 + tolerancia)
+    sola = litros > limite
+    evento = sola | (litros_dia > limite)
+    if not evento.any():
+        return pd.DataFrame(columns=COLUMNAS_EVENTOS)
+
+    # Sólo las filas con evento se materializan
+    eventos = df_cons.iloc[filas[evento]]
+    patentes = eventos["PATENTE"].astype(str).to_numpy()
+    tarjetas = (
+        eventos["TARJETA"].astype("string").fillna(pd.Series(patentes, index=eventos.index))
+        if "TARJETA" in eventos.columns else patentes
+    )
+    salida = pd.DataFrame({
+        "PATENTE": patentes,
+        "MODELO": unidades["MODELO"].reindex(patentes).to_numpy(),
+        "TARJETA": np.asarray(tarjetas, dtype=object),
+        "FECHA": eventos["FECHA"].to_numpy(),
+        "PRODUCTO": (
+            eventos["PRODUCTO"].astype("string").to_numpy() if "PRODUCTO" in eventos.columns
+            else pd.NA
+        ),
+        "LITROS": litros[evento],
+        "LITROS_DIA": litros_dia[evento],
+        "CAPACIDAD_L": capacidad[evento],
+        "EXCESO_L": np.minimum(litros, litros_dia - capacidad)[evento],
+        "TIPO_EVENTO": pd.Categorical.from_codes(
+            np.where(sola[evento], 0, 1).astype("int8"), dtype=TIPO_EVENTO
+        ),
+    })
+    return salida.sort_values("FECHA", ascending=False, kind="mergesort", ignore_index=True)
@@ -0,0 +1,93 @@
+# ==========================
+# POLÍTICA DE TIPOS (DTYPES)
+# ==========================
+#
+# Se aplica al ingerir y al cerrar cada resultado:
+#   - Etiquetas de baja cardinalidad (PATENTE, MODELO, ESTADO, COLOR,
+#     establecimientos, conductores...) → category: filtros y groupbys
+#     trabajan sobre códigos enteros.
+#   - ESTADO usa siempre las mismas categorías (ESTADOS) → códigos int8.
+#   - float32 sólo donde la precisión alcanza: odómetro (enteros < 16M) y
+#     métricas por unidad ya calculadas. Litros, km e importes que se suman
+#     quedan en float64 para no mover clasificaciones en los bordes.
+
+import numpy as np
+import pandas as pd
+
+ESTADOS = [
+    "A AUDITAR",
+    "DUDOSO",
+    "NORMAL",
+    "FALTA CARGA",
+    "ERROR DE KM",
+    "SIN MOVIMIENTO",
+    "SIN DATOS",
+]
+TIPO_ESTADO = pd.CategoricalDtype(ESTADOS)
+
+CATEGORICAS = ["PATENTE", "MODELO", "COLOR"]
+
+FLOAT32 = [
+    "ODOMETRO",
+    "LITROS_100KM",
+    "CONSUMO_REAL_L_100KM",
+    "CONSUMO_TEORICO_L_100KM",
+    "LITROS_TEOREICOS_ESPERADOS",
+    "DESVIO_LITROS",
+    "DESVIO_PCT",
+    "MIN_OK",
+    "MAX_OK",
+    "CONSUMO_ODOMETRO_L_100KM",
+    "CONSUMO_4S_L_100KM",
+    "CONSUMO_12S_L_100KM",
+    "DESVIO_4S_PCT",
+    "DESVIO_12S_PCT",
+    "PRECIO_PROMEDIO",
+    "CAPACIDAD_TANQUE_L",
+    "MEDIANA_MODELO_L_100KM",
+    "Z_ROBUSTO",
+    "PERCENTIL_MODELO",
+]
+
+# Texto con menos de esta proporción de valores distintos pasa a category
+MAX_RATIO_CATEGORIA = 0.5
+
+
+def compactar(df, categoricas=CATEGORICAS, float32=FLOAT32, auto=True):
+    """
+    Aplica la política de tipos a las columnas presentes de `df`. Con
+    auto=True también convierte a category el resto de las columnas de
+    texto de baja cardinalidad.
+    """
+    df = df.copy()
+    for c in df.columns:
+        s = df[c]
+        if c == "ESTADO":
+            df[c] = s.astype(TIPO_ESTADO)
+        elif c in categoricas:
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                df[c] = s.astype("category")
+        elif c in float32:
+            if pd.api.types.is_float_dtype(s):
+                df[c] = s.astype("float32")
+        elif auto and (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)):
+            if len(s) and s.nunique(dropna=True) < MAX_RATIO_CATEGORIA * len(s):
+                df[c] = s.astype("category")
+    return df
+
+
+def por_categoria(s, funcion):
+    """
+    Aplica `funcion` (Serie de texto → array) sólo a los valores distintos de
+    `s` y la expande a todas las filas; NA da NA.
+    """
+    s = s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype("category")
+    valores = pd.Series(funcion(pd.Series(s.cat.categories.astype(str))))
+    return valores.reindex(s.cat.codes.to_numpy()).to_numpy()
+
+
+def codigos(s):
+    """Código entero por valor de `s` (-1 para NA), para ordenar y agrupar."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return s.cat.codes.to_numpy().astype(np.int64)
+    return pd.factorize(s)[0].astype(np.int64)
@@ -0,0 +1,381 @@
+# ==========================
+# VIGILANTE DE LA CARPETA DE DATOS
+# ==========================
+#
+# Trabajo en segundo plano (hilo dentro del servidor o proceso aparte) que
+# mira la carpeta donde se copian las exportaciones. Cuando aparece o cambia
+# consumo_real.xlsx, un distances_*.xlsx, la nómina o la tabla de capacidad
+# de tanques (o se edita historial/correcciones_patentes.json),
+# ingiere lo nuevo, calcula todos los períodos y publica un snapshot completo
+# en el historial de esa misma carpeta (rutas_datos), no en el del
+# directorio desde donde se lanzó:
+#
+#   historial/snapshots/<id>/manifiesto.json
+#   historial/snapshots/<id>/periodo=<clave>/{df_final,salida,inv_*,det_*}.parquet
+#   historial/snapshots/ACTUAL          ← id del último snapshot publicado
+#
+# El snapshot se arma en una carpeta temporal y se publica con os.replace
+# (carpeta y puntero ACTUAL): un lector ve el snapshot anterior o el nuevo
+# entero, nunca uno a medio escribir. El tablero sólo lee lo publicado.
+# Si un recálculo falla, el error (con el archivo y las columnas, si es de
+# esquema) queda en el manifiesto del snapshot vigente hasta el próximo que
+# salga bien.
+#
+# Uso:  python -m consumo_engine.vigilante [carpeta] [--una-vez]
+
+import glob
+import json
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime
+from types import MappingProxyType
+
+import pandas as pd
+
+from consumo_engine.base_datos import (
+    conectar, consultar_invalidas, consultar_transacciones, consultar_unificado,
+    sincronizar_distancias, sincronizar_correcciones, sincronizar_nomina,
+    sincronizar_transacciones,
+)
+from consumo_engine.calculo import (
+    FILE_CONSUMO, FILE_NOMINA, FILE_TANQUES, TOLERANCIA_PCT, cargar, cerrar_periodo,
+    guardar_periodo, procesar_periodo, ruta_correcciones,
+)
+from consumo_engine.esquemas import ErrorEsquema
+from consumo_engine.historial import DIR_HISTORIAL, historial_de
+from consumo_engine.periodos import PATRON_ARCHIVO
+from consumo_engine.tipos import compactar
+
+DIR_SNAPSHOTS = os.path.join(DIR_HISTORIAL, "snapshots")
+INTERVALO_S = 5
+SNAPSHOTS_GUARDADOS = 3  # los anteriores pueden estar siendo leídos todavía
+
+# Sube si cambia el contenido del snapshot: fuerza a recalcular
+FORMATO_SNAPSHOT = 16
+
+TABLAS_INVALIDAS = ["consumo", "km", "nomina", "corregidas"]
+TABLAS_DETALLE = ["tramos", "choferes", "choferes_patentes", "sobrecargas", "frecuencia_cargas"]
+
+_candado = threading.Lock()
+
+
+def rutas_datos(carpeta=".", dir_historial=None, dir_snapshots=None):
+    """
+    (dir_historial, dir_snapshots) de la carpeta de datos: historial/ y
+    historial/snapshots/ dentro de `carpeta`, salvo que se indiquen otros.
+    """
+    dir_historial = dir_historial or historial_de(carpeta)
+    return dir_historial, dir_snapshots or os.path.join(dir_historial, "snapshots")
+
+
+# ==========================
+# HUELLA DE LA CARPETA
+# ==========================
+
+def archivos_vigilados(carpeta="."):
+    rutas = [os.path.join(carpeta, f) for f in (FILE_CONSUMO, FILE_NOMINA, FILE_TANQUES)]
+    rutas += sorted(glob.glob(os.path.join(carpeta, PATRON_ARCHIVO)))
+    return [r for r in rutas if os.path.exists(r)]
+
+
+def _huella(rutas):
+    huella = []
+    for ruta in rutas:
+        info = os.stat(ruta)
+        huella.append([os.path.basename(ruta), info.st_size, info.st_mtime_ns])
+    return huella
+
+
+def _huella_correcciones(dir_historial):
+    ruta = ruta_correcciones(dir_historial)
+    return _huella([ruta] if os.path.exists(ruta) else [])
+
+
+def huella_carpeta(carpeta=".", dir_historial=None):
+    """
+    (nombre, tamaño, mtime_ns) de cada archivo vigilado y del archivo de
+    correcciones de patentes (editarlo a mano cambia el resultado): barato
+    de comparar.
+    """
+    dir_historial, _ = rutas_datos(carpeta, dir_historial)
+    return _huella(archivos_vigilados(carpeta)) + _huella_correcciones(dir_historial)
+
+
+# ==========================
+# CÁLCULO
+# ==========================
+
+def calcular(carpeta=".", dir_historial=None, backend="pandas"):
+    """
+    Ingiere la carpeta y calcula todos los períodos. Devuelve
+    (resultados, tiempos, segundos, avisos): resultados es {clave: (df_final,
+    salida, invalidas, detalle)} del período más reciente al más viejo;
+    tiempos y segundos son los de preparar_sidecars y avisos los de cargar.
+    """
+    dir_historial, _ = rutas_datos(carpeta, dir_historial)
+    # Con SQLite el historial no pasa por pandas: cada período se consulta.
+    # Si el historial no se pudo ingerir, cargar cae a la exportación y el
+    # cálculo sigue en memoria (queda en los avisos)
+    insumos = cargar(carpeta, dir_historial, transacciones=backend != "sqlite")
+    en_sql = backend == "sqlite" and insumos["consumo"] is None
+
+    con = conectar(os.path.join(dir_historial, "consumo.sqlite")) if en_sql else None
+    try:
+        # Del más viejo al más nuevo: cada período usa de línea de base los
+        # anteriores ya guardados
+        resultados = {}
+        for r in insumos["periodos"].iloc[::-1].itertuples():
+            if en_sql:
+                if not resultados:
+                    hash_nomina = insumos["hashes"][os.path.join(carpeta, FILE_NOMINA)]
+                    sincronizar_transacciones(con, dir_historial)
+                    sincronizar_distancias(con, dir_historial)
+                    sincronizar_nomina(con, insumos["nomina"], hash_nomina)
+                    sincronizar_correcciones(con, ruta_correcciones(dir_historial))
+                df_final = consultar_unificado(con, r.CLAVE, r.INICIO, r.HASTA_CONSUMO)
+                invalidas = consultar_invalidas(con, r.CLAVE, r.INICIO, r.HASTA_CONSUMO)
+                df_cons = compactar(consultar_transacciones(con, r.INICIO, r.HASTA_CONSUMO))
+                resultados[r.CLAVE] = cerrar_periodo(
+                    df_final, df_cons, invalidas, r, dir_historial, tanques=insumos["tanques"]
+                )
+                guardar_periodo(resultados[r.CLAVE][0], invalidas, r, dir_historial)
+            else:
+                resultados[r.CLAVE] = procesar_periodo(insumos, r, dir_historial)
+    finally:
+        if con is not None:
+            con.close()
+
+    resultados = dict(reversed(list(resultados.items())))
+    return resultados, insumos["tiempos"], insumos["segundos"], insumos["avisos"]
+
+
+# ==========================
+# PUBLICACIÓN Y LECTURA
+# ==========================
+
+def _escribir_puntero(destino, valor):
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(valor)
+    os.replace(tmp, destino)
+
+
+def _escribir_manifiesto(carpeta, manifiesto):
+    _escribir_puntero(
+        os.path.join(carpeta, "manifiesto.json"),
+        json.dumps(manifiesto, ensure_ascii=False, indent=1),
+    )
+
+
+def publicar(resultados, tiempos, segundos, huella, dir_snapshots=DIR_SNAPSHOTS, backend="pandas",
+             avisos=()):
+    """
+    Escribe el snapshot completo y recién entonces mueve ACTUAL. Devuelve su
+    id. `avisos` (degradaciones del cálculo) queda en el manifiesto.
+    """
+    os.makedirs(dir_snapshots, exist_ok=True)
+    id_snapshot = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    tmp = os.path.join(dir_snapshots, f".{id_snapshot}.tmp")
+    os.makedirs(tmp)
+
+    for clave, (df_final, salida, invalidas, detalle) in resultados.items():
+        carpeta = os.path.join(tmp, f"periodo={clave}")
+        os.makedirs(carpeta)
+        df_final.to_parquet(os.path.join(carpeta, "df_final.parquet"))
+        salida.to_parquet(os.path.join(carpeta, "salida.parquet"))
+        for nombre in TABLAS_INVALIDAS:
+            invalidas[nombre].to_parquet(os.path.join(carpeta, f"inv_{nombre}.parquet"))
+        for nombre in TABLAS_DETALLE:
+            detalle[nombre].to_parquet(os.path.join(carpeta, f"det_{nombre}.parquet"))
+    tiempos.to_parquet(os.path.join(tmp, "tiempos.parquet"), index=False)
+
+    manifiesto = {
+        "formato": FORMATO_SNAPSHOT,
+        "backend": backend,
+        "tolerancia_pct": TOLERANCIA_PCT,
+        "huella": huella,
+        "periodos": list(resultados),
+        "segundos_carga": segundos,
+        "avisos": list(avisos),
+        "creado": datetime.now().isoformat(timespec="seconds"),
+    }
+    _escribir_manifiesto(tmp, manifiesto)
+
+    os.replace(tmp, os.path.join(dir_snapshots, id_snapshot))
+    _escribir_puntero(os.path.join(dir_snapshots, "ACTUAL"), id_snapshot)
+    _podar(dir_snapshots, id_snapshot)
+    return id_snapshot
+
+
+def _podar(dir_snapshots, vigente):
+    ids = sorted(
+        n for n in os.listdir(dir_snapshots)
+        if os.path.isdir(os.path.join(dir_snapshots, n)) and not n.startswith(".")
+    )
+    for n in ids[:-SNAPSHOTS_GUARDADOS]:
+        if n != vigente:
+            shutil.rmtree(os.path.join(dir_snapshots, n), ignore_errors=True)
+
+
+def snapshot_actual(dir_snapshots=DIR_SNAPSHOTS):
+    """Id del último snapshot publicado, o None si todavía no hay ninguno."""
+    try:
+        with open(os.path.join(dir_snapshots, "ACTUAL"), encoding="utf-8") as f:
+            id_snapshot = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return id_snapshot if os.path.isdir(os.path.join(dir_snapshots, id_snapshot)) else None
+
+
+def leer_manifiesto(id_snapshot, dir_snapshots=DIR_SNAPSHOTS):
+    with open(os.path.join(dir_snapshots, id_snapshot, "manifiesto.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def registrar_error(error, huella, dir_snapshots=DIR_SNAPSHOTS):
+    """
+    Anota `error` (el último recálculo fallido) en el manifiesto del
+    snapshot vigente, que sigue publicado. Devuelve el dict anotado, o None
+    si todavía no hay snapshot.
+    """
+    id_snapshot = snapshot_actual(dir_snapshots)
+    if id_snapshot is None:
+        return None
+    detalle = {
+        "cuando": datetime.now().isoformat(timespec="seconds"),
+        "tipo": type(error).__name__,
+        "mensaje": str(error),
+        "huella": huella,
+    }
+    if isinstance(error, ErrorEsquema):
+        detalle.update(
+            archivo=error.archivo, faltantes=error.faltantes, encontradas=error.encontradas
+        )
+    manifiesto = leer_manifiesto(id_snapshot, dir_snapshots)
+    manifiesto["error"] = detalle
+    _escribir_manifiesto(os.path.join(dir_snapshots, id_snapshot), manifiesto)
+    return detalle
+
+
+def _limpiar_error(id_snapshot, dir_snapshots):
+    manifiesto = leer_manifiesto(id_snapshot, dir_snapshots)
+    if manifiesto.pop("error", None) is not None:
+        _escribir_manifiesto(os.path.join(dir_snapshots, id_snapshot), manifiesto)
+
+
+def leer_snapshot(id_snapshot, dir_snapshots=DIR_SNAPSHOTS):
+    """
+    (resultados, tiempos, manifiesto) de un snapshot publicado; resultados es
+    un mapeo de sólo lectura {clave: (df_final, salida, invalidas, detalle)}.
+    """
+    base = os.path.join(dir_snapshots, id_snapshot)
+    manifiesto = leer_manifiesto(id_snapshot, dir_snapshots)
+    resultados = {}
+    for clave in manifiesto["periodos"]:
+        carpeta = os.path.join(base, f"periodo={clave}")
+        resultados[clave] = (
+            pd.read_parquet(os.path.join(carpeta, "df_final.parquet")),
+            pd.read_parquet(os.path.join(carpeta, "salida.parquet")),
+            {
+                nombre: pd.read_parquet(os.path.join(carpeta, f"inv_{nombre}.parquet"))
+                for nombre in TABLAS_INVALIDAS
+            },
+            {
+                nombre: pd.read_parquet(os.path.join(carpeta, f"det_{nombre}.parquet"))
+                for nombre in TABLAS_DETALLE
+            },
+        )
+    tiempos = pd.read_parquet(os.path.join(base, "tiempos.parquet"))
+    return MappingProxyType(resultados), tiempos, manifiesto
+
+
+# ==========================
+# VIGILANCIA
+# ==========================
+
+def _vigente(huella, backend, dir_snapshots):
+    """True si el snapshot publicado ya corresponde a estos insumos."""
+    id_snapshot = snapshot_actual(dir_snapshots)
+    if id_snapshot is None:
+        return False
+    m = leer_manifiesto(id_snapshot, dir_snapshots)
+    return (
+        m.get("formato") == FORMATO_SNAPSHOT
+        and m.get("backend") == backend
+        and m.get("tolerancia_pct") == TOLERANCIA_PCT
+        and m.get("huella") == huella
+    )
+
+
+def actualizar(carpeta=".", dir_historial=None, dir_snapshots=None, backend="pandas",
+               huella=None):
+    """
+    Publica un snapshot nuevo si los insumos cambiaron desde el último.
+    Devuelve el id vigente, o None si no hay exportaciones de distancias.
+    Si el cálculo falla, el error queda en el manifiesto vigente
+    (registrar_error) y se relanza.
+    """
+    dir_historial, dir_snapshots = rutas_datos(carpeta, dir_historial, dir_snapshots)
+    with _candado:
+        if huella is None:
+            huella = huella_carpeta(carpeta, dir_historial)
+        if _vigente(huella, backend, dir_snapshots):
+            # los insumos volvieron a los del snapshot: la falla ya no aplica
+            id_snapshot = snapshot_actual(dir_snapshots)
+            _limpiar_error(id_snapshot, dir_snapshots)
+            return id_snapshot
+        try:
+            resultados, tiempos, segundos, avisos = calcular(carpeta, dir_historial, backend)
+        except Exception as e:
+            registrar_error(e, huella, dir_snapshots)
+            raise
+        if not resultados:
+            return None
+        # Las correcciones que guardó el propio cálculo ya están en el
+        # snapshot: no cuentan como cambio de insumos
+        nombre = os.path.basename(ruta_correcciones(dir_historial))
+        huella = [h for h in huella if h[0] != nombre] + _huella_correcciones(dir_historial)
+        return publicar(resultados, tiempos, segundos, huella, dir_snapshots, backend, avisos)
+
+
+def vigilar(carpeta=".", dir_historial=None, dir_snapshots=None, backend="pandas",
+            intervalo=INTERVALO_S, detener=None):
+    """
+    Revisa la carpeta cada `intervalo` segundos. Sólo recalcula cuando la
+    huella se mantiene igual entre dos revisiones seguidas, para no leer un
+    xlsx que todavía se está copiando.
+    """
+    dir_historial, dir_snapshots = rutas_datos(carpeta, dir_historial, dir_snapshots)
+    detener = detener or threading.Event()
+    anterior = intentada = None
+    while not detener.is_set():
+        huella = huella_carpeta(carpeta, dir_historial)
+        if huella == anterior and huella != intentada:
+            intentada = huella  # si falla, se reintenta recién con otra huella
+            try:
+                actualizar(carpeta, dir_historial, dir_snapshots, backend, huella)
+            except Exception as e:
+                print(f"[vigilante] no se pudo actualizar: {e}", file=sys.stderr)
+        anterior = huella
+        detener.wait(intervalo)
+
+
+def iniciar_hilo(carpeta=".", **kwargs):
+    """Corre vigilar() en un hilo daemon (muere con el proceso que lo lanzó)."""
+    hilo = threading.Thread(
+        target=vigilar, args=(carpeta,), kwargs=kwargs, name="vigilante", daemon=True
+    )
+    hilo.start()
+    return hilo
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    carpeta = args[0] if args else "."
+    backend = os.environ.get("CONSUMO_BACKEND", "pandas")
+    if "--una-vez" in sys.argv:
+        print(f"snapshot vigente: {actualizar(carpeta, backend=backend)}")
+    else:
+        vigilar(carpeta, backend=backend)
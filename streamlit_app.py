@@ -5,7 +5,7 @@
 # ==========================
 
 import os
-import re
+from datetime import datetime
 from io import BytesIO
 
 import numpy as np
@@ -13,19 +13,29 @@ import pandas as pd
 import streamlit as st
 import altair as alt
 
+from consumo_engine.calculo import (
+    MIN_UNIDADES_MODELO, TOLERANCIA_PCT, UMBRAL_DUDOSO, UMBRAL_Z, barrido_tolerancias,
+    formato_pesos, resumen_estados, ruta_correcciones,
+)
+from consumo_engine.choferes import KM_MIN_CHOFER, ranking_choferes
+from consumo_engine.esquemas import ErrorEsquema
+from consumo_engine.frecuencia import (
+    MAX_CARGAS_VENTANA, MINUTOS_ENTRE_LOCALIDADES, MINUTOS_MISMA_CARGA, VENTANA_CARGAS_H,
+)
+from consumo_engine.historial import consultar_cubo
+from consumo_engine.patentes import leer_correcciones
+from consumo_engine.periodos import PATRON_ARCHIVO, etiqueta_periodo, listar_periodos
+from consumo_engine.reporte_pdf import generar_pdf_premium
+from consumo_engine.tanques import TOLERANCIA_TANQUE
+from consumo_engine.vigilante import (
+    actualizar, iniciar_hilo, leer_manifiesto, leer_snapshot, rutas_datos, snapshot_actual,
+)
 
+# Copy-on-write: las copias livianas del snapshot compartido nunca escriben
+# sobre él (en pandas >= 3 ya es el comportamiento por defecto).
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
 
-# PDF / ReportLab
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
-)
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, landscape, portrait
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import cm
-from reportlab.graphics.shapes import Drawing, Rect
-from reportlab.graphics.charts.barcharts import VerticalBarChart
-from datetime import datetime
 fecha_actualizacion = datetime.now().strftime("%d/%m/%Y")
 
 # ==========================
@@ -95,11 +105,17 @@ if not st.session_state["autenticado"]:
 # CONFIGURACIÓN GENERAL DE DATOS
 # ==========================
 
-TOLERANCIA_PCT = 0.10
-
-FILE_CONSUMO = "consumo_real.xlsx"
-FILE_KM = "distances_26_11_03_12.xlsx"  # ajustá el nombre si cambia
-FILE_NOMINA = "Nomina_consumo_camion.xlsx"
+# Carpeta donde se copian las exportaciones semanales (por defecto, la del
+# tablero); el historial y los snapshots viven dentro de ella, así que no
+# depende de desde dónde se lance streamlit
+DIR_DATOS = os.environ.get("CONSUMO_DATOS", os.path.dirname(os.path.abspath(__file__)))
+DIR_HISTORIAL_DATOS, DIR_SNAPSHOTS_DATOS = rutas_datos(DIR_DATOS)
+# "pandas": agrupa y une en memoria · "sqlite": consultas indexadas sobre
+# historial/consumo.sqlite (conviene con varios meses de historia)
+BACKEND_DATOS = os.environ.get("CONSUMO_BACKEND", "pandas")
+# "hilo": el tablero lanza su propio vigilante · "externo": ya corre aparte
+# (python -m consumo_engine.vigilante)
+VIGILANTE = os.environ.get("CONSUMO_VIGILANTE", "hilo")
 
 COLOR_PRINCIPAL = "#006778"   # BCA aprox
 COLOR_SECUNDARIO = "#009999"  # BCA aprox
@@ -109,56 +125,6 @@ COLOR_SECUNDARIO = "#009999"  # BCA aprox
 # FUNCIONES AUXILIARES  
 # ==========================
 
-def es_patente_valida(p):
-    """Valida patentes argentinas formato viejo AAA123 o nuevo AA123BB."""
-    if pd.isna(p):
-        return False
-    p = str(p).strip().upper()
-    formato_viejo = r"^[A-Z]{3}[0-9]{3}$"         # ABC123
-    formato_nuevo = r"^[A-Z]{2}[0-9]{3}[A-Z]{2}$" # AB123CD
-    return bool(re.match(formato_viejo, p) or re.match(formato_nuevo, p))
-
-
-def to_num_col(s):
-    return pd.to_numeric(
-        s.astype(str).str.replace(",", ".", regex=False),
-        errors="coerce",
-    )
-
-
-def clasificar_estado(row):
-    km = row["KM_RECORRIDOS"]
-    litros = row["LITROS_TOTALES"]
-    cons_real = row["CONSUMO_REAL_L_100KM"]
-    cons_teor = row["CONSUMO_TEORICO_L_100KM"]
-    min_ok = row["MIN_OK"]
-    max_ok = row["MAX_OK"]
-
-    if km == 0 and litros == 0:
-        return "SIN MOVIMIENTO"
-    if km > 0 and litros == 0:
-        return "FALTA CARGA"
-    if km == 0 and litros > 0:
-        return "ERROR DE KM"
-    if pd.isna(cons_real) or pd.isna(cons_teor):
-        return "SIN DATOS"
-
-    limite_mejor_15 = cons_teor * 0.85
-    if cons_real < limite_mejor_15:
-        return "DUDOSO"
-
-    if min_ok <= cons_real <= max_ok:
-        return "NORMAL"
-
-    if limite_mejor_15 <= cons_real < min_ok:
-        return "NORMAL"
-
-    if cons_real > max_ok:
-        return "A AUDITAR"
-
-    return "SIN DATOS"
-
-
 def color_row(row):
     estado = row["ESTADO"]
     if estado == "NORMAL":
@@ -189,194 +155,94 @@ def kpi_card(label, value, color_bg, color_text="#ffffff"):
     """
 
 
-def recomendaciones_automaticas(normal, auditar, dudoso, sin_datos, total):
-    """Genera recomendaciones según la situación general."""
-    if total == 0:
-        return [
-            "No hay datos disponibles en el período analizado. Verificar los archivos de entrada."
-        ]
-
-    recs = []
-
-    pct_normal = normal / total * 100 if total > 0 else 0
-    pct_auditar = auditar / total * 100 if total > 0 else 0
-    pct_dudoso = dudoso / total * 100 if total > 0 else 0
-    pct_sin_datos = sin_datos / total * 100 if total > 0 else 0
-
-    if pct_auditar > 20:
-        recs.append(
-            "Alto porcentaje de unidades en estado A AUDITAR. "
-            "Se recomienda priorizar la revisión de estas unidades, verificando consumo, rutas y condiciones de operación."
-        )
-
-    if pct_dudoso > 10:
-        recs.append(
-            "Existe un número relevante de unidades en estado DUDOSO, con consumos inusualmente bajos. "
-            "Se sugiere revisar la carga de kilómetros, integridad de datos de odómetro y registros GPS."
-        )
-
-    if pct_normal >= 70:
-        recs.append(
-            "La mayoría de las unidades se encuentra en estado NORMAL. "
-            "Se recomienda mantener los procedimientos actuales de operación y monitoreo."
-        )
-
-    if pct_sin_datos > 0:
-        recs.append(
-            "Hay unidades en estado SIN DATOS. "
-            "Conviene revisar los registros de consumo y kilometraje para completar la información."
-        )
-
-    if not recs:
-        recs.append(
-            "La situación general es intermedia. "
-            "Se recomienda monitorear semanalmente y revisar puntualmente las unidades con desvíos."
-        )
-
-    return recs
-
 # ==========================
 # 1) CARGA DE ARCHIVOS
 # ==========================
 
+# El tablero no parsea ni calcula: consumo_engine.vigilante mira DIR_DATOS y,
+# cuando cambia alguna exportación (consumo, distancias, nómina o tanques),
+# ingiere, calcula las secciones 3 a 7 (consumo_engine.calculo) para todos los
+# períodos y publica un snapshot atómico en historial/snapshots. Cada visita
+# sólo lee el último snapshot publicado, una vez por proceso.
 
 
-df_cons = pd.read_excel(FILE_CONSUMO)
-df_km = pd.read_excel(FILE_KM)
-df_nom = pd.read_excel(FILE_NOMINA)
-
-
-# ==========================
-# 2) NORMALIZAR NOMBRES
-# ==========================
-
-df_cons = df_cons.rename(columns={
-    "IDENTIFICACIONTARJETA": "PATENTE",
-    "LITROS UNIDADES": "LITROS",
-})
-df_km = df_km.rename(columns={
-    "Placa/Patente": "PATENTE",
-    "Distancia [km]": "KM_RECORRIDOS",
-})
-
-df_nom.columns = [c.upper() for c in df_nom.columns]
-if "PATENTE" not in df_nom.columns:
-    for c in df_nom.columns:
-        if "PAT" in c.upper():
-            df_nom = df_nom.rename(columns={c: "PATENTE"})
-            break
-
-possible_names = [c for c in df_nom.columns if "LIT" in c.upper() and "100" in c]
-if not possible_names:
-    possible_names = [c for c in df_nom.columns if "LIT" in c.upper()]
-consumo_col = possible_names[0]
-df_nom = df_nom.rename(columns={consumo_col: "LITROS_100KM"})
-
-# ==========================
-# 3) LIMPIEZA Y VALIDACIÓN
-# ==========================
-
-df_cons["LITROS"] = to_num_col(df_cons["LITROS"])
-df_km["KM_RECORRIDOS"] = to_num_col(df_km["KM_RECORRIDOS"])
-df_nom["LITROS_100KM"] = to_num_col(df_nom["LITROS_100KM"])
-
-df_cons["PATENTE"] = df_cons["PATENTE"].astype(str).str.upper().str.strip()
-df_km["PATENTE"] = df_km["PATENTE"].astype(str).str.upper().str.strip()
-df_nom["PATENTE"] = df_nom["PATENTE"].astype(str).str.upper().str.strip()
-
-df_cons_invalidas = df_cons[~df_cons["PATENTE"].apply(es_patente_valida)]
-df_km_invalidas = df_km[~df_km["PATENTE"].apply(es_patente_valida)]
-df_nom_invalidas = df_nom[~df_nom["PATENTE"].apply(es_patente_valida)]
+@st.cache_resource(show_spinner=False)
+def lanzar_vigilante():
+    """Un hilo vigilante por proceso del servidor (salvo que corra aparte)."""
+    if VIGILANTE != "hilo":
+        return None
+    return iniciar_hilo(DIR_DATOS, backend=BACKEND_DATOS)
 
-df_cons = df_cons[df_cons["PATENTE"].apply(es_patente_valida)]
-df_km = df_km[df_km["PATENTE"].apply(es_patente_valida)]
-df_nom = df_nom[df_nom["PATENTE"].apply(es_patente_valida)]
 
-# ==========================
-# 4) AGRUPACIÓN
-# ==========================
+@st.cache_resource(show_spinner=False, max_entries=2)
+def snapshot_flota(id_snapshot):
+    """
+    Resultados de todos los períodos (del más reciente al más viejo), como
+    mapeo de sólo lectura compartido entre sesiones. No modificar in-place:
+    las sesiones trabajan sobre copias livianas (copy-on-write).
+    """
+    return leer_snapshot(id_snapshot, DIR_SNAPSHOTS_DATOS)
 
-df_litros_total = (
-    df_cons.groupby("PATENTE", as_index=False)["LITROS"]
-    .sum()
-    .rename(columns={"LITROS": "LITROS_TOTALES"})
-)
-df_km_total = df_km.groupby("PATENTE", as_index=False)["KM_RECORRIDOS"].sum()
 
 # ==========================
-# 5) UNIFICACIÓN
+# 2) PERÍODO Y SNAPSHOT
 # ==========================
 
-cols_nom = ["PATENTE", "LITROS_100KM"]
-if "MODELO" in df_nom.columns:
-    cols_nom.append("MODELO")
-
-df_final = pd.merge(df_km_total, df_litros_total, on="PATENTE", how="outer")
-df_final = pd.merge(df_final, df_nom[cols_nom], on="PATENTE", how="left")
+lanzar_vigilante()
 
-df_final["KM_RECORRIDOS"] = df_final["KM_RECORRIDOS"].fillna(0)
-df_final["LITROS_TOTALES"] = df_final["LITROS_TOTALES"].fillna(0)
+id_snapshot = snapshot_actual(DIR_SNAPSHOTS_DATOS)
+if id_snapshot is None:
+    # Primer arranque: nadie publicó todavía, se calcula una única vez acá
+    try:
+        with st.spinner("Procesando exportaciones..."):
+            id_snapshot = actualizar(DIR_DATOS, backend=BACKEND_DATOS)
+    except ErrorEsquema as e:
+        st.error(f"Una exportación no tiene el formato esperado:\n\n```\n{e}\n```")
+        st.stop()
+if id_snapshot is None:
+    st.error(f"No se encontraron exportaciones de distancias ({PATRON_ARCHIVO}).")
+    st.stop()
 
-# ==========================
-# 6) CÁLCULOS
-# ==========================
+# Un único snapshot por proceso con todos los períodos calculados, compartido
+# por todas las sesiones: cambiar de semana es una consulta y la memoria no
+# crece con la cantidad de usuarios. Cada sesión sólo guarda sus filtros.
+snapshot, tiempos_carga, manifiesto = snapshot_flota(id_snapshot)
 
-df_final["CONSUMO_REAL_L_100KM"] = np.where(
-    df_final["KM_RECORRIDOS"] > 0,
-    (df_final["LITROS_TOTALES"] / df_final["KM_RECORRIDOS"]) * 100,
-    np.nan,
-)
-
-df_final["CONSUMO_TEORICO_L_100KM"] = df_final["LITROS_100KM"]
-df_final["LITROS_TEOREICOS_ESPERADOS"] = (
-    df_final["KM_RECORRIDOS"] * df_final["CONSUMO_TEORICO_L_100KM"] / 100
-)
-
-df_final["DESVIO_LITROS"] = (
-    df_final["LITROS_TOTALES"] - df_final["LITROS_TEOREICOS_ESPERADOS"]
-)
-df_final["DESVIO_PCT"] = np.where(
-    df_final["LITROS_TEOREICOS_ESPERADOS"] > 0,
-    df_final["DESVIO_LITROS"] / df_final["LITROS_TEOREICOS_ESPERADOS"],
-    np.nan,
-)
-
-df_final["MIN_OK"] = df_final["CONSUMO_TEORICO_L_100KM"] * (1 - TOLERANCIA_PCT)
-df_final["MAX_OK"] = df_final["CONSUMO_TEORICO_L_100KM"] * (1 + TOLERANCIA_PCT)
-
-# ==========================
-# 7) ESTADOS
-# ==========================
-
-df_final["ESTADO"] = df_final.apply(clasificar_estado, axis=1)
-
-df_final["COLOR"] = df_final["ESTADO"].map(
-    {
-        "NORMAL": "🟢",
-        "A AUDITAR": "🔴",
-        "DUDOSO": "🔵",
-        "SIN MOVIMIENTO": "⚪",
-        "FALTA CARGA": "🟣",
-        "ERROR DE KM": "⚠️",
-        "SIN DATOS": "🟡",
-    }
+periodo_sel = st.sidebar.selectbox(
+    "Período", list(snapshot), format_func=etiqueta_periodo
 )
+df_final, salida, invalidas, detalle = snapshot[periodo_sel]
+
+# Degradaciones del cálculo (ej. historial ilegible): el snapshot es válido
+# pero parcial, y tiene que verse
+for aviso in manifiesto.get("avisos", []):
+    st.warning(aviso, icon="⚠️")
+
+# Falla del último recálculo en segundo plano: el manifiesto se relee en
+# cada corrida (el del snapshot cacheado no la ve)
+falla = leer_manifiesto(id_snapshot, DIR_SNAPSHOTS_DATOS).get("error")
+if falla:
+    if falla.get("faltantes"):
+        causa = (
+            f"**{falla['archivo']}** no tiene las columnas requeridas: "
+            + ", ".join(falla["faltantes"])
+        )
+    else:
+        # Excepciones sin mensaje (KeyError(), raise pelado): sólo el tipo
+        primera = falla["mensaje"].partition("\n")[0]
+        causa = f"{falla['tipo']}: {primera}" if primera else falla["tipo"]
+    st.error(
+        f"La actualización del {falla['cuando'].replace('T', ' ')} falló. {causa}. "
+        f"Se muestran los datos del snapshot del {manifiesto['creado'].replace('T', ' ')}.",
+        icon="🚫",
+    )
+    with st.expander("Detalle del error"):
+        st.code(falla["mensaje"])
 
-salida = df_final[
-    [
-        "PATENTE",
-        "MODELO",
-        "KM_RECORRIDOS",
-        "LITROS_TOTALES",
-        "CONSUMO_REAL_L_100KM",
-        "CONSUMO_TEORICO_L_100KM",
-        "LITROS_TEOREICOS_ESPERADOS",
-        "DESVIO_LITROS",
-        "DESVIO_PCT",
-        "ESTADO",
-        "COLOR",
-    ]
-].sort_values(["MODELO", "PATENTE"])
+with st.sidebar.expander("⏱ Tiempos de carga"):
+    st.dataframe(tiempos_carga, hide_index=True, use_container_width=True)
+    st.caption(f"Total (reloj): {manifiesto['segundos_carga']:.2f} s")
+    st.caption(f"Snapshot publicado: {manifiesto['creado'].replace('T', ' ')}")
 
 # ==========================
 # 8) HEADER / ENCABEZADO
@@ -416,7 +282,7 @@ with header_col2:
                 Monitoreo de consumo real vs teórico por unidad y modelo
             </div>
             <div style="font-size:12px;opacity:0.85;margin-top:6px;">
-                Última actualización: {fecha_actualizacion}
+                Período: {etiqueta_periodo(periodo_sel)} · Última actualización: {fecha_actualizacion}
             </div>
         </div>
         """,
@@ -443,7 +309,7 @@ estado_sel = st.sidebar.multiselect(
 columna_orden = st.sidebar.selectbox("Ordenar por", salida.columns.tolist())
 asc = st.sidebar.checkbox("Orden ascendente", True)
 
-salida_filtrada = salida.copy()
+salida_filtrada = salida.copy(deep=False)  # el snapshot compartido no se toca
 if modelo_sel != "TODOS":
     salida_filtrada = salida_filtrada[salida_filtrada["MODELO"] == modelo_sel]  
 
@@ -457,15 +323,11 @@ st.markdown("<br>", unsafe_allow_html=True)
 # 10) KPIs
 # ==========================
 
-total = len(salida_filtrada)
-normal = (salida_filtrada["ESTADO"] == "NORMAL").sum()
-auditar = (salida_filtrada["ESTADO"] == "A AUDITAR").sum()
-dudoso = (salida_filtrada["ESTADO"] == "DUDOSO").sum()
-sin_datos = (salida_filtrada["ESTADO"] == "SIN DATOS").sum()
-
-pct_normal = (normal / total * 100) if total > 0 else 0
+kpis = resumen_estados(salida_filtrada)
+normal, auditar, dudoso = kpis["normal"], kpis["auditar"], kpis["dudoso"]
+pct_normal = kpis["pct_normal"]
 
-k1, k2, k3, k4 = st.columns(4)
+k1, k2, k3, k4, k5 = st.columns(5)
 with k1:
     st.markdown(kpi_card("Normal", normal, COLOR_PRINCIPAL), unsafe_allow_html=True)
 with k2:
@@ -477,6 +339,11 @@ with k4:
         kpi_card("% Normal", f"{pct_normal:.1f}%", COLOR_SECUNDARIO),
         unsafe_allow_html=True,
     )
+with k5:
+    st.markdown(
+        kpi_card("$ en riesgo", formato_pesos(kpis["pesos_en_riesgo"]), "#c62828"),
+        unsafe_allow_html=True,
+    )
 
 # ==========================
 # 11) GRÁFICO — DISTRIBUCIÓN DE ESTADOS
@@ -484,14 +351,8 @@ with k4:
 
 st.subheader("Distribución de estados")
 
-resumen_est = None
-if not salida_filtrada.empty:
-    resumen_est = (
-        salida_filtrada["ESTADO"]
-        .value_counts()
-        .rename_axis("Estado")
-        .reset_index(name="Cantidad")
-    )
+resumen_est = kpis["tabla"]
+if not resumen_est.empty:
 
     bar_color = "#009999"
 
@@ -523,6 +384,13 @@ if not salida_filtrada.empty:
 # ==========================
 
 st.subheader("Detalle por unidad")
+st.caption(
+    "DESVIO_PCT: contra el consumo teórico de la nómina · DESVIO_4S_PCT / "
+    "DESVIO_12S_PCT: contra el consumo de la propia unidad en las 4 / 12 "
+    "semanas anteriores al período. IMPORTE_TOTAL y DESVIO_PESOS en pesos, "
+    "al precio promedio que pagó cada unidad; \"$ en riesgo\" suma el exceso "
+    "de las unidades A AUDITAR."
+)
 
 html_table = (
     salida_filtrada.style.apply(color_row, axis=1)
@@ -530,12 +398,19 @@ html_table = (
         {
             "KM_RECORRIDOS": "{:.2f}",
             "LITROS_TOTALES": "{:.2f}",
+            "IMPORTE_TOTAL": formato_pesos,
             "CONSUMO_REAL_L_100KM": "{:.2f}",
             "CONSUMO_TEORICO_L_100KM": "{:.2f}",
             "LITROS_TEOREICOS_ESPERADOS": "{:.2f}",
             "DESVIO_LITROS": "{:.2f}",
             "DESVIO_PCT": "{:.1%}",
-        }
+            "DESVIO_PESOS": formato_pesos,
+            "DESVIO_4S_PCT": "{:+.1%}",
+            "DESVIO_12S_PCT": "{:+.1%}",
+            "Z_ROBUSTO": "{:+.2f}",
+            "PERCENTIL_MODELO": "{:.0%}",
+        },
+        na_rep="-",
     )
     .to_html()
 )
@@ -564,459 +439,447 @@ st.download_button(
 # 14) EXPORTACIÓN A PDF PREMIUM
 # ==========================
 
-COLOR_ESTADO_HEX = {
-    "NORMAL": "#4CAF50",        # verde
-    "A AUDITAR": "#F44336",     # rojo
-    "DUDOSO": "#1E88E5",        # azul
-    "FALTA CARGA": "#8E24AA",   # violeta
-    "ERROR DE KM": "#FB8C00",   # naranja
-    "SIN MOVIMIENTO": "#9E9E9E",# gris
-    "SIN DATOS": "#FFEB3B",     # amarillo
-}
-
-
-def cuadrado_color(color_hex, size=8):
-    """Devuelve un pequeño cuadrito de color para usar en la tabla del PDF."""
-    d = Drawing(size, size)
-    d.add(Rect(0, 0, size, size, fillColor=colors.HexColor(color_hex), strokeWidth=0))
-    return d
+pdf_buffer = generar_pdf_premium(salida_filtrada, logo_encontrado, kpis)
 
+st.download_button(
+    label="📄 Descargar tablero en PDF",
+    data=pdf_buffer,
+    file_name="control_consumo_bca.pdf",
+    mime="application/pdf",
+)
 
-def generar_pdf_premium(df, normal, auditar, dudoso, sin_datos, pct_normal, resumen_est):
-    buffer = BytesIO()
+# ==========================
+# 15) RESUMEN DE ESTADOS (DASHBOARD)
+# ==========================
 
-    total = len(df)
-    num_cols = len(df.columns)
+st.subheader("Resumen de estados")
 
-    # Orientación automática según ancho (cantidad de columnas)
-    pagesize = landscape(letter) if num_cols > 8 else portrait(letter)
+resumen = kpis["tabla"].copy()
 
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=pagesize,
-        leftMargin=35,
-        rightMargin=35,
-        topMargin=40,
-        bottomMargin=35,
-    )
+orden = [
+    "A AUDITAR",
+    "DUDOSO",
+    "NORMAL",
+    "FALTA CARGA",
+    "ERROR DE KM",
+    "SIN MOVIMIENTO",
+    "SIN DATOS",
+]
+resumen["orden"] = resumen["Estado"].apply(
+    lambda x: orden.index(x) if x in orden else 999
+)
+resumen = resumen.sort_values("orden")
 
-    estilos = getSampleStyleSheet()
-    story = []
+colores_estado = {
+    "A AUDITAR": "🔴",
+    "DUDOSO": "🔵",
+    "NORMAL": "🟢",
+    "FALTA CARGA": "🟣",
+    "ERROR DE KM": "⚠️",
+    "SIN MOVIMIENTO": "⚪",
+    "SIN DATOS": "🟡",
+}
 
-    # ==========================
-    # HOJA 1 – PORTADA + KPI + GRÁFICO
-    # ==========================
+for _, row in resumen.iterrows():
+    st.markdown(f"### {colores_estado[row['Estado']]} {row['Estado']}: {row['Cantidad']}")
 
-    # Logo (si existe)
-    if logo_encontrado:
-        img = Image(logo_encontrado, width=4 * cm, height=4 * cm)
-        img.hAlign = "CENTER"
-        story.append(img)
-        story.append(Spacer(1, 10))
-
-    # Título principal
-    story.append(
-        Paragraph(
-            "<b>Control inteligente de consumo – Grupo BCA</b>", estilos["Title"]
-        )
-    )
-    story.append(Spacer(1, 8))
+# ==========================
+# 16) CALIDAD DE PATENTES
+# ==========================
 
-    # Subtítulo / objetivo
-    story.append(
-        Paragraph(
-            "Reporte técnico generado a partir de los datos filtrados en el tablero semanal.",
-            estilos["Normal"],
-        )
-    )
-    story.append(Spacer(1, 6))
-
-    # Breve introducción
-    story.append(
-        Paragraph(
-            "Este informe resume el desempeño de consumo real versus consumo teórico por unidad y modelo, "
-            "permitiendo identificar desvíos operativos, oportunidades de mejora y posibles inconsistencias de datos.",
-            estilos["Normal"],
-        )
-    )
-    story.append(Spacer(1, 18))
+corregidas = invalidas["corregidas"]
+descartadas = pd.concat(
+    [invalidas[t].assign(TABLA=t)[["TABLA", "PATENTE"]] for t in ["consumo", "km", "nomina"]],
+    ignore_index=True,
+)
 
-    # KPIs principales
-    story.append(Paragraph("<b>Indicadores principales</b>", estilos["Heading2"]))
-    story.append(Spacer(1, 6))
-    story.append(
-        Paragraph(f"• Unidades en estado NORMAL: {normal}", estilos["Normal"])
-    )
-    story.append(
-        Paragraph(f"• Unidades en estado A AUDITAR: {auditar}", estilos["Normal"])
-    )
-    story.append(
-        Paragraph(f"• Unidades en estado DUDOSO: {dudoso}", estilos["Normal"])
+with st.expander(
+    f"🔧 Patentes corregidas: {int(corregidas['FILAS'].sum())} filas · "
+    f"descartadas: {len(descartadas)} filas"
+):
+    st.caption(
+        "Corregidas: separadores o minúsculas (formato) y O/0 · I/1 confirmadas "
+        "contra la nómina. Las correcciones quedan en historial/correcciones_patentes.json."
     )
-    story.append(
-        Paragraph(f"• Unidades SIN DATOS: {sin_datos}", estilos["Normal"])
-    )
-    story.append(
-        Paragraph(
-            f"• Porcentaje de unidades NORMAL: {pct_normal:.1f}%",
-            estilos["Normal"],
+    st.dataframe(corregidas, hide_index=True, use_container_width=True)
+    if not descartadas.empty:
+        st.caption("Descartadas (sin corrección posible):")
+        st.dataframe(
+            descartadas.astype(str).value_counts().rename("FILAS").reset_index(),
+            hide_index=True, use_container_width=True,
         )
-    )
-    story.append(Spacer(1, 16))
-
-    # Gráfico de estados
-    if resumen_est is not None and not resumen_est.empty:
-        res = resumen_est.copy()
-        data_vals = res["Cantidad"].tolist()
-        categorias = res["Estado"].tolist()
-
-        story.append(Paragraph("<b>Distribución de estados</b>", estilos["Heading2"]))
-        story.append(Spacer(1, 6))
-
-        drawing_width = doc.width
-        drawing_height = 180
-
-        drawing = Drawing(drawing_width, drawing_height)
-
-        bc = VerticalBarChart()
-        bc.x = 40
-        bc.y = 30
-        bc.width = drawing_width - 80
-        bc.height = 120
-
-        bc.data = [data_vals]
-        bc.categoryAxis.categoryNames = categorias
-        bc.categoryAxis.labels.angle = 0
-        bc.categoryAxis.labels.dy = -8
-        bc.categoryAxis.labels.fontSize = 8
-
-        bc.valueAxis.valueMin = 0
-        bc.bars[0].fillColor = colors.HexColor("#009999")
-
-        bc.barLabelFormat = "%d"
-        bc.barLabels.fontSize = 8
-        bc.barLabels.dy = -3
-
-        drawing.add(bc)
-        story.append(drawing)
-        story.append(Spacer(1, 12))
-
-    # Mini resumen de estados
-    if resumen_est is not None and not resumen_est.empty:
-        story.append(Paragraph("<b>Resumen por estado</b>", estilos["Heading3"]))
-        story.append(Spacer(1, 4))
-        for _, r in resumen_est.iterrows():
-            story.append(
-                Paragraph(
-                    f"• {r['Estado']}: {r['Cantidad']} unidades", estilos["Normal"]
-                )
-            )
 
-    # Salto de página para que la hoja 2 empiece con el Top 5
-    story.append(PageBreak())
+# ==========================
+# 17) CONSUMO POR ODÓMETRO
+# ==========================
 
-    # ==========================
-    # HOJA 2 – TOP 5 + RECOMENDACIONES + TABLA
-    # ==========================
+# Distancia independiente del GPS: odómetro tipeado en cada carga, tramo a
+# tramo entre cargas, conciliado con el GPS (consumo_engine.odometro)
+tramos = detalle["tramos"]
+patentes_vista = salida_filtrada["PATENTE"].astype(str)
+odometro = df_final[df_final["PATENTE"].astype(str).isin(patentes_vista)][
+    [
+        "PATENTE",
+        "MODELO",
+        "CONFIANZA_KM",
+        "KM_GPS",
+        "KM_ODOMETRO_EST",
+        "KM_RECORRIDOS",
+        "CONSUMO_ODOMETRO_L_100KM",
+        "TRAMOS_ODOMETRO",
+        "REGRESIONES_ODOMETRO",
+    ]
+].sort_values(["CONFIANZA_KM", "MODELO", "PATENTE"])
+confianza = odometro["CONFIANZA_KM"].value_counts()
+con_problemas = tramos[
+    tramos["PATENTE"].astype(str).isin(patentes_vista)
+    & tramos["ESTADO_TRAMO"].isin(["REGRESION", "SALTO", "INVEROSIMIL"])
+]
 
-    story.append(
-        Paragraph("<b>Informe técnico – detalle de unidades</b>", estilos["Heading2"])
+with st.expander(
+    f"🛣️ GPS vs odómetro · {confianza.get('BAJA', 0)} discrepancias · "
+    f"{confianza.get('ODOMETRO', 0)} unidades medidas por odómetro · "
+    f"{int(odometro['REGRESIONES_ODOMETRO'].sum())} regresiones"
+):
+    st.caption(
+        "KM_ODOMETRO_EST: km del odómetro tramo a tramo (se descartan lecturas "
+        "repetidas, atípicas, regresiones, saltos y tramos inverosímiles, y las "
+        "cargas que no son combustible), extrapolados a todos los "
+        "litros del período. Confianza ALTA: coincide con el GPS (±15%); BAJA: "
+        "no coincide, se usa el odómetro; MEDIA: sólo GPS; ODOMETRO: sin GPS, se "
+        "usa el odómetro; SIN KM: ninguna de las dos."
+    )
+    st.dataframe(
+        odometro.style.format(
+            {
+                "KM_GPS": "{:.0f}",
+                "KM_ODOMETRO_EST": "{:.0f}",
+                "KM_RECORRIDOS": "{:.0f}",
+                "CONSUMO_ODOMETRO_L_100KM": "{:.1f}",
+            },
+            na_rep="-",
+        ),
+        hide_index=True, use_container_width=True,
     )
-    story.append(Spacer(1, 10))
+    if not con_problemas.empty:
+        st.caption("Tramos con regresión, salto o consumo inverosímil:")
+        st.dataframe(con_problemas, hide_index=True, use_container_width=True)
 
-    # Orden base por MODELO y PATENTE
-    df_sorted = df.sort_values(["MODELO", "PATENTE"], na_position="last").copy()
+# ==========================
+# 18) RANKING ESTADÍSTICO POR MODELO
+# ==========================
 
-    # Top 5 unidades críticas
-    story.append(
-        Paragraph(
-            "<b>Top 5 unidades con mayor desvío positivo (A AUDITAR)</b>",
-            estilos["Heading3"],
-        )
+# Independiente de la banda fija: cada unidad contra la mediana de su
+# modelo en la flota, en unidades de MAD (desvío absoluto mediano)
+ranking = (
+    salida_filtrada[salida_filtrada["Z_ROBUSTO"].notna()]
+    .sort_values("Z_ROBUSTO", ascending=False)
+    [["PATENTE", "MODELO", "CONSUMO_REAL_L_100KM", "Z_ROBUSTO", "PERCENTIL_MODELO", "ESTADO"]]
+)
+altos = int((ranking["Z_ROBUSTO"] >= UMBRAL_Z).sum())
+bajos = int((ranking["Z_ROBUSTO"] <= -UMBRAL_Z).sum())
+
+with st.expander(
+    f"📊 Ranking estadístico por modelo · {altos} sobre y {bajos} bajo la flota "
+    f"(|z| ≥ {UMBRAL_Z})"
+):
+    st.caption(
+        "Z_ROBUSTO = 0,6745 × (consumo − mediana del modelo) / MAD. Valores "
+        f"mayores a {UMBRAL_Z} indican consumo atípicamente alto frente a las "
+        "demás unidades del mismo modelo; PERCENTIL_MODELO es la posición de "
+        "la unidad dentro de su modelo. Sólo modelos con al menos "
+        f"{MIN_UNIDADES_MODELO} unidades con consumo."
     )
-    story.append(Spacer(1, 6))
-
-    df_crit = df_sorted[df_sorted["ESTADO"] == "A AUDITAR"].sort_values(
-        "DESVIO_LITROS", ascending=False
+    st.dataframe(
+        ranking.style.format(
+            {
+                "CONSUMO_REAL_L_100KM": "{:.1f}",
+                "Z_ROBUSTO": "{:+.2f}",
+                "PERCENTIL_MODELO": "{:.0%}",
+            }
+        ).apply(
+            lambda c: [
+                "background-color:#ffcdd2" if v >= UMBRAL_Z
+                else "background-color:#bbdefb" if v <= -UMBRAL_Z else ""
+                for v in c
+            ],
+            subset=["Z_ROBUSTO"],
+        ),
+        hide_index=True, use_container_width=True,
     )
-    top5 = df_crit.head(5)
 
-    if top5.empty:
-        story.append(
-            Paragraph(
-                "No se detectaron unidades en estado A AUDITAR dentro del conjunto filtrado.",
-                estilos["Normal"],
-            )
-        )
-    else:
-        for i, r in enumerate(top5.itertuples(), start=1):
-            patente = getattr(r, "PATENTE", "")
-            modelo = getattr(r, "MODELO", "")
-            desvio_l = getattr(r, "DESVIO_LITROS", 0.0)
-            cons_real = getattr(r, "CONSUMO_REAL_L_100KM", float("nan"))
-            cons_teo = getattr(r, "CONSUMO_TEORICO_L_100KM", float("nan"))
-
-            texto = (
-                f"{i}. {patente} ({modelo}) – Desvío: {desvio_l:.1f} litros "
-                f"(Real: {cons_real:.1f} L/100km | Teórico: {cons_teo:.1f} L/100km)"
-            )
-            story.append(Paragraph(texto, estilos["Normal"]))
+# ==========================
+# 19) SENSIBILIDAD DE TOLERANCIAS
+# ==========================
 
-    story.append(Spacer(1, 14))
+# Toda la grilla tolerancia × umbral DUDOSO sale de una única pasada sobre
+# las unidades filtradas; mover el control sólo elige qué curva mostrar.
+TOLERANCIAS = np.round(np.arange(0.05, 0.2001, 0.01), 2)
+UMBRALES_DUDOSO = np.round(np.arange(0.05, 0.3001, 0.01), 2)
 
-    # Recomendaciones automáticas
-    story.append(
-        Paragraph("<b>Recomendaciones automáticas</b>", estilos["Heading3"])
+with st.expander("🎚️ Sensibilidad a la tolerancia"):
+    # Desde df_final (float64), no desde salida: los bordes tienen que dar
+    # lo mismo que la clasificación oficial
+    barrido = barrido_tolerancias(
+        df_final[df_final["PATENTE"].astype(str).isin(patentes_vista)],
+        TOLERANCIAS, UMBRALES_DUDOSO,
     )
-    story.append(Spacer(1, 6))
-
-    recs = recomendaciones_automaticas(normal, auditar, dudoso, sin_datos, total)
-    for r in recs:
-        story.append(Paragraph("• " + r, estilos["Normal"]))
-
-    story.append(Spacer(1, 18))
-
-    # Tabla detallada
-    story.append(
-        Paragraph("<b>Detalle de unidades (tabla filtrada)</b>", estilos["Heading3"])
+    dudoso_sel = st.select_slider(
+        "Umbral DUDOSO (consumo por debajo del teórico)",
+        options=UMBRALES_DUDOSO.tolist(),
+        value=UMBRAL_DUDOSO,
+        format_func=lambda x: f"-{x:.0%}",
     )
-    story.append(Spacer(1, 6))
-
-    df_pdf = df_sorted.copy()
-
-    def fmt_val(col, val):
-        if pd.isna(val):
-            return "-"
-        if col in [
-            "KM_RECORRIDOS",
-            "LITROS_TOTALES",
-            "CONSUMO_REAL_L_100KM",
-            "CONSUMO_TEORICO_L_100KM",
-            "LITROS_TEOREICOS_ESPERADOS",
-            "DESVIO_LITROS",
-        ]:
-            return f"{val:.2f}"
-        if col == "DESVIO_PCT":
-            return f"{val * 100:.1f}%"
-        return str(val)
-
-    columnas = [
-        "PATENTE",
-        "MODELO",
-        "KM_RECORRIDOS",
-        "LITROS_TOTALES",
-        "CONSUMO_REAL_L_100KM",
-        "CONSUMO_TEORICO_L_100KM",
-        "LITROS_TEOREICOS_ESPERADOS",
-        "DESVIO_LITROS",
-        "DESVIO_PCT",
-        "ESTADO",
-        "COLOR",
+    curvas = barrido[
+        (barrido["UMBRAL_DUDOSO"] == dudoso_sel)
+        & barrido["ESTADO"].isin(["NORMAL", "A AUDITAR", "DUDOSO"])
     ]
-    columnas = [c for c in columnas if c in df_pdf.columns]
-
-    tabla_data = [columnas]
-    for _, row in df_pdf.iterrows():
-        fila = []
-        for col in columnas:
-            if col == "COLOR":
-                est = row.get("ESTADO", "SIN DATOS")
-                hex_col = COLOR_ESTADO_HEX.get(est, "#BDBDBD")
-                fila.append(cuadrado_color(hex_col))
-            else:
-                fila.append(fmt_val(col, row[col]))
-        tabla_data.append(fila)
-
-    col_count = len(columnas)
-    col_width = doc.width / col_count if col_count > 0 else doc.width
-
-    tabla = Table(tabla_data, repeatRows=1, colWidths=[col_width] * col_count)
-    tabla.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#006778")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-                ("FONTSIZE", (0, 0), (-1, 0), 8),
-                ("FONTSIZE", (0, 1), (-1, -1), 7),
-                ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
-                ("BACKGROUND", (0, 1), (-1, -1), colors.whitesmoke),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-            ]
+
+    lineas = (
+        alt.Chart(curvas)
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("TOLERANCIA_PCT:Q", title="Tolerancia (±)", axis=alt.Axis(format="%")),
+            y=alt.Y("UNIDADES:Q", title="Unidades"),
+            color=alt.Color(
+                "ESTADO:N",
+                scale=alt.Scale(
+                    domain=["NORMAL", "A AUDITAR", "DUDOSO"],
+                    range=["#4CAF50", "#F44336", "#1E88E5"],
+                ),
+            ),
+            tooltip=["ESTADO", alt.Tooltip("TOLERANCIA_PCT:Q", format=".0%"), "UNIDADES"],
         )
     )
-
-    story.append(tabla)
-    story.append(Spacer(1, 18))
-
-    # ==========================
-    # HOJA FINAL – ANÁLISIS EJECUTIVO TÉCNICO
-    # ==========================
-
-    story.append(PageBreak())
-    story.append(
-        Paragraph("<b>Análisis ejecutivo técnico del consumo</b>", estilos["Heading2"])
+    actual = (
+        alt.Chart(pd.DataFrame({"TOLERANCIA_PCT": [TOLERANCIA_PCT]}))
+        .mark_rule(strokeDash=[4, 4], color="gray")
+        .encode(x="TOLERANCIA_PCT:Q")
+    )
+    st.altair_chart(lineas + actual, use_container_width=True)
+    st.caption(
+        f"Línea punteada: tolerancia vigente (±{TOLERANCIA_PCT:.0%}, DUDOSO "
+        f"-{UMBRAL_DUDOSO:.0%}). Las unidades sin movimiento, sin carga o sin "
+        "km no dependen de la tolerancia."
     )
-    story.append(Spacer(1, 10))
-
-    if total > 0:
-        pct_auditar = auditar / total * 100 if total > 0 else 0
-        pct_dudoso = dudoso / total * 100 if total > 0 else 0
-        pct_sin_datos = sin_datos / total * 100 if total > 0 else 0
-
-        modelo_mayor_incidente = "sin modelo predominante"
-        modelo_dudoso_principal = "sin modelo predominante"
-
-        if "MODELO" in df.columns:
-            df_aud = df[df["ESTADO"] == "A AUDITAR"]
-            if not df_aud.empty:
-                modelo_mayor_incidente = df_aud["MODELO"].value_counts().idxmax()
-
-            df_dud = df[df["ESTADO"] == "DUDOSO"]
-            if not df_dud.empty:
-                modelo_dudoso_principal = df_dud["MODELO"].value_counts().idxmax()
-
-        def promedio_seguro(sub, col):
-            sub = sub[col].dropna()
-            return float(sub.mean()) if not sub.empty else float("nan")
-
-        df_norm = df[df["ESTADO"] == "NORMAL"]
-        df_aud = df[df["ESTADO"] == "A AUDITAR"]
 
-        prom_real_norm = promedio_seguro(df_norm, "CONSUMO_REAL_L_100KM")
-        prom_teo_norm = promedio_seguro(df_norm, "CONSUMO_TEORICO_L_100KM")
+# ==========================
+# 20) RANKING POR CHOFER
+# ==========================
 
-        prom_real_aud = promedio_seguro(df_aud, "CONSUMO_REAL_L_100KM")
-        prom_teo_aud = promedio_seguro(df_aud, "CONSUMO_TEORICO_L_100KM")
+# Litros de la tarjeta por chofer y km de los tramos de odómetro que cerró
+# con su carga (consumo_engine.choferes); el ranking se rearma sobre las
+# unidades filtradas.
+pares_choferes = detalle["choferes_patentes"]
+pares_vista = pares_choferes[pares_choferes["PATENTE"].astype(str).isin(patentes_vista)]
+ranking_ch = ranking_choferes(pares_vista)
+medidos = ranking_ch[ranking_ch["RANKING"].notna()]
 
-        texto1 = (
-            f"El conjunto analizado muestra un {pct_normal:.1f}% de unidades en estado NORMAL, "
-            f"mientras que un {pct_auditar:.1f}% se encuentra en estado A AUDITAR y un "
-            f"{pct_dudoso:.1f}% en estado DUDOSO. "
-            "Esta distribución refleja una flota con un núcleo estable de desempeño, "
-            "pero con un volumen relevante de unidades que exceden el consumo esperado."
+with st.expander(
+    f"👤 Ranking por chofer · {len(medidos)} choferes medidos · "
+    f"{int((medidos['DESVIO_PCT'] > TOLERANCIA_PCT).sum())} sobre la tolerancia"
+):
+    st.caption(
+        "Cada tramo OK de odómetro (tanque lleno a tanque lleno) es del chofer "
+        "que cargó al cerrarlo, con sus km y sus litros. Sólo cuentan camiones "
+        "NORMAL, A AUDITAR o DUDOSO con distancia confiable; los choferes con "
+        f"menos de {KM_MIN_CHOFER} km medidos no aparecen. PCT_LITROS_TITULAR: parte de los litros "
+        "cargada en camiones cuyo Alias GPS es el chofer."
+    )
+    st.dataframe(
+        ranking_ch.style.format(
+            {
+                "LITROS_TOTALES": "{:.2f}",
+                "KM_ATRIBUIDOS": "{:.0f}",
+                "CONSUMO_REAL_L_100KM": "{:.1f}",
+                "CONSUMO_TEORICO_L_100KM": "{:.1f}",
+                "DESVIO_PCT": "{:+.1%}",
+                "PCT_LITROS_TITULAR": "{:.0%}",
+            },
+            na_rep="-",
+        ),
+        hide_index=True, use_container_width=True,
+    )
+    chofer_sel = st.selectbox(
+        "Camiones de un chofer",
+        ["-"] + ranking_ch["CONDUCTOR"].dropna().tolist(),
+    )
+    if chofer_sel != "-":
+        st.dataframe(
+            pares_vista[pares_vista["CONDUCTOR"] == chofer_sel].style.format(
+                {
+                    "LITROS": "{:.2f}",
+                    "KM_ATRIBUIDOS": "{:.0f}",
+                    "LITROS_MEDIDOS": "{:.2f}",
+                    "LITROS_TEORICOS": "{:.2f}",
+                },
+                na_rep="-",
+            ),
+            hide_index=True, use_container_width=True,
         )
 
-        texto2 = (
-            f"En el grupo NORMAL, el consumo medio se ubica en torno a "
-            f"{prom_real_norm:.1f} L/100km frente a un teórico de {prom_teo_norm:.1f} L/100km, "
-            "lo que indica un comportamiento alineado a los parámetros de referencia. "
-            f"En contraste, las unidades en estado A AUDITAR presentan un consumo medio de "
-            f"{prom_real_aud:.1f} L/100km versus {prom_teo_aud:.1f} L/100km teóricos, "
-            "configurando un desvío sistemático que justifica investigación operativa."
-        )
+# ==========================
+# 21) CARGAS POR ENCIMA DEL TANQUE
+# ==========================
 
-        texto3 = (
-            f"Los desvíos se concentran principalmente en el modelo {modelo_mayor_incidente} "
-            "dentro del grupo A AUDITAR, lo que sugiere revisar calibración, condiciones de carga, "
-            "topografía recorrida y hábitos de conducción asociados. "
-            f"En paralelo, el estado DUDOSO, con un {pct_dudoso:.1f}% de unidades, se focaliza en el modelo "
-            f"{modelo_dudoso_principal}, indicando posible subregistro de kilómetros o datos incompletos de GPS."
+# Cargas de combustible mayores a la capacidad del tanque del modelo, solas
+# o sumadas en el día por tarjeta (consumo_engine.tanques); las capacidades
+# se completan en capacidad_tanques.xlsx. Sin ninguna capacidad cargada no
+# hay control, y el tablero lo dice en vez de mostrar cero eventos.
+sobrecargas = detalle["sobrecargas"]
+sobrecargas = sobrecargas[sobrecargas["PATENTE"].astype(str).isin(patentes_vista)]
+capacidades_vista = df_final.loc[
+    df_final["PATENTE"].astype(str).isin(patentes_vista), ["MODELO", "CAPACIDAD_TANQUE_L"]
+]
+sin_capacidad = (
+    capacidades_vista.loc[capacidades_vista["CAPACIDAD_TANQUE_L"].isna(), "MODELO"]
+    .dropna().astype(str).unique()
+)
+con_capacidades = capacidades_vista["CAPACIDAD_TANQUE_L"].notna().any()
+
+with st.expander(
+    f"⛽ Cargas por encima del tanque · {len(sobrecargas)} eventos · "
+    f"{sobrecargas['PATENTE'].nunique()} unidades · "
+    f"{sobrecargas['EXCESO_L'].sum():,.0f} L de exceso".replace(",", ".")
+    if con_capacidades else "⛽ Cargas por encima del tanque · sin capacidades cargadas"
+):
+    st.caption(
+        "CARGA SUPERA TANQUE: una sola carga mayor que la capacidad; DIA SUPERA "
+        "TANQUE: los litros del día en la misma tarjeta pasan la capacidad "
+        f"(margen {TOLERANCIA_TANQUE:.0%}). EXCESO_L: litros de esa carga por "
+        "encima de la capacidad."
+    )
+    if not con_capacidades:
+        st.warning(
+            "Sin capacidades cargadas: no se controla ninguna carga. Completar "
+            "CAPACIDAD_L en capacidad_tanques.xlsx, junto a la nómina; la "
+            "plantilla con los modelos se crea con `python -m "
+            "consumo_engine.calculo --plantilla-tanques`."
         )
-
-        if pct_sin_datos > 0:
-            texto4 = (
-                f"El {pct_sin_datos:.1f}% de unidades en estado SIN DATOS reduce la capacidad analítica del modelo. "
-                "A medida que se incorporen más días de operación con registros completos de kilómetros y combustible, "
-                "los indicadores tenderán a estabilizarse y permitirán una evaluación más fina de la eficiencia "
-                "por ruta, modelo y patrón de uso."
-            )
-        else:
-            texto4 = (
-                "Actualmente no se registran unidades en estado SIN DATOS, lo que refuerza la calidad de la base de "
-                "información. A medida que se incorporen más días de operación, será posible afinar todavía más la "
-                "evaluación de eficiencia por ruta, modelo y patrón de uso."
-            )
-
-        story.append(Paragraph(texto1, estilos["Normal"]))
-        story.append(Spacer(1, 6))
-        story.append(Paragraph(texto2, estilos["Normal"]))
-        story.append(Spacer(1, 6))
-        story.append(Paragraph(texto3, estilos["Normal"]))
-        story.append(Spacer(1, 6))
-        story.append(Paragraph(texto4, estilos["Normal"]))
-        story.append(Spacer(1, 12))
+    elif sobrecargas.empty:
+        st.info("Sin cargas por encima de la capacidad en las unidades filtradas.")
     else:
-        story.append(
-            Paragraph(
-                "No se generó análisis técnico debido a la ausencia de datos en el conjunto filtrado.",
-                estilos["Normal"],
-            )
+        st.dataframe(
+            sobrecargas.style.format(
+                {
+                    "FECHA": "{:%d/%m/%Y %H:%M}",
+                    "LITROS": "{:.2f}",
+                    "LITROS_DIA": "{:.2f}",
+                    "CAPACIDAD_L": "{:.0f}",
+                    "EXCESO_L": "{:.2f}",
+                },
+                na_rep="-",
+            ),
+            hide_index=True, use_container_width=True,
         )
-        story.append(Spacer(1, 12))
-
-    story.append(
-        Paragraph(
-            "Sistema de Control Inteligente de Consumo – Grupo BCA",
-            estilos["Normal"],
+    if con_capacidades and len(sin_capacidad):
+        st.caption(
+            f"Modelos sin capacidad cargada (no se controlan): {', '.join(sorted(sin_capacidad))}."
         )
-    )
-
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
-
 
-pdf_buffer = generar_pdf_premium(
-    salida_filtrada,
-    normal,
-    auditar,
-    dudoso,
-    sin_datos,
-    pct_normal,
-    resumen_est,
-)
-
-st.download_button(
-    label="📄 Descargar tablero en PDF",
-    data=pdf_buffer,
-    file_name="control_consumo_bca.pdf",
-    mime="application/pdf",
-)
+# ==========================
+# 22) FRECUENCIA DE CARGAS POR TARJETA
+# ==========================
+
+# Cargas demasiado seguidas o en localidades distintas casi al mismo tiempo,
+# por tarjeta (consumo_engine.frecuencia)
+frecuencia = detalle["frecuencia_cargas"]
+frecuencia = frecuencia[frecuencia["PATENTE"].astype(str).isin(patentes_vista)]
+por_tipo = frecuencia["TIPO_ANOMALIA"].value_counts()
+
+with st.expander(
+    f"🕒 Frecuencia de cargas por tarjeta · "
+    f"{por_tipo.get('CARGAS FRECUENTES', 0)} cargas frecuentes · "
+    f"{por_tipo.get('LOCALIDAD IMPOSIBLE', 0)} localidades imposibles"
+):
+    st.caption(
+        f"CARGAS FRECUENTES: más de {MAX_CARGAS_VENTANA} cargas de combustible de "
+        f"la misma tarjeta en {VENTANA_CARGAS_H} horas. LOCALIDAD IMPOSIBLE: dos "
+        f"cargas seguidas en localidades distintas con menos de "
+        f"{MINUTOS_ENTRE_LOCALIDADES} minutos entre ellas. Las líneas en el mismo "
+        f"establecimiento separadas por menos de {MINUTOS_MISMA_CARGA} minutos "
+        "cuentan como una sola carga. FECHA_ANTERIOR: primera carga de la ventana "
+        "o carga en la otra localidad."
+    )
+    if frecuencia.empty:
+        st.info("Sin anomalías de frecuencia en las unidades filtradas.")
+    else:
+        st.dataframe(
+            frecuencia.style.format(
+                {
+                    "FECHA": "{:%d/%m/%Y %H:%M}",
+                    "FECHA_ANTERIOR": "{:%d/%m/%Y %H:%M}",
+                    "LITROS": "{:.2f}",
+                    "HORAS": "{:.1f}",
+                },
+                na_rep="-",
+            ),
+            hide_index=True, use_container_width=True,
+        )
 
 # ==========================
-# 15) RESUMEN DE ESTADOS (DASHBOARD)
+# 23) APERTURA DIARIA (CUBO)
 # ==========================
 
-st.subheader("Resumen de estados")
+# Litros, pesos y cargas por día o por estación, leídos del cubo PATENTE ×
+# DÍA × ESTABLECIMIENTO que se actualiza en cada ingesta
+# (consumo_engine.historial), sin recorrer las transacciones.
 
-resumen = (
-    salida_filtrada["ESTADO"]
-    .value_counts()
-    .rename_axis("Estado")
-    .reset_index(name="Cantidad")
-)
 
-orden = [
-    "A AUDITAR",
-    "DUDOSO",
-    "NORMAL",
-    "FALTA CARGA",
-    "ERROR DE KM",
-    "SIN MOVIMIENTO",
-    "SIN DATOS",
-]
-resumen["orden"] = resumen["Estado"].apply(
-    lambda x: orden.index(x) if x in orden else 999
-)
-resumen = resumen.sort_values("orden")
+@st.cache_data(show_spinner=False, max_entries=32)
+def apertura_cubo(id_snapshot, clave, por, patentes):
+    """Consulta al cubo; el cubo sólo cambia con una ingesta (snapshot nuevo)."""
+    registro = listar_periodos(DIR_HISTORIAL_DATOS).set_index("CLAVE")
+    periodo = registro.loc[clave]
+    return consultar_cubo(
+        por,
+        periodo["INICIO"],
+        periodo["HASTA_CONSUMO"],
+        filtros={"PATENTE": list(patentes)},
+        correcciones=leer_correcciones(ruta_correcciones(DIR_HISTORIAL_DATOS)),
+        dir_historial=DIR_HISTORIAL_DATOS,
+    )
 
-colores_estado = {
-    "A AUDITAR": "🔴",
-    "DUDOSO": "🔵",
-    "NORMAL": "🟢",
-    "FALTA CARGA": "🟣",
-    "ERROR DE KM": "⚠️",
-    "SIN MOVIMIENTO": "⚪",
-    "SIN DATOS": "🟡",
-}
 
-for _, row in resumen.iterrows():
-    st.markdown(f"### {colores_estado[row['Estado']]} {row['Estado']}: {row['Cantidad']}")
+with st.expander("📅 Apertura diaria por unidad y estación"):
+    unidad_sel = st.selectbox(
+        "Unidad", ["Todas las unidades filtradas"] + sorted(patentes_vista.unique())
+    )
+    apertura_sel = st.radio("Abrir por", ["Día", "Estación"], horizontal=True)
+    dimension = "DIA" if apertura_sel == "Día" else "ESTABLECIMIENTO"
+    patentes_cubo = (
+        tuple(sorted(patentes_vista.unique())) if unidad_sel.startswith("Todas")
+        else (unidad_sel,)
+    )
+    apertura = apertura_cubo(id_snapshot, periodo_sel, [dimension], patentes_cubo)
+
+    if apertura.empty:
+        st.info("Sin cargas para la selección en este período.")
+    else:
+        barras = (
+            alt.Chart(apertura)
+            .mark_bar(color="#009999")
+            .encode(
+                x=alt.X(
+                    f"{dimension}:{'T' if dimension == 'DIA' else 'N'}",
+                    title=apertura_sel,
+                    sort=None if dimension == "DIA" else "-y",
+                ),
+                y=alt.Y("LITROS:Q", title="Litros"),
+                tooltip=[dimension, "LITROS", "IMPORTE", "CARGAS"],
+            )
+        )
+        st.altair_chart(barras, use_container_width=True)
+        st.dataframe(
+            apertura.style.format(
+                {"DIA": "{:%d/%m/%Y}", "LITROS": "{:.2f}", "IMPORTE": formato_pesos},
+                na_rep="-",
+            ),
+            hide_index=True, use_container_width=True,
+        )
 
 # ==========================
-# 16) FOOTER
+# 24) FOOTER
 # ==========================
 
 st.write("---")
@@ -0,0 +1,58 @@
+# Atribución de km por chofer sobre cargas armadas a mano.
+
+import pandas as pd
+import pytest
+
+from consumo_engine.choferes import COL_DOCUMENTO, atribuir_choferes, ranking_choferes
+from consumo_engine.odometro import tramos_odometro
+
+
+def _cargas():
+    # AB123CD: A abre y cierra el primer tramo, B cierra el segundo;
+    # AA111BB: una sola lectura de C, sin tramo
+    return pd.DataFrame({
+        "PATENTE": ["AB123CD"] * 3 + ["AA111BB"],
+        "FECHA": pd.date_range("2025-11-26", periods=4, freq="D"),
+        "LITROS": [100.0, 600.0, 1000.0, 80.0],
+        "ODOMETRO": [1000, 3000, 5000, 9000],
+        "CONDUCTOR": ["A", "A", "B", "C"],
+        COL_DOCUMENTO: [1.0, 1.0, 2.0, 3.0],
+    })
+
+
+def _unidades():
+    return pd.DataFrame({
+        "PATENTE": ["AB123CD", "AA111BB"],
+        "CONSUMO_TEORICO_L_100KM": 40.0,
+        "ESTADO": "NORMAL",
+        "CONFIANZA_KM": "ALTA",
+    })
+
+
+def test_cada_chofer_mide_sus_propios_tramos():
+    df_cons = _cargas()
+    tramos = tramos_odometro(df_cons, columnas=[COL_DOCUMENTO])
+    ranking = ranking_choferes(atribuir_choferes(_unidades(), df_cons, tramos))
+
+    por_chofer = ranking.set_index("CONDUCTOR")
+    assert por_chofer.loc["A", "CONSUMO_REAL_L_100KM"] == pytest.approx(30)
+    assert por_chofer.loc["B", "CONSUMO_REAL_L_100KM"] == pytest.approx(50)
+    assert list(ranking["CONDUCTOR"]) == ["B", "A"]
+
+
+def test_chofer_sin_tramos_no_entra_en_el_ranking():
+    df_cons = _cargas()
+    tramos = tramos_odometro(df_cons, columnas=[COL_DOCUMENTO])
+    pares = atribuir_choferes(_unidades(), df_cons, tramos)
+
+    assert pares.loc[pares["CONDUCTOR"] == "C", "KM_ATRIBUIDOS"].isna().all()
+    assert "C" not in set(ranking_choferes(pares)["CONDUCTOR"])
+
+
+def test_chofer_con_pocos_km_no_entra_en_el_ranking():
+    df_cons = _cargas()
+    tramos = tramos_odometro(df_cons, columnas=[COL_DOCUMENTO])
+    pares = atribuir_choferes(_unidades(), df_cons, tramos)
+
+    assert list(ranking_choferes(pares, km_min=2500)["CONDUCTOR"]) == []
+    assert len(ranking_choferes(pares, km_min=2000)) == 2
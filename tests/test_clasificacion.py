@@ -0,0 +1,73 @@
+# Equivalencia entre clasificar_estado (referencia fila a fila) y
+# clasificar_estados (máscaras vectorizadas) sobre una grilla con los bordes
+# de cada regla: consumo justo en la tolerancia y en el umbral DUDOSO, km
+# faltantes o en cero y consumo teórico nulo.
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from consumo_engine.calculo import (
+    TOLERANCIA_PCT, UMBRAL_DUDOSO, barrido_tolerancias, clasificar_estado, clasificar_estados,
+)
+
+TEORICOS = [0.0, 35.0, 41.3, np.nan]
+KMS = [0.0, 850.0, -10.0, np.nan]
+LITROS = [0.0, 300.0, np.nan]
+
+
+def _consumos_reales(teor, tolerancia):
+    """Consumos reales en los bordes de la banda y del umbral DUDOSO, y sus vecinos."""
+    bordes = [teor * (1 - tolerancia), teor * (1 + tolerancia), teor * (1 - UMBRAL_DUDOSO)]
+    valores = [0.0, teor, np.nan]
+    for b in bordes:
+        valores += [b, np.nextafter(b, -np.inf), np.nextafter(b, np.inf)]
+    return valores
+
+
+def _grilla(tolerancia):
+    filas = []
+    for teor, km, litros in itertools.product(TEORICOS, KMS, LITROS):
+        for real in _consumos_reales(teor, tolerancia):
+            filas.append({
+                "KM_RECORRIDOS": km,
+                "LITROS_TOTALES": litros,
+                "CONSUMO_REAL_L_100KM": real,
+                "CONSUMO_TEORICO_L_100KM": teor,
+                # como calcular_metricas
+                "MIN_OK": teor * (1 - tolerancia),
+                "MAX_OK": teor * (1 + tolerancia),
+            })
+    return pd.DataFrame(filas)
+
+
+@pytest.mark.parametrize("tolerancia", [TOLERANCIA_PCT, 0.0, UMBRAL_DUDOSO, 0.25])
+def test_vectorizada_igual_a_fila_a_fila(tolerancia):
+    df = _grilla(tolerancia)
+    esperado = df.apply(clasificar_estado, axis=1)
+    obtenido = clasificar_estados(df).astype(str)
+    distintas = df[esperado.to_numpy() != obtenido.to_numpy()]
+    assert distintas.empty, distintas.assign(
+        FILA=esperado[distintas.index], VECTOR=obtenido[distintas.index]
+    ).to_string()
+
+
+def test_bordes_de_la_banda():
+    df = _grilla(TOLERANCIA_PCT)
+    df = df[(df["KM_RECORRIDOS"] > 0) & (df["LITROS_TOTALES"] > 0) & (df["MAX_OK"] > 0)]
+    estados = clasificar_estados(df).astype(str).to_numpy()
+    real, min_ok, max_ok = (df[c].to_numpy() for c in ["CONSUMO_REAL_L_100KM", "MIN_OK", "MAX_OK"])
+    # Justo en MIN_OK y MAX_OK la unidad es NORMAL; apenas por encima, A AUDITAR
+    assert (estados[real == min_ok] == "NORMAL").all()
+    assert (estados[real == max_ok] == "NORMAL").all()
+    assert (estados[real > max_ok] == "A AUDITAR").all()
+
+
+def test_barrido_coincide_con_la_clasificacion():
+    df = _grilla(TOLERANCIA_PCT)
+    barrido = barrido_tolerancias(df, [0.05, TOLERANCIA_PCT], [UMBRAL_DUDOSO])
+    vigente = barrido[barrido["TOLERANCIA_PCT"] == TOLERANCIA_PCT].set_index("ESTADO")["UNIDADES"]
+    conteo = clasificar_estados(df).value_counts()
+    assert (vigente == conteo.reindex(vigente.index)).all()
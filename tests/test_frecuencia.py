@@ -0,0 +1,39 @@
+# Anomalías de frecuencia sobre cargas armadas a mano.
+
+import pandas as pd
+
+from consumo_engine.frecuencia import anomalias_frecuencia
+
+
+def _cargas(fechas, tarjetas, localidades=None):
+    return pd.DataFrame({
+        "PATENTE": "AB123CD",
+        "TARJETA": pd.Series(tarjetas, dtype="string"),
+        "FECHA": pd.to_datetime(fechas),
+        "LITROS": 100.0,
+        "PRODUCTO": "INFINIA DIESEL",
+        "ESTABLECIMIENTO": [f"E{i}" for i in range(len(fechas))],
+        "LOCALIDAD": localidades or "CORDOBA",
+    })
+
+
+def test_tres_cargas_en_la_ventana():
+    df = _cargas(
+        ["2025-11-26 08:00", "2025-11-26 10:00", "2025-11-26 12:00"], ["T1", "T1", "T1"]
+    )
+    anomalias = anomalias_frecuencia(df)
+    assert list(anomalias["TIPO_ANOMALIA"]) == ["CARGAS FRECUENTES"]
+    assert anomalias["CARGAS_VENTANA"].iloc[0] == 3
+
+
+def test_sin_fecha_ni_tarjeta_no_entran_en_la_clave():
+    # Una carga por día de T1 y de T2; entre medio, líneas sin FECHA o sin
+    # TARJETA que no deben sumarse a ninguna ventana ni desordenar la clave
+    df = _cargas(
+        ["2025-11-26 08:00", None, "2025-11-27 08:00", "2025-11-27 09:00",
+         "2025-11-27 09:30", "2025-11-28 08:00", "2025-11-26 20:00", "2025-11-27 20:00"],
+        ["T1", "T1", "T1", None, None, "T1", "T2", "T2"],
+        ["CORDOBA", "ROSARIO", "CORDOBA", "ROSARIO", "MENDOZA", "CORDOBA",
+         "CORDOBA", "ROSARIO"],
+    )
+    assert anomalias_frecuencia(df).empty
@@ -0,0 +1,93 @@
+# Deduplicación del historial: clave natural, índice de claves por mes,
+# reingesta de la misma exportación y reconstrucción de los derivados.
+
+import os
+
+import pandas as pd
+import pytest
+
+from consumo_engine.historial import (
+    clave_transaccion, ingerir_consumo, leer_agregados, leer_cubo, leer_transacciones,
+    version_historial,
+)
+
+
+def _exportacion(fechas, litros=100.0, remitos=None):
+    n = len(fechas)
+    return pd.DataFrame({
+        "TARJETA": "7001",
+        "FECHA": pd.to_datetime(fechas),
+        "REMITO": remitos if remitos is not None else [float(1000 + i) for i in range(n)],
+        "FACTURA": "A-1",
+        "PATENTE": "AB123CD",
+        "LITROS": litros,
+        "ESTABLECIMIENTO": "YPF RUTA 9",
+        "IMP TOT PVP ESTABLECIMIENTO": 150000.0,
+    })
+
+
+NOVIEMBRE = ["2025-11-26 08:00", "2025-11-28 09:30", "2025-11-30 17:45"]
+DICIEMBRE = ["2025-12-01 07:10", "2025-12-02 12:00"]
+
+
+def _totales_cubo(dir_historial):
+    cubo = leer_cubo(dir_historial=dir_historial)
+    return cubo["LITROS"].sum(), cubo["CARGAS"].sum()
+
+
+def test_clave_numera_las_ocurrencias():
+    # Misma fila repetida por el proveedor; remito numérico sin ".0"
+    df = _exportacion([NOVIEMBRE[0]] * 2 + [NOVIEMBRE[1]], remitos=[55.0, 55.0, 56.0])
+    assert list(clave_transaccion(df)) == [
+        "7001|2025-11-26 08:00:00|55|A-1#0",
+        "7001|2025-11-26 08:00:00|55|A-1#1",
+        "7001|2025-11-28 09:30:00|56|A-1#0",
+    ]
+
+
+def test_reingesta_de_la_misma_exportacion(tmp_path):
+    dir_historial = str(tmp_path)
+    df = _exportacion(NOVIEMBRE + DICIEMBRE)
+
+    assert ingerir_consumo(df, dir_historial) == {"leidas": 5, "nuevas": 5, "duplicadas": 0}
+    assert ingerir_consumo(df, dir_historial) == {"leidas": 5, "nuevas": 0, "duplicadas": 5}
+
+    assert len(version_historial(dir_historial)) == 1
+    assert len(leer_transacciones(dir_historial)) == 5
+    assert _totales_cubo(dir_historial) == (500.0, 5)
+    assert leer_agregados(dir_historial)["CARGAS"].sum() == 5
+    # Un archivo del índice por mes
+    assert sorted(os.listdir(tmp_path / "claves")) == [
+        "mes=2025-11.parquet", "mes=2025-12.parquet",
+    ]
+
+
+def test_exportacion_solapada_solo_agrega_lo_nuevo(tmp_path):
+    dir_historial = str(tmp_path)
+    # Un par repetido dentro de la exportación: son dos cargas, y en la
+    # exportación siguiente se repite igual
+    repetidas = [NOVIEMBRE[0], NOVIEMBRE[0]]
+    primera = _exportacion(repetidas, remitos=[55.0, 55.0])
+    segunda = _exportacion(repetidas + DICIEMBRE, remitos=[55.0, 55.0, 60.0, 61.0])
+
+    assert ingerir_consumo(primera, dir_historial)["nuevas"] == 2
+    assert ingerir_consumo(segunda, dir_historial) == {"leidas": 4, "nuevas": 2, "duplicadas": 2}
+    assert _totales_cubo(dir_historial) == (400.0, 4)
+
+
+def test_lotes_cambiados_reconstruyen_los_derivados(tmp_path):
+    dir_historial = str(tmp_path)
+    ingerir_consumo(_exportacion(NOVIEMBRE), dir_historial)
+    ingerir_consumo(_exportacion(DICIEMBRE, remitos=[2000.0, 2001.0]), dir_historial)
+    assert _totales_cubo(dir_historial) == (500.0, 5)
+
+    # Se borra a mano el lote de diciembre: índice, cubo y agregados lo
+    # siguen contando hasta la próxima ingesta, que los rearma
+    ultimo = version_historial(dir_historial)[-1]
+    os.remove(tmp_path / "transacciones" / ultimo)
+
+    resumen = ingerir_consumo(_exportacion(DICIEMBRE, remitos=[2000.0, 2001.0]), dir_historial)
+    assert resumen["nuevas"] == 2
+    assert _totales_cubo(dir_historial) == (500.0, 5)
+    agregados = leer_agregados(dir_historial)
+    assert agregados["LITROS_TOTALES"].sum() == pytest.approx(500.0)
@@ -0,0 +1,115 @@
+# Tramos de odómetro sobre secuencias de lecturas armadas a mano.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from consumo_engine.odometro import conciliar_km, resumen_odometro, tramos_odometro
+
+
+def _cargas(lecturas, litros=100.0, patente="AB123CD"):
+    return pd.DataFrame({
+        "PATENTE": patente,
+        "FECHA": pd.date_range("2025-11-26", periods=len(lecturas), freq="D"),
+        "LITROS": litros,
+        "ODOMETRO": lecturas,
+    })
+
+
+def test_regresion_no_es_base_del_tramo_siguiente():
+    tramos = tramos_odometro(_cargas([1000, 1500, 900, 2000]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "OK", "REGRESION", "OK"]
+    assert tramos["KM_TRAMO"].tolist()[1:] == [500, -600, 500]
+    # Los litros de la carga que retrocedió pasan al tramo siguiente
+    assert tramos["LITROS_TRAMO"].iloc[3] == 200
+
+    resumen = resumen_odometro(tramos).iloc[0]
+    assert resumen["KM_ODOMETRO"] == 1000
+    assert resumen["REGRESIONES_ODOMETRO"] == 1
+
+
+def test_regresiones_seguidas():
+    tramos = tramos_odometro(_cargas([1000, 1500, 900, 1200, 1800]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "OK", "REGRESION", "REGRESION", "OK"]
+    assert tramos["KM_TRAMO"].iloc[4] == 300
+
+
+def test_caida_mayor_que_un_tanque_reinicia_la_serie():
+    # Primera lectura mal tipeada (sin anterior, no puede ser ATIPICA)
+    tramos = tramos_odometro(_cargas([888752, 274749, 274915, 275400]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "PRIMERA LECTURA", "OK", "OK"]
+    assert tramos["KM_TRAMO"].tolist()[2:] == [166, 485]
+
+
+def test_lectura_unica_es_primera_lectura():
+    tramos = tramos_odometro(_cargas([1000]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA"]
+
+
+def test_atipica_requiere_las_dos_vecinas():
+    tramos = tramos_odometro(_cargas([1000, 5000]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "SALTO"]
+
+
+@pytest.mark.parametrize("atipica", [104000, 1040])  # dígito de más / de menos
+def test_atipica_entre_dos_vecinas(atipica):
+    tramos = tramos_odometro(_cargas([10000, 10400, atipica, 10900]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "OK", "ATIPICA", "OK"]
+    assert tramos["KM_TRAMO"].iloc[3] == 500
+    assert np.isnan(tramos["KM_TRAMO"].iloc[2])
+
+
+def test_patentes_no_se_mezclan():
+    df = pd.concat([_cargas([1000, 1500]), _cargas([200, 100], patente="AA111BB")])
+    tramos = tramos_odometro(df)
+    por_patente = tramos.groupby("PATENTE", observed=True)["ESTADO_TRAMO"].apply(list)
+    assert por_patente["AA111BB"] == ["PRIMERA LECTURA", "REGRESION"]
+    assert por_patente["AB123CD"] == ["PRIMERA LECTURA", "OK"]
+
+
+def test_azul_32_no_cierra_tramos():
+    df = _cargas([1000, 1300, 1500])
+    df["PRODUCTO"] = ["D.DIESEL 500", "AZUL 32 BIDON 10 L", "D.DIESEL 500"]
+    tramos = tramos_odometro(df)
+    assert len(tramos) == 2
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "OK"]
+    # Los litros de AZUL 32 no se suman al tramo
+    assert tramos["KM_TRAMO"].iloc[1] == 500
+    assert tramos["LITROS_TRAMO"].iloc[1] == 100
+
+
+def test_tramo_corto_o_de_consumo_excesivo_es_inverosimil():
+    # 2 km con una carga entera; 300 km con 900 L (300 L/100km)
+    tramos = tramos_odometro(_cargas([1000, 1002, 1500, 1800], litros=[300.0, 300.0, 150.0, 900.0]))
+    assert list(tramos["ESTADO_TRAMO"]) == ["PRIMERA LECTURA", "INVEROSIMIL", "OK", "INVEROSIMIL"]
+    # Sólo el tramo OK entra en el resumen
+    resumen = resumen_odometro(tramos).iloc[0]
+    assert resumen["KM_ODOMETRO"] == 498
+    assert resumen["CONSUMO_ODOMETRO_L_100KM"] == pytest.approx(150 / 498 * 100)
+
+
+def _unidades(gps, tramos, consumo_odometro=35.0, litros=500.0):
+    return pd.DataFrame({
+        "PATENTE": [f"U{i}" for i in range(len(gps))],
+        "KM_RECORRIDOS": gps,
+        "LITROS_TOTALES": litros,
+        "CONSUMO_ODOMETRO_L_100KM": consumo_odometro,
+        "TRAMOS_ODOMETRO": tramos,
+    })
+
+
+def test_gps_contradicho_usa_el_odometro():
+    # 1.081.856 km de GPS en una semana contra 11 tramos de odómetro
+    df = conciliar_km(_unidades([1081856.0, 429.0], [11, 11]))
+    km_odometro = 500 * 100 / 35
+    assert list(df["CONFIANZA_KM"]) == ["BAJA", "BAJA"]
+    assert df["KM_RECORRIDOS"].tolist() == pytest.approx([km_odometro, km_odometro])
+    assert df["KM_GPS"].tolist() == [1081856.0, 429.0]
+
+
+def test_conciliacion_segun_las_fuentes():
+    km_odometro = 500 * 100 / 35
+    df = conciliar_km(_unidades([1400.0, 900.0, 0.0, 0.0], [5, 1, 5, 0]))
+    assert list(df["CONFIANZA_KM"]) == ["ALTA", "MEDIA", "ODOMETRO", "SIN KM"]
+    # ALTA y MEDIA conservan el GPS; sin ninguna fuente no se inventa distancia
+    assert df["KM_RECORRIDOS"].tolist() == pytest.approx([1400.0, 900.0, km_odometro, 0.0])
@@ -0,0 +1,79 @@
+# Recuperación de patentes mal tipeadas y diccionario persistente de
+# correcciones.
+
+import pandas as pd
+
+from consumo_engine.patentes import (
+    canonicalizar, corregir_patentes, es_patente_valida, leer_correcciones,
+    mascara_patentes, registrar_correcciones,
+)
+
+NOMINA = ["AB103CD", "ABC103", "OBC123", "AE418OT"]
+
+MUESTRA = [
+    "AB123CD", "ABC123", " ae418ot ", "AB 123 CD", "A8123CD", "ABCD123",
+    "AB123C", "AB123CDE", "", None,
+]
+
+
+def test_mascara_coincide_con_la_referencia():
+    esperado = [es_patente_valida(p) for p in MUESTRA]
+    assert esperado[:3] == [True] * 3 and not any(esperado[3:])
+    for dtype in ("object", "string", "category"):
+        s = pd.Series(MUESTRA, index=range(10, 20), dtype=dtype)
+        mascara = mascara_patentes(s)
+        assert list(mascara.index) == list(s.index)
+        assert mascara.tolist() == esperado
+
+
+def test_separadores_y_minusculas():
+    assert corregir_patentes(["AB 123 CD", "ae-418-ot"]) == {
+        "AB 123 CD": ("AB123CD", "formato"),
+        "ae-418-ot": ("AE418OT", "formato"),
+    }
+
+
+def test_o_cero_e_i_uno_segun_la_posicion():
+    # O donde va dígito, 0 donde va letra, I donde va dígito
+    correcciones = corregir_patentes(["AB1O3CD", "0BC123", "ABCI03"], conocidas=NOMINA)
+    assert correcciones == {
+        "AB1O3CD": ("AB103CD", "O/0 I/1"),
+        "0BC123": ("OBC123", "O/0 I/1"),
+        "ABCI03": ("ABC103", "O/0 I/1"),
+    }
+
+
+def test_confusion_fuera_de_la_nomina_no_se_corrige():
+    # El cruce sólo se acepta si la patente resultante existe
+    assert corregir_patentes(["AB1O3CD"], conocidas=["AB123CD"]) == {}
+
+
+def test_sin_recuperacion_posible():
+    # B/8 no es una confusión que se cruce; "O12ABC" no encaja en ningún
+    # formato aun cruzando O/0 e I/1
+    assert corregir_patentes(["A8123CD", "O12ABC"], conocidas=NOMINA + ["AB123CD"]) == {}
+
+
+def test_patente_valida_queda_igual():
+    s = pd.Series(["AE418OT", "AB 123 CD", "AE418OT"], dtype="category")
+    corregida, reporte = canonicalizar(s, conocidas=NOMINA, tabla="consumo")
+    assert list(corregida) == ["AE418OT", "AB123CD", "AE418OT"]
+    assert isinstance(corregida.dtype, pd.CategoricalDtype)
+    assert list(reporte["ORIGINAL"]) == ["AB 123 CD"]
+    assert reporte["FILAS"].tolist() == [1]
+
+
+def test_correcciones_persistentes(tmp_path):
+    ruta = str(tmp_path / "correcciones_patentes.json")
+    _, reporte = canonicalizar(pd.Series(["AB 123 CD", "AB1O3CD"]), conocidas=NOMINA)
+    assert registrar_correcciones(reporte, ruta) == 2
+    assert registrar_correcciones(reporte, ruta) == 0
+
+    guardadas = leer_correcciones(ruta)
+    assert guardadas["AB1O3CD"] == ("AB103CD", "O/0 I/1")
+
+    # Una corrección editada a mano manda sobre lo que se recalcularía
+    guardadas["AB 123 CD"] = ("AB103CD", "manual")
+    corregida, reporte = canonicalizar(pd.Series(["AB 123 CD"]), conocidas=NOMINA, guardadas=guardadas)
+    assert list(corregida) == ["AB103CD"]
+    assert list(reporte["MOTIVO"]) == ["manual"]
@@ -0,0 +1,34 @@
+# Período de las exportaciones GPS a partir del nombre del archivo.
+
+from datetime import date
+
+import pandas as pd
+
+from consumo_engine.periodos import periodo_desde_nombre
+
+DICIEMBRE_ENERO = (pd.Timestamp("2024-12-01 06:00"), pd.Timestamp("2025-01-03 18:00"))
+
+
+def test_anio_del_nombre():
+    assert periodo_desde_nombre("distances_26_11_2025_03_12_2025.xlsx") == (
+        date(2025, 11, 26), date(2025, 12, 3),
+    )
+
+
+def test_anio_desde_las_fechas_del_consumo(tmp_path):
+    # La fecha de modificación del archivo no interviene
+    ruta = tmp_path / "distances_26_12_02_01.xlsx"
+    ruta.touch()
+    assert periodo_desde_nombre(str(ruta), DICIEMBRE_ENERO) == (
+        date(2024, 12, 26), date(2025, 1, 2),
+    )
+    # El GPS se corta después del consumo: el año más cercano al rango
+    assert periodo_desde_nombre("distances_01-01 al 08-01.xlsx", DICIEMBRE_ENERO) == (
+        date(2025, 1, 1), date(2025, 1, 8),
+    )
+
+
+def test_sin_anio_ni_fechas():
+    assert periodo_desde_nombre("distances_26_11_03_12.xlsx") is None
+    assert periodo_desde_nombre("distances_26_11_03_12.xlsx", (pd.NaT, pd.NaT)) is None
+    assert periodo_desde_nombre("distancias_semana.xlsx", DICIEMBRE_ENERO) is None
@@ -0,0 +1,62 @@
+# Cargas que superan la capacidad del tanque, solas o sumadas en el día.
+
+import pandas as pd
+import pytest
+
+from consumo_engine.tanques import eventos_sobrecarga
+
+
+def _unidades():
+    # 400 L de tanque: con la tolerancia del 5 % el límite es 420 L
+    return pd.DataFrame({
+        "PATENTE": ["AB123CD", "AA111BB"],
+        "MODELO": ["VOLVO 370", "SIN DATO"],
+        "CAPACIDAD_TANQUE_L": [400.0, None],
+    })
+
+
+def _cargas():
+    return pd.DataFrame({
+        "PATENTE": ["AB123CD"] * 6 + ["AA111BB"],
+        "TARJETA": "7001",
+        "FECHA": pd.to_datetime([
+            "2025-11-26 08:00",  # sola por encima del límite
+            "2025-11-27 07:00", "2025-11-27 19:00",  # juntas lo superan
+            "2025-11-28 07:00", "2025-11-28 07:05",  # AZUL 32 no suma
+            "2025-11-29 10:00",  # bajo el límite
+            "2025-11-26 09:00",  # unidad sin capacidad cargada
+        ]),
+        "PRODUCTO": ["INFINIA DIESEL"] * 4 + ["AZUL 32", "INFINIA DIESEL", "INFINIA DIESEL"],
+        "LITROS": [500.0, 250.0, 250.0, 300.0, 200.0, 410.0, 900.0],
+    })
+
+
+def test_eventos_por_carga_y_por_dia():
+    eventos = eventos_sobrecarga(_cargas(), _unidades()).set_index("FECHA")
+
+    assert list(eventos.index) == list(pd.to_datetime(["2025-11-27 19:00", "2025-11-26 08:00"]))
+    assert (eventos["PATENTE"] == "AB123CD").all()
+    assert eventos["MODELO"].iloc[0] == "VOLVO 370"
+
+    sola = eventos.loc["2025-11-26 08:00"]
+    assert sola["TIPO_EVENTO"] == "CARGA SUPERA TANQUE"
+    assert sola["EXCESO_L"] == pytest.approx(100)
+
+    dia = eventos.loc["2025-11-27 19:00"]
+    assert dia["TIPO_EVENTO"] == "DIA SUPERA TANQUE"
+    assert dia["LITROS_DIA"] == pytest.approx(500)
+    assert dia["EXCESO_L"] == pytest.approx(100)
+
+
+def test_producto_que_no_va_al_tanque_se_ignora():
+    cargas = _cargas()
+    cargas.loc[4, "PRODUCTO"] = "INFINIA DIESEL"
+    eventos = eventos_sobrecarga(cargas, _unidades())
+    dia = eventos.loc[eventos["FECHA"] == pd.Timestamp("2025-11-28 07:05")]
+    assert list(dia["TIPO_EVENTO"]) == ["DIA SUPERA TANQUE"]
+    assert dia["EXCESO_L"].item() == pytest.approx(100)
+
+
+def test_sin_capacidades_no_hay_eventos():
+    unidades = _unidades().assign(CAPACIDAD_TANQUE_L=None)
+    assert eventos_sobrecarga(_cargas(), unidades).empty